@@ -0,0 +1,691 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end del bridge senza hardware
+
+Avvia il bridge come processo separato collegato a:
+- una radio finta su pty che emette linee "Received text msg" (sintetiche
+  o lette da un log registrato) al ritmo richiesto
+- un n8n finto con latenza configurabile che risponde con POST / al bridge
+- un CLI meshtastic finto (fake_meshtastic.py) che notifica gli invii
+
+Misura messaggi/secondo, latenza del giro completo (linea seriale → invio
+della risposta), thread e memoria del processo e stampa i risultati in JSON.
+
+Con --soak il carico dura il tempo indicato invece di --count messaggi: il
+bridge gira con MEMORY_DEBUG=true e a ogni campione si registrano RSS,
+thread, oggetti Python, memoria tracciata e dimensione della coda. Alla fine
+si calcola la crescita per ora (dopo il riscaldamento) e le righe del codice
+che sono cresciute di più, per scoprire le perdite prima del deploy.
+Con PROCESS_MODE=split (--env PROCESS_MODE=split) si campionano entrambi i
+processi: RSS e thread sono la somma di processo radio e worker, riportati
+anche separati; oggetti e memoria tracciata vengono dal worker, dove gira l'API.
+
+Uso:
+  python benchmarks/bench_bridge.py --rate 5 --count 200 --n8n-latency 0.2
+  python benchmarks/bench_bridge.py --runtime asyncio --env MESSAGE_DELAY=0
+  python benchmarks/bench_bridge.py --replay serial.log --output results.json
+  python benchmarks/bench_bridge.py --soak 6h --rate 2 --samples soak.jsonl --max-rss-growth 1
+
+Solo Linux/macOS (richiede pty).
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import pty
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+BRIDGE_SCRIPT = PROJECT_ROOT / "src" / "meshtastic_bridge.py"
+
+TEXT_PATTERN = re.compile(r'msg=(.+)$')
+REPLY_PREFIX = "R:"
+
+
+def percentile(values, pct):
+    """Percentile nearest-rank di una lista già ordinata"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def parse_duration(value):
+    """Durata in secondi da "90", "30s", "15m" o "6h"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = value.strip().lower()
+    try:
+        if value and value[-1] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"durata non valida: {value}")
+
+
+def slope_per_hour(points):
+    """Pendenza ai minimi quadrati di una serie (t, valore), in unità all'ora"""
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if variance == 0:
+        return None
+    covariance = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return covariance / variance * 3600
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TurnTracker:
+    """Associa ogni messaggio emesso alla risposta inviata dal bridge"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.latencies = []
+        self.emitted = 0
+        self.webhooks = 0
+        self.replies = 0
+        self.first_emit = None
+        self.last_reply = None
+        self.progress = threading.Event()
+
+    def emitted_text(self, text, timestamp):
+        with self.lock:
+            self.pending.setdefault(text, []).append(timestamp)
+            self.emitted += 1
+            if self.first_emit is None:
+                self.first_emit = timestamp
+
+    def webhook_received(self):
+        with self.lock:
+            self.webhooks += 1
+
+    def reply_sent(self, text, timestamp):
+        if not text.startswith(REPLY_PREFIX):
+            return
+        original = text[len(REPLY_PREFIX):]
+        with self.lock:
+            started = self.pending.get(original)
+            if not started:
+                return
+            emitted_at = started.pop(0)
+            if not started:
+                del self.pending[original]
+            self.latencies.append(timestamp - emitted_at)
+            self.replies += 1
+            self.last_reply = timestamp
+        self.progress.set()
+
+    def all_replied(self):
+        with self.lock:
+            return self.replies >= self.emitted
+
+
+class FakeN8N:
+    """Webhook n8n finto: attende la latenza configurata e risponde al bridge"""
+
+    def __init__(self, tracker, latency, jitter):
+        self.tracker = tracker
+        self.latency = latency
+        self.jitter = jitter
+        self.bridge_url = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/webhook/meshtastic"
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                fake.tracker.webhook_received()
+
+                delay = fake.latency + random.uniform(0, fake.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+                fake.post_reply(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def post_reply(self, payload):
+        """Invia la risposta al bridge come farebbe il workflow n8n"""
+        body = json.dumps({
+            "to": payload.get("from"),
+            "message": REPLY_PREFIX + payload.get("text", "")
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            self.bridge_url, data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).read()
+        except OSError as e:
+            print(f"⚠️ n8n finto: risposta al bridge fallita: {e}", file=sys.stderr)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SendCollector:
+    """Riceve le notifiche UDP del CLI finto"""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+
+    def start(self):
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while self.running:
+            try:
+                data, _ = self.sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            event = json.loads(data)
+            self.tracker.reply_sent(event["text"], event["t"])
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+
+class FakeRadio:
+    """Dispositivo seriale finto: il bridge apre il lato slave del pty"""
+
+    def __init__(self):
+        self.master_fd, self.slave_fd = pty.openpty()
+        self.port = os.ttyname(self.slave_fd)
+
+    def emit(self, line):
+        os.write(self.master_fd, (line + "\r\n").encode("utf-8"))
+
+    def close(self):
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class BridgeProcess:
+    """Processo del bridge sotto test"""
+
+    def __init__(self, env, log_path):
+        self.env = env
+        self.http_port = int(env["HTTP_PORT"])
+        self.split = env.get("PROCESS_MODE", "").strip().lower() == "split"
+        self.log_file = open(log_path, "w")
+        self.process = None
+        self.samples = []
+
+    def start(self, work_dir, ready_timeout=20):
+        self.process = subprocess.Popen(
+            [sys.executable, str(BRIDGE_SCRIPT)],
+            env=self.env, cwd=work_dir,
+            stdout=self.log_file, stderr=subprocess.STDOUT
+        )
+        deadline = time.time() + ready_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"il bridge è terminato all'avvio (codice {self.process.returncode})")
+            status = self.get_status()
+            if status and status.get("serial", {}).get("connected"):
+                return
+            time.sleep(0.2)
+        raise RuntimeError("il bridge non è pronto entro il tempo limite")
+
+    def get_status(self):
+        return self.request("/status")
+
+    def request(self, path, method="GET"):
+        """Chiamata all'API del bridge; None se non risponde"""
+        try:
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{self.http_port}{path}", method=method,
+                data=b"" if method == "POST" else None
+            )
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return json.loads(response.read())
+        except (OSError, ValueError):
+            return None
+
+    def worker_pid(self):
+        """PROCESS_MODE=split: pid del worker, dallo stato della radio remota
+        (cambia se il worker viene riavviato)"""
+        status = self.get_status() or {}
+        remote = status.get("serial", {}).get("remote") or {}
+        return (remote.get("ipc") or {}).get("worker_pid")
+
+    def sample(self, memory=False):
+        """Legge thread e RSS del processo da /proc (None se non disponibile);
+        con memory anche oggetti, memoria tracciata e coda dall'API del bridge"""
+        sample = dict(read_proc_status(self.process.pid), t=time.time())
+        if sample["rss_kb"] is None:
+            return None
+        if self.split:
+            pid = self.worker_pid()
+            worker = read_proc_status(pid) if pid else {"threads": None, "rss_kb": None}
+            sample["radio_rss_kb"], sample["radio_threads"] = sample["rss_kb"], sample["threads"]
+            sample["worker_rss_kb"], sample["worker_threads"] = worker["rss_kb"], worker["threads"]
+            if worker["rss_kb"] is not None:
+                sample["rss_kb"] += worker["rss_kb"]
+                sample["threads"] += worker["threads"]
+        if memory:
+            report = self.request("/debug/memory?limit=0") or {}
+            traced = report.get("tracemalloc") or {}
+            queue = self.request("/queue") or {}
+            sample["gc_objects"] = report.get("gc", {}).get("objects")
+            sample["traced_kb"] = traced.get("current_kb")
+            sample["queue_size"] = queue.get("queue_size")
+        self.samples.append(sample)
+        return sample
+
+    def stop(self, timeout=10):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log_file.close()
+
+
+def read_proc_status(pid):
+    """Thread e RSS (kB) di un processo da /proc; None se non disponibili"""
+    values = {"threads": None, "rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("Threads:"):
+                    values["threads"] = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    values["rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return values
+
+
+def synthetic_lines(count, senders):
+    """Linee di log firmware con testo univoco per ogni messaggio (count None = senza fine)"""
+    for seq in (range(count) if count is not None else itertools.count()):
+        node = 0xB0000000 + (seq % senders)
+        yield (f"INFO  | {datetime.now():%H:%M:%S} 123 [Router] Received text msg "
+               f"from=0x{node:08x}, id=0x{seq + 1:x}, msg=bench {seq}")
+
+
+def replay_lines(path, count):
+    """Linee da un log seriale registrato (ripetuto fino a count messaggi, None = senza fine)"""
+    with open(path, encoding="utf-8", errors="ignore") as log_file:
+        lines = [line.rstrip("\r\n") for line in log_file if line.strip()]
+    if not any("Received text msg" in line for line in lines):
+        raise ValueError(f"{path}: nessuna linea 'Received text msg'")
+    emitted = 0
+    while count is None or emitted < count:
+        for line in lines:
+            if "Received text msg" in line:
+                if count is not None and emitted >= count:
+                    return
+                emitted += 1
+            yield line
+
+
+def summarize(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(values[-1], 2),
+        "mean": round(sum(values) / len(values), 2)
+    }
+
+
+def build_env(args, radio, n8n, collector, bin_dir):
+    env = dict(os.environ)
+    env.update({
+        "SERIAL_PORT": radio.port,
+        "SERIAL_PORTS": "",
+        "WEBHOOK_URL": n8n.url,
+        "HTTP_PORT": str(free_port()),
+        "BRIDGE_RUNTIME": args.runtime,
+        "NODE_DB_PATH": "",
+        "RULES_FILE": "",
+        "RATE_LIMIT_ENABLED": "false",
+        "REPLY_CACHE_ENABLED": "false",
+        "ENABLE_DEBUG": "false",
+        "PYTHONUNBUFFERED": "1",
+        "PATH": str(bin_dir) + os.pathsep + os.environ.get("PATH", ""),
+        "BENCH_REPORT_PORT": str(collector.port),
+        "BENCH_CLI_DELAY": str(args.cli_delay),
+    })
+    if args.soak:
+        env.update({
+            "MEMORY_DEBUG": "true",
+            "MEMORY_TRACE_FRAMES": str(args.trace_frames),
+            "ADMIN_TOKEN": "",
+        })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def install_fake_cli(bin_dir):
+    """Crea l'eseguibile 'meshtastic' che punta al CLI finto"""
+    script = bin_dir / "meshtastic"
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCH_DIR / "fake_meshtastic.py"}" "$@"\n')
+    script.chmod(0o755)
+
+
+def run_benchmark(args):
+    tracker = TurnTracker()
+    radio = FakeRadio()
+    n8n = FakeN8N(tracker, args.n8n_latency, args.n8n_jitter)
+    collector = SendCollector(tracker)
+    soak = SoakMonitor(args, tracker) if args.soak else None
+
+    with tempfile.TemporaryDirectory(prefix="bridge-bench-") as work_dir:
+        work_dir = Path(work_dir)
+        bin_dir = work_dir / "bin"
+        bin_dir.mkdir()
+        install_fake_cli(bin_dir)
+
+        env = build_env(args, radio, n8n, collector, bin_dir)
+        n8n.bridge_url = f"http://127.0.0.1:{env['HTTP_PORT']}/"
+        bridge = BridgeProcess(env, args.bridge_log or work_dir / "bridge.log")
+
+        n8n.start()
+        collector.start()
+        stop_sampling = threading.Event()
+        try:
+            bridge.start(work_dir)
+            bridge.sample(memory=soak is not None)
+
+            def sampler():
+                while not stop_sampling.wait(args.sample_interval):
+                    sample = bridge.sample(memory=soak is not None)
+                    if soak and sample:
+                        soak.record(bridge, sample)
+            threading.Thread(target=sampler, daemon=True).start()
+
+            count = None if soak else args.count
+            if args.replay:
+                lines = replay_lines(args.replay, count)
+            else:
+                lines = synthetic_lines(count, args.senders)
+
+            # Carico a ritmo costante (open loop): i ritardi del bridge non rallentano l'invio
+            start = time.time()
+            soak_end = start + args.soak if soak else None
+            interval = 1.0 / args.rate if args.rate > 0 else 0
+            emitted = 0
+            try:
+                for line in lines:
+                    if soak_end and time.time() >= soak_end:
+                        break
+                    if "Received text msg" in line:
+                        target = start + emitted * interval
+                        delay = target - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                        match = TEXT_PATTERN.search(line)
+                        tracker.emitted_text(match.group(1).strip() if match else "", time.time())
+                        emitted += 1
+                    radio.emit(line)
+            except KeyboardInterrupt:
+                if not soak:
+                    raise
+                print("⏹️ Soak interrotto, attendo le ultime risposte...", file=sys.stderr)
+            emit_end = time.time()
+
+            # Attendi le risposte finché arrivano progressi
+            while not tracker.all_replied():
+                tracker.progress.clear()
+                if not tracker.progress.wait(args.drain_timeout):
+                    break
+            end = time.time()
+        finally:
+            stop_sampling.set()
+            final_status = bridge.get_status() if bridge.process else None
+            final_memory = bridge.request("/debug/memory?limit=10") if soak and bridge.process else None
+            bridge.stop()
+            n8n.stop()
+            collector.stop()
+            radio.close()
+            if soak:
+                soak.close()
+
+    samples = [s for s in bridge.samples if s]
+    threads = [s["threads"] for s in samples if s["threads"] is not None]
+    rss = [s["rss_kb"] for s in samples if s["rss_kb"] is not None]
+    reply_window = (tracker.last_reply or end) - (tracker.first_emit or start)
+
+    results = {
+        "benchmark": "bridge_soak" if soak else "bridge_e2e",
+        "timestamp": datetime.now().isoformat(),
+        "params": {
+            "runtime": args.runtime,
+            "rate": args.rate,
+            "count": None if soak else args.count,
+            "soak_s": args.soak,
+            "senders": args.senders,
+            "replay": args.replay,
+            "n8n_latency_s": args.n8n_latency,
+            "n8n_jitter_s": args.n8n_jitter,
+            "cli_delay_s": args.cli_delay,
+            "env": args.env
+        },
+        "messages": {
+            "emitted": tracker.emitted,
+            "webhooks": tracker.webhooks,
+            "replies_sent": tracker.replies,
+            "lost": tracker.emitted - tracker.replies
+        },
+        "duration_s": round(end - start, 3),
+        "emit_duration_s": round(emit_end - start, 3),
+        "throughput_msgs_per_s": round(tracker.replies / reply_window, 3) if reply_window > 0 else None,
+        "latency_ms": summarize([value * 1000 for value in tracker.latencies]),
+        "threads": {
+            "peak": max(threads) if threads else None,
+            "final": threads[-1] if threads else None
+        },
+        "rss_mb": {
+            "peak": round(max(rss) / 1024, 1) if rss else None,
+            "final": round(rss[-1] / 1024, 1) if rss else None
+        },
+        "bridge_queue": (final_status or {}).get("queue")
+    }
+    if soak:
+        results["soak"] = soak.summary(samples, final_memory)
+    return results
+
+
+class SoakMonitor:
+    """Soak test: riscaldamento, avanzamento periodico e crescita delle risorse"""
+
+    # Serie campionate: chiave del campione → (nome nel risultato, divisore)
+    SERIES = (
+        ("rss_kb", "rss_mb", 1024),
+        ("threads", "threads", 1),
+        # Solo con PROCESS_MODE=split
+        ("radio_rss_kb", "radio_rss_mb", 1024),
+        ("worker_rss_kb", "worker_rss_mb", 1024),
+        ("gc_objects", "gc_objects", 1),
+        ("traced_kb", "traced_mb", 1024),
+        ("queue_size", "queue_size", 1),
+    )
+
+    def __init__(self, args, tracker):
+        self.args = args
+        self.tracker = tracker
+        self.started = time.time()
+        self.warm = args.warmup <= 0
+        self.warm_at = self.started if self.warm else None
+        self.samples_file = open(args.samples, "a") if args.samples else None
+
+    def record(self, bridge, sample):
+        elapsed = sample["t"] - self.started
+        if not self.warm and elapsed >= self.args.warmup:
+            # Cache, pool e code sono a regime: la crescita si misura da qui
+            bridge.request("/debug/memory", method="POST")
+            self.warm = True
+            self.warm_at = sample["t"]
+        if self.samples_file:
+            self.samples_file.write(json.dumps(sample) + "\n")
+            self.samples_file.flush()
+        hours, rest = divmod(int(elapsed), 3600)
+        split = ""
+        if sample.get("worker_rss_kb") is not None:
+            split = (f" (radio {sample['radio_rss_kb'] / 1024:.1f}MB"
+                     f" + worker {sample['worker_rss_kb'] / 1024:.1f}MB)")
+        print(f"⏱️ {hours}h{rest // 60:02d}m  rss={(sample['rss_kb'] or 0) / 1024:.1f}MB{split}  "
+              f"thread={sample['threads']}  oggetti={sample.get('gc_objects')}  "
+              f"coda={sample.get('queue_size')}  risposte={self.tracker.replies}/{self.tracker.emitted}",
+              file=sys.stderr)
+
+    def summary(self, samples, final_memory):
+        steady = [s for s in samples if self.warm_at is not None and s["t"] >= self.warm_at]
+        result = {
+            "warmup_s": self.args.warmup,
+            "samples": len(steady),
+            "leak_suspected": None
+        }
+        for key, name, divisor in self.SERIES:
+            points = [(s["t"], s[key] / divisor) for s in steady if s.get(key) is not None]
+            if not points:
+                if not key.startswith(("radio_", "worker_")):
+                    result[name] = None
+                continue
+            values = [value for _, value in points]
+            slope = slope_per_hour(points)
+            result[name] = {
+                "start": round(values[0], 1),
+                "end": round(values[-1], 1),
+                "peak": round(max(values), 1),
+                "growth_per_hour": round(slope, 2) if slope is not None else None
+            }
+        growth = (result["rss_mb"] or {}).get("growth_per_hour")
+        if self.args.max_rss_growth is not None and growth is not None:
+            result["leak_suspected"] = growth > self.args.max_rss_growth
+        traced = (final_memory or {}).get("tracemalloc") or {}
+        result["top_growth"] = traced.get("growth", [])
+        result["threads_by_name"] = (final_memory or {}).get("threads_by_name")
+        return result
+
+    def close(self):
+        if self.samples_file:
+            self.samples_file.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end del bridge Meshtastic ↔ n8n")
+    parser.add_argument("--runtime", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--rate", type=float, default=2.0, help="messaggi al secondo emessi dalla radio")
+    parser.add_argument("--count", type=int, default=50, help="numero di messaggi")
+    parser.add_argument("--senders", type=int, default=10, help="nodi mittenti distinti (solo sintetico)")
+    parser.add_argument("--replay", help="log seriale registrato da riprodurre invece dei messaggi sintetici")
+    parser.add_argument("--n8n-latency", type=float, default=0.1, help="latenza del webhook finto in secondi")
+    parser.add_argument("--n8n-jitter", type=float, default=0.0, help="latenza casuale aggiuntiva in secondi")
+    parser.add_argument("--cli-delay", type=float, default=0.0, help="durata simulata di ogni invio del CLI")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="secondi senza nuove risposte dopo cui il test termina")
+    parser.add_argument("--sample-interval", type=float, default=None,
+                        help="intervallo campionamento thread/RSS (default 0.5s, 30s con --soak)")
+    parser.add_argument("--soak", type=parse_duration, default=None, metavar="DURATA",
+                        help="soak test: carico continuo per la durata indicata (es. 6h) invece di --count")
+    parser.add_argument("--warmup", type=parse_duration, default=parse_duration("5m"),
+                        help="con --soak: riscaldamento escluso dalla crescita (default 5m)")
+    parser.add_argument("--trace-frames", type=int, default=1,
+                        help="con --soak: frame tracemalloc nel bridge (0 = solo RSS e oggetti)")
+    parser.add_argument("--samples", help="con --soak: file JSONL dove aggiungere ogni campione")
+    parser.add_argument("--max-rss-growth", type=float, default=None, metavar="MB_ORA",
+                        help="con --soak: crescita RSS oltre cui il test fallisce (codice 3)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="variabile d'ambiente per il bridge (ripetibile)")
+    parser.add_argument("--bridge-log", help="file dove salvare l'output del bridge")
+    parser.add_argument("--output", help="file JSON dei risultati (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.count <= 0:
+        print("❌ --count deve essere positivo", file=sys.stderr)
+        return 2
+    if args.soak is not None and (args.soak <= 0 or args.rate <= 0):
+        print("❌ --soak richiede una durata e un --rate positivi", file=sys.stderr)
+        return 2
+    if args.sample_interval is None:
+        args.sample_interval = 30.0 if args.soak else 0.5
+
+    try:
+        results = run_benchmark(args)
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"❌ Benchmark fallito: {e}", file=sys.stderr)
+        return 1
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+        print(f"📊 Risultati salvati in {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    if results.get("soak", {}).get("leak_suspected"):
+        print(f"❌ RSS in crescita di {results['soak']['rss_mb']['growth_per_hour']} MB/ora "
+              f"(limite {args.max_rss_growth})", file=sys.stderr)
+        return 3
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
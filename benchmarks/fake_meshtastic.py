@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+CLI Meshtastic finto per i benchmark: accetta gli stessi argomenti usati
+dal bridge (--port/--host, --dest, --sendtext) e notifica ogni invio
+all'harness con un datagramma UDP invece di trasmettere via radio
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="meshtastic")
+    parser.add_argument("--port")
+    parser.add_argument("--host")
+    parser.add_argument("--dest")
+    parser.add_argument("--sendtext")
+    args, _ = parser.parse_known_args()
+
+    # Simula il tempo di connessione e trasmissione del CLI reale
+    delay = float(os.getenv("BENCH_CLI_DELAY", "0"))
+    if delay > 0:
+        time.sleep(delay)
+
+    report_port = os.getenv("BENCH_REPORT_PORT")
+    if report_port and args.sendtext is not None:
+        event = {"dest": args.dest, "text": args.sendtext, "t": time.time()}
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.sendto(json.dumps(event).encode("utf-8"), ("127.0.0.1", int(report_port)))
+        finally:
+            sock.close()
+
+    print(f"Sending text message {args.sendtext} to {args.dest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Runtime asyncio per Meshtastic ↔ n8n Bridge
+
+Lettura seriale, API HTTP, coda di invio e chiamate webhook girano
+come coroutine su un unico event loop: nessun thread per messaggio.
+"""
+
+import asyncio
+import signal
+import sys
+import time
+
+from config import Config
+from async_http import post_json, HTTPError
+from http_server import AsyncHTTPBridgeServer, BridgeAPI
+from meshtastic_bridge import MeshtasticBridge
+from webhook_dispatcher import AsyncWebhookDispatcher, load_webhook_targets
+from handoff import take_over, recover_pending, pending_path, LISTEN_TIMEOUT
+from bridge_logging import get_logger, setup_logging
+
+logger = get_logger("bridge")
+n8n_logger = get_logger("n8n")
+
+class AsyncMeshtasticBridge(MeshtasticBridge):
+    """Bridge Meshtastic ↔ n8n su un singolo event loop asyncio"""
+
+    def __init__(self):
+        # Prima di super().__init__, che crea il dispatcher dei webhook
+        self.pending_webhooks = set()
+        super().__init__()
+
+        self.loop = None
+        self.stop_event = None
+        self.webhook_semaphore = None
+        self.outbound_tasks = []
+
+        # Stato lettura seriale non bloccante, per radio
+        self._reader_fds = {}
+        self._read_buffers = {}
+
+        # Il file delle regole si rilegge da _rules_reload_loop, non a ogni messaggio
+        self.message_handler.rules.auto_reload = False
+
+    def _create_http_server(self):
+        return AsyncHTTPBridgeServer(self.config, BridgeAPI(self.config, self.message_handler))
+
+    def _create_webhooks(self):
+        return AsyncWebhookDispatcher(self.message_handler, self.pending_webhooks)
+
+    def start(self):
+        """Avvia il bridge e blocca fino all'arresto"""
+        logger.info("🚀 Avvio Meshtastic ↔ n8n Bridge (runtime asyncio)")
+        Config.display_config()
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("\n👋 Uscita richiesta dall'utente")
+
+    async def run(self):
+        """Coroutine principale: avvia i componenti e attende l'arresto"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.webhook_semaphore = asyncio.Semaphore(self.config.WEBHOOK_MAX_IN_FLIGHT)
+        self.webhooks.start()
+        self.running = True
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: resta KeyboardInterrupt
+        if hasattr(signal, 'SIGHUP'):
+            try:
+                self.loop.add_signal_handler(signal.SIGHUP, self._on_sighup)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        tasks = []
+        try:
+            # Subentro a un bridge in esecuzione: prima il socket HTTP, poi le radio
+            takeover = None
+            if self.takeover:
+                takeover = await self.loop.run_in_executor(None, take_over, self.config)
+            await self.http_server.start(takeover.listen_socket if takeover else None)
+            if takeover:
+                logger.info("⏳ Attesa del rilascio delle radio dal processo precedente...")
+                pending = await self.loop.run_in_executor(
+                    None, takeover.wait_release,
+                    self.config.DRAIN_TIMEOUT + self.config.CLI_TIMEOUT + LISTEN_TIMEOUT
+                )
+            else:
+                pending = recover_pending(pending_path(self.config))
+            self.message_handler.restore_pending(pending)
+
+            logger.info("👂 Avvio monitoraggio messaggi Meshtastic...")
+            tasks = [
+                asyncio.ensure_future(self._node_db_flush_loop()),
+                asyncio.ensure_future(self._rules_reload_loop())
+            ]
+            for serial_manager in self.serial_managers:
+                await self.loop.run_in_executor(None, serial_manager.connect)
+                tasks.append(asyncio.ensure_future(self._serial_loop(serial_manager)))
+                tasks.append(asyncio.ensure_future(self._supervisor_loop(serial_manager)))
+                self.outbound_tasks.append(asyncio.ensure_future(self._outbound_loop(serial_manager)))
+            tasks.extend(self.outbound_tasks)
+            self.handoff.start()
+            logger.info("✅ Bridge avviato! In ascolto per messaggi...")
+            logger.info("   Premi Ctrl+C per uscire")
+            logger.info("-" * 60)
+
+            await self.stop_event.wait()
+            if not self.handed_off:
+                logger.info("🛑 Arresto bridge...")
+                await self._drain()
+        except Exception as e:
+            logger.error("❌ Errore critico: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._shutdown()
+
+    async def _drain(self, handing_off=False):
+        """Come MeshtasticBridge.drain, senza bloccare il loop"""
+        started = self._begin_drain()
+        deadline = started + self.config.DRAIN_TIMEOUT
+        for remaining in self._drain_steps(handing_off):
+            while remaining() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        self._end_drain(started, handing_off)
+
+    def _on_takeover_request(self, request):
+        """Chiamata dal thread di handoff: il passaggio di consegne gira sul loop"""
+        asyncio.run_coroutine_threadsafe(self._hand_off(request), self.loop)
+
+    async def _hand_off(self, request):
+        fileno = self.http_server.fileno()
+        if self.stop_event.is_set() or self.stopping or fileno is None:
+            request.abort()
+            return
+        self.stopping = True
+        logger.info("🤝 Passaggio di consegne al processo %s...", request.pid)
+        try:
+            request.send_listen_socket(fileno)
+        except OSError as e:
+            # Il socket è ancora nostro: si continua a servire in attesa di un altro takeover
+            logger.error("❌ Invio del socket HTTP fallito, il bridge resta attivo: %s", e)
+            request.abort()
+            self.stopping = False
+            return
+        # Da qui le nuove connessioni vanno al nuovo processo
+        await self.http_server.stop()
+        await self._drain(handing_off=True)
+
+        # Coda ferma dopo il messaggio in corso; il resto passa al nuovo processo
+        self.message_handler.stop()
+        if self.outbound_tasks:
+            await asyncio.wait(self.outbound_tasks, timeout=self.config.CLI_TIMEOUT + 5)
+        pending = self.message_handler.take_pending()
+        self.running = False
+        for serial_manager in self.serial_managers:
+            self._remove_serial_reader(serial_manager)
+            serial_manager.disconnect()
+        if await self.loop.run_in_executor(None, request.release, pending):
+            logger.info("✅ Radio rilasciate, %s messaggi consegnati al nuovo processo", len(pending))
+        else:
+            logger.error("❌ Nuovo processo non raggiungibile durante il passaggio di consegne")
+        self.handed_off = True
+        self.stop_event.set()
+
+    async def _shutdown(self):
+        """Ferma tutti i componenti"""
+        self.message_handler.stop()
+        for serial_manager in self.serial_managers:
+            self._remove_serial_reader(serial_manager)
+
+        if self.pending_webhooks:
+            logger.info("⏳ Attesa di %s chiamate webhook in corso...", len(self.pending_webhooks))
+            await asyncio.wait(list(self.pending_webhooks), timeout=self.config.HTTP_TIMEOUT)
+        self.webhooks.stop()
+
+        for serial_manager in self.serial_managers:
+            serial_manager.disconnect()
+        await self.http_server.stop()
+        self.handoff.close()
+        await self.loop.run_in_executor(None, self.message_handler.node_db.stop)
+        logger.info("✅ Bridge arrestato")
+
+    def stop(self):
+        """Richiede l'arresto del bridge (thread-safe)"""
+        if self.loop and self.stop_event:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    # === Ricarica configurazione: lettura in un executor, applicazione sul loop ===
+
+    def reload_config(self):
+        """Da un thread dell'executor (SIGHUP o POST /admin/reload), mai dal loop:
+        .env letto e validato qui, impostazioni e componenti aggiornati sul loop"""
+        return self.reloader.reload(call=self._call_on_loop)
+
+    def _on_sighup(self):
+        self.loop.run_in_executor(None, self.reload_config)
+
+    def _call_on_loop(self, function, *args):
+        """Esegue function sul loop e ne attende il risultato (da un altro thread)"""
+        async def call():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    def reconfigure(self, component, changes):
+        if component == "rules":
+            # Rilettura del file regole fuori dal loop
+            self.loop.run_in_executor(None, self.message_handler.rules.configure, self.config)
+        else:
+            super().reconfigure(component, changes)
+
+    def _replace_webhooks(self):
+        asyncio.ensure_future(self._swap_webhooks())
+
+    async def _swap_webhooks(self):
+        targets = await self.loop.run_in_executor(None, load_webhook_targets, self.config)
+        retired = self.webhooks
+        self.message_handler.webhook_targets = targets
+        self.webhooks = self._create_webhooks()
+        self.webhooks.start()
+        self.webhook_semaphore = asyncio.Semaphore(self.config.WEBHOOK_MAX_IN_FLIGHT)
+        asyncio.ensure_future(self._retire_webhooks(retired))
+        logger.info("🔀 Webhook aggiornati: %s", ", ".join(t.name for t in self.message_handler.webhook_targets))
+
+    async def _retire_webhooks(self, dispatcher):
+        """Chiude i pool del dispatcher sostituito dopo le sue chiamate in corso"""
+        deadline = time.monotonic() + self.config.DRAIN_TIMEOUT
+        while dispatcher.busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        dispatcher.stop()
+
+    def _switch_radio(self, serial_manager, port):
+        # Il descrittore va tolto dal loop prima di chiudere la porta
+        self._remove_serial_reader(serial_manager)
+        serial_manager.switch_port(port)
+
+    def _restart_http(self, previous_port):
+        asyncio.ensure_future(self._rebind_http(previous_port))
+
+    async def _rebind_http(self, previous_port):
+        try:
+            await self.http_server.rebind()
+        except OSError as e:
+            logger.error("❌ Porta HTTP %s non disponibile (%s): resta %s", self.config.HTTP_PORT, e, previous_port)
+            Config.apply({"HTTP_PORT": previous_port})
+
+    # === Lettura seriale ===
+
+    async def _serial_loop(self, serial_manager):
+        """Legge una radio: add_reader sul file descriptor se disponibile,
+        altrimenti read_line bloccante in un executor dedicato"""
+        from concurrent.futures import ThreadPoolExecutor
+        fallback_executor = None
+        name = serial_manager.name
+
+        while self.running:
+            if not serial_manager.is_connected():
+                await asyncio.sleep(0.5)  # Riconnessione gestita da _supervisor_loop
+                continue
+            if name not in self._reader_fds and self._add_serial_reader(serial_manager):
+                await asyncio.sleep(1)
+                continue
+            if name in self._reader_fds:
+                await asyncio.sleep(1)
+                # Senza traffico read_available non viene chiamata: heartbeat da qui (tcp://)
+                await self.loop.run_in_executor(None, serial_manager.keepalive)
+                continue
+
+            # Nessun file descriptor (es. Windows): un solo thread di lettura
+            if fallback_executor is None:
+                fallback_executor = ThreadPoolExecutor(max_workers=1)
+            line = await self.loop.run_in_executor(fallback_executor, serial_manager.read_line)
+            if line:
+                self._safe_process_line(line, name)
+
+        if fallback_executor is not None:
+            fallback_executor.shutdown(wait=False)
+
+    def _add_serial_reader(self, serial_manager):
+        """Registra la porta seriale sul loop. Ritorna True se registrata"""
+        fd = serial_manager.fileno()
+        if fd is None:
+            return False
+        try:
+            self.loop.add_reader(fd, self._on_serial_readable, serial_manager)
+        except (NotImplementedError, ValueError, OSError):
+            return False
+        self._reader_fds[serial_manager.name] = fd
+        self._read_buffers[serial_manager.name] = b""
+        return True
+
+    def _remove_serial_reader(self, serial_manager):
+        fd = self._reader_fds.pop(serial_manager.name, None)
+        if fd is not None:
+            try:
+                self.loop.remove_reader(fd)
+            except (ValueError, OSError):
+                pass
+
+    def _on_serial_readable(self, serial_manager):
+        """Callback del loop: legge i byte disponibili e processa le linee complete"""
+        data = serial_manager.read_available()
+        if not data:
+            # Errore o porta chiusa: il loop seriale riprova tra poco
+            self._remove_serial_reader(serial_manager)
+            return
+
+        name = serial_manager.name
+        buffer = self._read_buffers.get(name, b"") + data
+        while b"\n" in buffer:
+            raw_line, buffer = buffer.split(b"\n", 1)
+            line = serial_manager.decode_line(raw_line)
+            if line:
+                self._safe_process_line(line, name)
+        self._read_buffers[name] = buffer
+
+    def _safe_process_line(self, line, gateway):
+        try:
+            self._process_line(line, gateway)
+        except Exception as e:
+            logger.error("❌ Errore nel loop principale: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
+
+    # === Webhook n8n ===
+
+    def _handle_incoming_message(self, message_data):
+        """Gestisce messaggio Meshtastic ricevuto"""
+        logger.info("💬 [%s] Da: %s (via %s)", message_data['timestamp'], message_data['from'], message_data.get('gateway'))
+        logger.info("📝 Messaggio: %s", message_data['text'])
+
+        # Regole locali (comandi, scarti, webhook dedicati)
+        webhook_url = self.message_handler.route_message(message_data)
+        if webhook_url is not None:
+            self.webhooks.dispatch(message_data, webhook_url)
+        else:
+            self.message_handler.tracer.finish(message_data, 'local')
+
+        logger.info("-" * 60)
+
+    def _send_alert(self, alert):
+        """Invia un allarme di telemetria a n8n senza bloccare il loop"""
+        task = asyncio.ensure_future(self._post_alert(alert))
+        self.pending_webhooks.add(task)
+        task.add_done_callback(self.pending_webhooks.discard)
+
+    async def _post_alert(self, alert):
+        try:
+            async with self.webhook_semaphore:
+                status_code, _ = await post_json(
+                    self.message_handler.alert_webhook_url, alert, self.config.HTTP_TIMEOUT
+                )
+        except (asyncio.TimeoutError, OSError, HTTPError) as e:
+            n8n_logger.error("❌ Errore invio allarme a n8n: %s", e)
+            self.message_handler.telemetry.alert_failed(alert)
+            return
+        self.message_handler.report_alert_result(alert, status_code)
+
+    # === Coda di invio ===
+
+    async def _outbound_loop(self, serial_manager):
+        """Processa periodicamente la coda dei messaggi da inviare di una radio"""
+        gateway = serial_manager.name
+        link_up = self.message_handler.link_up[gateway]
+        logger.info("📦 Sistema coda messaggi avviato (%s)", gateway)
+        while self.running and not self.message_handler.stop_event.is_set():
+            try:
+                # Radio non connessa: i messaggi restano in coda
+                if not link_up.is_set():
+                    await asyncio.sleep(self.config.QUEUE_PROCESS_INTERVAL)
+                    continue
+                messages_to_send = self.message_handler.drain_queue(gateway)
+                if messages_to_send:
+                    logger.info("📦 Elaborazione %s messaggi dalla coda (%s)...", len(messages_to_send), gateway)
+                    self.message_handler.sending[gateway] = len(messages_to_send)
+                    try:
+                        await self._send_queued_messages(messages_to_send, serial_manager)
+                    finally:
+                        self.message_handler.sending[gateway] = 0
+                await asyncio.sleep(self.config.QUEUE_PROCESS_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Errore nel processamento coda: %s", e)
+                await asyncio.sleep(5)
+
+    async def _send_queued_messages(self, messages, serial_manager):
+        """Invia i messaggi: diretto se il transport lo supporta, altrimenti
+        con il CLI Meshtastic come sottoprocessi asincroni"""
+        gateway = serial_manager.name
+        if serial_manager.supports_direct_send():
+            for index, msg in enumerate(messages):
+                if self.message_handler.stop_requested(messages, index, gateway):
+                    return
+                # In un executor: l'invio può attendere l'esito (es. ipc:// dal processo radio)
+                success = await self.loop.run_in_executor(
+                    None, serial_manager.send_text, msg['to'], msg['message']
+                )
+                self.message_handler.report_send_result(msg, success)
+                await asyncio.sleep(self.message_handler.pacer.next_delay(serial_manager.name))
+            return
+
+        # Il CLI usa la stessa porta: sospendi la lettura durante l'invio
+        cli_args = serial_manager.cli_args()
+        self._remove_serial_reader(serial_manager)
+        await self.loop.run_in_executor(None, serial_manager.disconnect_for_cli)
+        try:
+            for index, msg in enumerate(messages):
+                if self.message_handler.stop_requested(messages, index, gateway):
+                    break
+                success = await self._send_message_via_cli(msg['to'], msg['message'], cli_args)
+                self.message_handler.report_send_result(msg, success)
+                if index + 1 < len(messages):
+                    await asyncio.sleep(self.message_handler.pacer.cli_delay(gateway))
+            await asyncio.sleep(1)  # Pausa di sicurezza
+        finally:
+            await self.loop.run_in_executor(None, serial_manager.reconnect_after_cli)
+            self._add_serial_reader(serial_manager)
+
+    async def _send_message_via_cli(self, to_node, message, cli_args=None):
+        """Invia singolo messaggio tramite CLI Meshtastic"""
+        cmd = self.message_handler.build_cli_command(to_node, message, cli_args)
+        logger.debug("🚀 Comando CLI: %s", ' '.join(cmd))
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            logger.error("❌ CLI non trovato: Assicurati che 'meshtastic' sia installato")
+            return False
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.config.CLI_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.warning("⏰ CLI timeout (%ss)", self.config.CLI_TIMEOUT)
+            return False
+
+        if process.returncode == 0:
+            logger.debug("📤 CLI output: %s", stdout.decode('utf-8', errors='replace'))
+            return True
+        logger.error("❌ CLI errore: %s", stderr.decode('utf-8', errors='replace'))
+        return False
+
+    # === Manutenzione ===
+
+    async def _supervisor_loop(self, serial_manager):
+        """Riconnette la radio con backoff; l'apertura della porta gira in un executor"""
+        supervisor = serial_manager.supervisor
+        while self.running:
+            if not supervisor.needs_reconnect():
+                await asyncio.sleep(0.5)
+                continue
+            self._remove_serial_reader(serial_manager)
+            await asyncio.sleep(supervisor.next_delay())
+            if await self.loop.run_in_executor(None, supervisor.reconnect_once):
+                self._add_serial_reader(serial_manager)
+
+    async def _node_db_flush_loop(self):
+        """Scrive periodicamente su disco le modifiche del database nodi"""
+        node_db = self.message_handler.node_db
+        if not node_db.path:
+            return
+        while self.running:
+            await asyncio.sleep(node_db.flush_interval)
+            await self.loop.run_in_executor(None, node_db.flush)
+
+    async def _rules_reload_loop(self):
+        """Controlla periodicamente il file delle regole (stat e lettura in un executor)"""
+        rules = self.message_handler.rules
+        while self.running:
+            await asyncio.sleep(rules.reload_interval)
+            if rules.path:
+                await self.loop.run_in_executor(None, rules.reload)
+
+def main():
+    """Funzione principale"""
+    setup_logging(Config)
+    logger.info("📡 Meshtastic ↔ n8n Bridge v1.0 (asyncio)")
+    logger.info("=" * 40)
+
+    bridge = AsyncMeshtasticBridge()
+    bridge.takeover = '--takeover' in sys.argv[1:]
+    bridge.start()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Client HTTP minimale basato su asyncio per le chiamate webhook
+del runtime asincrono (nessun thread per richiesta)
+"""
+
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+
+MAX_RESPONSE_SIZE = 1024 * 1024
+
+
+class HTTPError(Exception):
+    """Risposta HTTP non valida"""
+
+
+async def post_json(url, payload, timeout):
+    """Invia payload JSON in POST e ritorna (status_code, testo_risposta)"""
+    return await asyncio.wait_for(_post_json(url, payload), timeout)
+
+
+def _parse_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise HTTPError(f"schema non supportato: {parts.scheme}")
+    use_ssl = parts.scheme == 'https'
+    port = parts.port or (443 if use_ssl else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    return (parts.hostname, port, use_ssl), path, host_header
+
+
+def _build_request(path, host_header, payload, keep_alive):
+    body = json.dumps(payload).encode('utf-8')
+    return (
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: {host_header}\r\n"
+        "User-Agent: meshtastic-n8n-bridge\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode('latin-1') + body
+
+
+async def _open(key):
+    host, port, use_ssl = key
+    ssl_context = ssl.create_default_context() if use_ssl else None
+    return await asyncio.open_connection(host, port, ssl=ssl_context)
+
+
+async def _post_json(url, payload):
+    key, path, host_header = _parse_url(url)
+    reader, writer = await _open(key)
+    try:
+        writer.write(_build_request(path, host_header, payload, keep_alive=False))
+        await writer.drain()
+        status_code, response_body, _ = await _read_response(reader)
+        return status_code, response_body
+    finally:
+        writer.close()
+
+
+class ConnectionPool:
+    """Connessioni HTTP/1.1 keep-alive riutilizzate tra le richieste"""
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max(1, max_idle)
+        self.idle = {}
+        self.opened = 0
+
+    async def post_json(self, url, payload, timeout):
+        """Come post_json, ma riusa una connessione già aperta se disponibile"""
+        return await asyncio.wait_for(self._post_json(url, payload), timeout)
+
+    async def _post_json(self, url, payload):
+        key, path, host_header = _parse_url(url)
+        request = _build_request(path, host_header, payload, keep_alive=True)
+        while True:
+            connections = self.idle.get(key)
+            reused = bool(connections)
+            if reused:
+                reader, writer = connections.pop()
+            else:
+                reader, writer = await _open(key)
+                self.opened += 1
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_code, response_body, reusable = await _read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+                writer.close()
+                if reused:
+                    continue  # Connessione chiusa dal server mentre era inattiva: riprova
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if reusable and len(self.idle.setdefault(key, [])) < self.max_idle:
+                self.idle[key].append((reader, writer))
+            else:
+                writer.close()
+            return status_code, response_body
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+async def _read_head(reader):
+    """Status line e header di una risposta"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise HTTPError("connessione chiusa dal server")
+    try:
+        version, status, _ = (status_line.split(None, 2) + [b''])[:3]
+        status_code = int(status)
+    except ValueError:
+        raise HTTPError(f"status line non valida: {status_line!r}")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return version, status_code, headers
+
+
+async def _read_response(reader, method='POST'):
+    """Legge status, header e body. Ritorna (status, testo, connessione_riusabile)"""
+    version, status_code, headers = await _read_head(reader)
+    # Risposte intermedie (100 Continue): segue quella vera
+    while 100 <= status_code < 200 and status_code != 101:
+        version, status_code, headers = await _read_head(reader)
+
+    connection = headers.get('connection', '').lower()
+    closing = connection == 'close' or (version == b'HTTP/1.0' and connection != 'keep-alive')
+    reusable = not closing
+    if method == 'HEAD' or status_code in (101, 204, 304):
+        response_body = b''
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        response_body = await _read_chunked(reader)
+    elif 'content-length' in headers:
+        try:
+            declared = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(f"Content-Length non valido: {headers['content-length']!r}")
+        response_body = await reader.readexactly(min(declared, MAX_RESPONSE_SIZE))
+        reusable = reusable and declared <= MAX_RESPONSE_SIZE
+    elif closing:
+        # Body delimitato dalla chiusura della connessione
+        response_body = await reader.read(MAX_RESPONSE_SIZE)
+    else:
+        # Keep-alive senza lunghezza: nessun body leggibile senza attendere il
+        # timeout, e la connessione non torna nel pool
+        response_body = b''
+        reusable = False
+
+    return status_code, response_body.decode('utf-8', errors='replace'), reusable
+
+
+async def _read_chunked(reader):
+    """Legge un body con Transfer-Encoding: chunked"""
+    chunks = []
+    total = 0
+    while True:
+        size_line = await reader.readline()
+        try:
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+        except ValueError:
+            raise HTTPError(f"chunk non valido: {size_line!r}")
+        if size == 0:
+            await reader.readline()
+            break
+        chunk = await reader.readexactly(size)
+        await reader.readline()
+        total += size
+        if total <= MAX_RESPONSE_SIZE:
+            chunks.append(chunk)
+    return b''.join(chunks)
@@ -0,0 +1,195 @@
+"""
+Logging del bridge: i record passano da una coda a un thread dedicato
+(QueueHandler/QueueListener), così le scritture su console o journald non
+bloccano la lettura seriale né le richieste HTTP.
+
+- LOG_LEVEL (o ENABLE_DEBUG=true) sceglie il livello
+- LOG_FORMAT=text (default, come la console) o json (una riga JSON per record)
+- LOG_SAMPLE_RATES="serial=0.01,http.payload=0.1" tiene solo una frazione dei
+  record DEBUG/INFO delle categorie indicate (WARNING e superiori passano sempre)
+
+I moduli usano get_logger("categoria") e passano gli argomenti separati dal
+messaggio (logger.info("... %s", valore)): la stringa è costruita solo se il
+record viene davvero scritto, e comunque nel thread del listener.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime
+
+ROOT_LOGGER = "bridge"
+QUEUE_SIZE = 10000
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+def get_logger(category):
+    """Logger di una categoria (es. "serial", "http", "n8n")"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+class JSONFormatter(logging.Formatter):
+    """Una riga JSON per record, con eventuali campi passati in extra={"fields": {...}}"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "category": record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Tiene un record ogni 1/rate per le categorie configurate (solo DEBUG/INFO)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.dropped = 0
+        self.set_rates(rates)
+
+    def set_rates(self, rates):
+        # Prefisso più lungo per primo: "http.payload" prevale su "http"
+        self.rates = sorted(
+            ((f"{ROOT_LOGGER}.{category}", rate) for category, rate in rates.items()),
+            key=lambda item: -len(item[0])
+        )
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if rate >= 1:
+                    return True
+                if rate <= 0:
+                    self.dropped += 1
+                    return False
+                count = self.counters.get(prefix, 0) + 1
+                self.counters[prefix] = count
+                if count * rate >= 1:
+                    self.counters[prefix] = 0
+                    return True
+                self.dropped += 1
+                return False
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler con coda limitata: se il listener non tiene il passo i
+    record in eccesso vengono scartati invece di bloccare il chiamante"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Stesso processo: la formattazione avviene nel thread del listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value):
+    """ "serial=0.01,http.payload=0.1" → {"serial": 0.01, "http.payload": 0.1}"""
+    rates = {}
+    for item in (value or "").split(","):
+        category, separator, rate = item.partition("=")
+        if not separator:
+            continue
+        try:
+            rates[category.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _level(config):
+    level_name = "DEBUG" if config.ENABLE_DEBUG else str(config.LOG_LEVEL).upper()
+    return getattr(logging, level_name, logging.INFO)
+
+
+def _formatter(config):
+    if config.LOG_FORMAT == "json":
+        return JSONFormatter()
+    return logging.Formatter("%(message)s")
+
+
+def setup_logging(config):
+    """Configura il logging del bridge (chiamate successive non hanno effetto)"""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(_formatter(config))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        if _queue_handler is not None:
+            root.removeHandler(_queue_handler)
+        _queue_handler = BoundedQueueHandler(queue.Queue(QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter(parse_sample_rates(config.LOG_SAMPLE_RATES)))
+
+        root.setLevel(_level(config))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, output)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def reconfigure(config):
+    """Applica livello, formato e campionamento senza fermare il listener"""
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger(ROOT_LOGGER).setLevel(_level(config))
+        for handler in _listener.handlers:
+            handler.setFormatter(_formatter(config))
+        for log_filter in _queue_handler.filters:
+            if isinstance(log_filter, SamplingFilter):
+                log_filter.set_rates(parse_sample_rates(config.LOG_SAMPLE_RATES))
+
+
+def shutdown_logging():
+    """Scrive i record ancora in coda e ferma il listener"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_status():
+    """Record scartati per coda piena o campionamento"""
+    if _queue_handler is None:
+        return {"configured": False}
+    sampled = sum(f.dropped for f in _queue_handler.filters if isinstance(f, SamplingFilter))
+    return {
+        "configured": True,
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "queue_size": _queue_handler.queue.qsize(),
+        "dropped_queue_full": _queue_handler.dropped,
+        "dropped_sampling": sampled
+    }
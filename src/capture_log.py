@@ -0,0 +1,296 @@
+"""
+Capture Log: registrazione compatta del traffico ricevuto dal dispositivo
+e riproduzione (tempo reale, N× o massima velocità)
+
+Formato di un segmento (.mcap), append-only:
+    header  "<8sdd"  magic, ora di inizio (epoch), monotonic di inizio
+    record  "<QH"    nanosecondi dall'inizio del segmento, lunghezza
+            seguiti dai byte ricevuti
+
+Accanto a ogni segmento un indice (.idx) con una voce "<QQ"
+(nanosecondi, offset nel file) circa ogni secondo di traffico, per
+saltare a un istante senza scorrere tutto il file.
+
+Uso da riga di comando:
+    python src/capture_log.py info captures/
+    python src/capture_log.py dump captures/radio0-20250101-120000-000.mcap
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+from bridge_logging import get_logger
+
+logger = get_logger("capture")
+
+MAGIC = b"MSHCAP01"
+HEADER = struct.Struct("<8sdd")
+RECORD = struct.Struct("<QH")
+INDEX_ENTRY = struct.Struct("<QQ")
+INDEX_INTERVAL_NS = 1_000_000_000
+MAX_CHUNK = 0xFFFF
+EXTENSION = ".mcap"
+
+
+class CaptureError(ValueError):
+    """File di cattura non valido"""
+
+
+class CaptureWriter:
+    """Scrive i byte ricevuti in segmenti con rotazione per dimensione"""
+
+    def __init__(self, directory, prefix="radio0", max_bytes=16 * 1024 * 1024, max_files=10):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max(max_bytes, 4096)
+        self.max_files = max(max_files, 1)
+        self.lock = threading.Lock()
+
+        self.file = None
+        self.index_file = None
+        self.path = None
+        self.size = 0
+        self.start_monotonic = 0
+        self.next_index_ns = 0
+        self.segment_seq = 0
+        self.records = 0
+        self.bytes_written = 0
+        self.last_flush = 0.0
+
+    def write(self, data, timestamp=None):
+        """Aggiunge un record (timestamp: time.monotonic(), default adesso)"""
+        if not data:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.lock:
+            try:
+                for start in range(0, len(data), MAX_CHUNK):
+                    self._write_record(data[start:start + MAX_CHUNK], timestamp)
+                # Rende visibili i dati a chi legge la cattura mentre è in corso
+                if timestamp - self.last_flush >= 1.0:
+                    self.file.flush()
+                    self.index_file.flush()
+                    self.last_flush = timestamp
+            except OSError as e:
+                logger.error("❌ Errore scrittura cattura %s: %s", self.path, e)
+
+    def _write_record(self, chunk, timestamp):
+        if self.file is None or self.size + RECORD.size + len(chunk) > self.max_bytes:
+            self._rotate()
+
+        offset_ns = max(0, int((timestamp - self.start_monotonic) * 1e9))
+        if offset_ns >= self.next_index_ns:
+            self.index_file.write(INDEX_ENTRY.pack(offset_ns, self.size))
+            self.next_index_ns = offset_ns + INDEX_INTERVAL_NS
+
+        self.file.write(RECORD.pack(offset_ns, len(chunk)))
+        self.file.write(chunk)
+        self.size += RECORD.size + len(chunk)
+        self.records += 1
+        self.bytes_written += len(chunk)
+
+    def _rotate(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self.segment_seq:03d}{EXTENSION}")
+        self.segment_seq += 1
+        self.start_monotonic = time.monotonic()
+        self.next_index_ns = 0
+
+        self.file = open(self.path, "wb")
+        self.index_file = open(self.path[:-len(EXTENSION)] + ".idx", "wb")
+        self.file.write(HEADER.pack(MAGIC, time.time(), self.start_monotonic))
+        self.size = HEADER.size
+        self._prune()
+
+    def _prune(self):
+        """Elimina i segmenti più vecchi oltre max_files"""
+        segments = list_segments(self.directory, self.prefix)
+        for path in segments[:-self.max_files]:
+            for victim in (path, path[:-len(EXTENSION)] + ".idx"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+
+    def _close_segment(self):
+        for handle in (self.file, self.index_file):
+            if handle is not None:
+                handle.close()
+        self.file = None
+        self.index_file = None
+
+    def flush(self):
+        with self.lock:
+            for handle in (self.file, self.index_file):
+                if handle is not None:
+                    handle.flush()
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+
+    def get_status(self):
+        return {
+            "path": self.path,
+            "records": self.records,
+            "bytes": self.bytes_written,
+            "segment_size": self.size
+        }
+
+
+class CaptureReader:
+    """Legge un segmento tramite mmap, senza caricarlo in memoria"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise CaptureError(f"{path}: file vuoto")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise CaptureError(f"{path}: header incompleto")
+        magic, self.start_time, self.start_monotonic = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise CaptureError(f"{path}: formato non riconosciuto")
+        self.index = self._load_index()
+
+    def _load_index(self):
+        index_path = self.path[:-len(EXTENSION)] + ".idx" if self.path.endswith(EXTENSION) else None
+        entries = []
+        if index_path and os.path.exists(index_path):
+            with open(index_path, "rb") as index_file:
+                data = index_file.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            entries = [entry for entry in INDEX_ENTRY.iter_unpack(data[:usable])]
+        return entries
+
+    def records(self, start_seconds=0.0):
+        """Itera (secondi dall'inizio, bytes); ignora un record finale troncato"""
+        data = self._map
+        position = HEADER.size
+        if start_seconds > 0 and self.index:
+            target_ns = int(start_seconds * 1e9)
+            slot = bisect.bisect_right([entry[0] for entry in self.index], target_ns) - 1
+            if slot >= 0:
+                position = self.index[slot][1]
+
+        end = len(data)
+        start_ns = int(start_seconds * 1e9)
+        while position + RECORD.size <= end:
+            offset_ns, length = RECORD.unpack_from(data, position)
+            position += RECORD.size
+            if position + length > end:
+                break
+            if offset_ns >= start_ns:
+                yield offset_ns / 1e9, data[position:position + length]
+            position += length
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def list_segments(directory, prefix=None):
+    """Segmenti di una directory in ordine cronologico"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in names
+        if name.endswith(EXTENSION) and (prefix is None or name.startswith(prefix + "-"))
+    )
+
+
+def iter_capture(path, start_seconds=0.0):
+    """Itera (ora epoch, bytes) su un file o su tutti i segmenti di una directory"""
+    paths = list_segments(path) if os.path.isdir(path) else [path]
+    if not paths:
+        raise CaptureError(f"{path}: nessun segmento di cattura")
+    first_start = None
+    for segment_path in paths:
+        reader = CaptureReader(segment_path)
+        try:
+            if first_start is None:
+                first_start = reader.start_time
+            skip = max(0.0, start_seconds - (reader.start_time - first_start))
+            for offset, data in reader.records(skip):
+                yield reader.start_time + offset, data
+        finally:
+            reader.close()
+
+
+def replay(path, sink, speed=1.0, stop_event=None, start_seconds=0.0):
+    """Ripete la cattura chiamando sink(bytes) con i tempi originali divisi per
+    speed (speed <= 0: massima velocità). Ritorna il numero di record"""
+    count = 0
+    origin = None
+    started = time.monotonic()
+    for timestamp, data in iter_capture(path, start_seconds):
+        if stop_event is not None and stop_event.is_set():
+            break
+        if speed > 0:
+            if origin is None:
+                origin = timestamp
+            delay = (timestamp - origin) / speed - (time.monotonic() - started)
+            if delay > 0:
+                if stop_event is not None:
+                    if stop_event.wait(delay):
+                        break
+                else:
+                    time.sleep(delay)
+        sink(bytes(data))
+        count += 1
+    return count
+
+
+def _cli(argv):
+    if len(argv) < 2 or argv[0] not in ("info", "dump"):
+        print("Uso: capture_log.py info|dump <file.mcap|directory>")
+        return 2
+    command, path = argv[0], argv[1]
+    try:
+        if command == "dump":
+            for timestamp, data in iter_capture(path):
+                text = bytes(data).decode("utf-8", errors="replace").rstrip("\r\n")
+                print(f"{datetime.fromtimestamp(timestamp):%H:%M:%S.%f} {text}")
+            return 0
+
+        paths = list_segments(path) if os.path.isdir(path) else [path]
+        for segment_path in paths:
+            reader = CaptureReader(segment_path)
+            try:
+                records = 0
+                size = 0
+                last = 0.0
+                for last, data in reader.records():
+                    records += 1
+                    size += len(data)
+            finally:
+                reader.close()
+            print(f"📼 {segment_path}: {records} record, {size} byte, "
+                  f"{last:.1f}s dal {datetime.fromtimestamp(reader.start_time):%Y-%m-%d %H:%M:%S}")
+        return 0
+    except (CaptureError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(_cli(sys.argv[1:]))
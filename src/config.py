@@ -2,10 +2,20 @@
 Configurazione per Meshtastic-n8n Bridge
 """
 import os
-from dotenv import load_dotenv
+import threading
+from dotenv import load_dotenv, dotenv_values, find_dotenv
+
+from bridge_logging import get_logger
+
+logger = get_logger("config")
+
+# Variabili del processo: hanno la precedenza su .env anche dopo un reload
+_PROCESS_ENV = dict(os.environ)
 
 # Carica variabili d'ambiente da .env se presente
 load_dotenv()
+_dotenv_keys = set(os.environ) - set(_PROCESS_ENV)
+_reload_lock = threading.Lock()
 
 # Configurazione di default
 DEFAULT_WEBHOOK_URL = "http://localhost:5678/webhook/meshtastic"
@@ -13,37 +23,284 @@ DEFAULT_HTTP_PORT = 8888
 DEFAULT_SERIAL_PORT = "COM3"  # Windows default, su Linux sarà /dev/ttyUSB0
 DEFAULT_BAUDRATE = 115200
 
+class _Settings(type):
+    """Le impostazioni (nomi maiuscoli) stanno in un solo dizionario, sostituito
+    in blocco: una ricarica cambia tutti i valori con un'unica assegnazione"""
+    
+    def __new__(mcs, name, bases, namespace, settings=None):
+        values = dict(settings or {})
+        values.update({key: namespace.pop(key) for key in list(namespace) if key.isupper()})
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._values = values
+        return cls
+    
+    def __init__(cls, name, bases, namespace, settings=None):
+        super().__init__(name, bases, namespace)
+    
+    def __getattr__(cls, name):
+        try:
+            return cls._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+    
+    def __setattr__(cls, name, value):
+        if name.isupper():
+            cls._values = {**cls._values, name: value}
+        else:
+            super().__setattr__(name, value)
+
+
+def parse_settings(env):
+    """Impostazioni lette da un dizionario di variabili (os.environ o una sua copia),
+    con i default per quelle mancanti.
+    
+    Solleva ValueError se un valore non è convertibile (es. HTTP_PORT=abc).
+    """
+    return {
+        # URLs e porte
+        'WEBHOOK_URL': env.get('WEBHOOK_URL', DEFAULT_WEBHOOK_URL),
+        'HTTP_PORT': int(env.get('HTTP_PORT', DEFAULT_HTTP_PORT)),
+
+        # Configurazione seriale
+        'SERIAL_PORT': env.get('SERIAL_PORT', DEFAULT_SERIAL_PORT),
+        'SERIAL_BAUDRATE': int(env.get('SERIAL_BAUDRATE', DEFAULT_BAUDRATE)),
+        'SERIAL_TIMEOUT': int(env.get('SERIAL_TIMEOUT', 1)),
+        # Più radio nello stesso bridge: "nome=porta,nome2=porta2" (vuoto = solo SERIAL_PORT)
+        'SERIAL_PORTS': env.get('SERIAL_PORTS', ''),
+
+        # Riconnessione automatica (backoff esponenziale da RECONNECT_BACKOFF_INITIAL
+        # fino a RECONNECT_INTERVAL secondi; dopo MAX_RECONNECT_ATTEMPTS la radio è "down")
+        'MAX_RECONNECT_ATTEMPTS': int(env.get('MAX_RECONNECT_ATTEMPTS', 5)),
+        'RECONNECT_INTERVAL': float(env.get('RECONNECT_INTERVAL', 10)),
+        'RECONNECT_BACKOFF_INITIAL': float(env.get('RECONNECT_BACKOFF_INITIAL', 1.0)),
+        'SERIAL_AUTODISCOVER': env.get('SERIAL_AUTODISCOVER', 'False').lower() == 'true',
+
+        # Cattura del traffico ricevuto (vuoto = disattivata), con rotazione per dimensione
+        'CAPTURE_DIR': env.get('CAPTURE_DIR', ''),
+        'CAPTURE_MAX_BYTES': int(env.get('CAPTURE_MAX_BYTES', 16777216)),
+        'CAPTURE_MAX_FILES': int(env.get('CAPTURE_MAX_FILES', 10)),
+
+        # Runtime: threads (default) o asyncio (un solo event loop)
+        'BRIDGE_RUNTIME': env.get('BRIDGE_RUNTIME', 'threads').lower(),
+        'WEBHOOK_MAX_IN_FLIGHT': int(env.get('WEBHOOK_MAX_IN_FLIGHT', 1000)),
+
+        # Processi: single (default) o split (radio in un processo, webhook e HTTP in un worker)
+        'PROCESS_MODE': env.get('PROCESS_MODE', 'single').lower(),
+        'IPC_BUFFER_LINES': int(env.get('IPC_BUFFER_LINES', 10000)),
+        'WORKER_RESTART_DELAY': float(env.get('WORKER_RESTART_DELAY', 2.0)),
+
+        # Webhook di destinazione (AI, archivio, analytics...); senza file solo WEBHOOK_URL
+        'WEBHOOKS_FILE': env.get('WEBHOOKS_FILE', 'webhooks.json'),
+        'WEBHOOK_CONCURRENCY': int(env.get('WEBHOOK_CONCURRENCY', 8)),
+        'WEBHOOK_QUEUE_SIZE': int(env.get('WEBHOOK_QUEUE_SIZE', 1000)),
+        'WEBHOOK_RETRIES': int(env.get('WEBHOOK_RETRIES', 0)),
+        'WEBHOOK_RETRY_BACKOFF': float(env.get('WEBHOOK_RETRY_BACKOFF', 1.0)),
+
+        # Timing e performance
+        'QUEUE_PROCESS_INTERVAL': float(env.get('QUEUE_PROCESS_INTERVAL', 2.0)),
+        'HTTP_TIMEOUT': int(env.get('HTTP_TIMEOUT', 5)),
+        'CLI_TIMEOUT': int(env.get('CLI_TIMEOUT', 15)),
+        'MESSAGE_DELAY': float(env.get('MESSAGE_DELAY', 0.5)),
+
+        # Arresto ordinato (webhook in corso, risposte, coda) e passaggio di consegne
+        # a un nuovo processo avviato con --takeover (vuoto = disattivato)
+        'DRAIN_TIMEOUT': float(env.get('DRAIN_TIMEOUT', 30)),
+        'HANDOFF_SOCKET': env.get('HANDOFF_SOCKET', ''),
+
+        # Ritmo degli invii adattato all'occupazione del canale riportata dalla radio
+        'PACING_ENABLED': env.get('PACING_ENABLED', 'False').lower() == 'true',
+        'PACING_MIN_DELAY': float(env.get('PACING_MIN_DELAY', 0.2)),
+        'PACING_MAX_DELAY': float(env.get('PACING_MAX_DELAY', 10.0)),
+        'PACING_QUIET_UTIL': float(env.get('PACING_QUIET_UTIL', 10.0)),
+        'PACING_BUSY_UTIL': float(env.get('PACING_BUSY_UTIL', 25.0)),
+        'PACING_BACKOFF_STEP': float(env.get('PACING_BACKOFF_STEP', 10.0)),
+        'PACING_MAX_AIR_UTIL_TX': float(env.get('PACING_MAX_AIR_UTIL_TX', 7.5)),
+        'PACING_STALE_SECONDS': float(env.get('PACING_STALE_SECONDS', 1800)),
+
+        # Logging
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'INFO'),
+        'ENABLE_DEBUG': env.get('ENABLE_DEBUG', 'False').lower() == 'true',
+        'LOG_FORMAT': env.get('LOG_FORMAT', 'text').lower(),
+        # Campionamento per categoria dei log DEBUG/INFO: "serial=0.01,http.payload=0.1"
+        'LOG_SAMPLE_RATES': env.get('LOG_SAMPLE_RATES', ''),
+
+        # Database nodi
+        'NODE_DB_PATH': env.get('NODE_DB_PATH', ''),
+        'NODE_DB_FLUSH_INTERVAL': float(env.get('NODE_DB_FLUSH_INTERVAL', 30.0)),
+
+        # Storico telemetria e posizione per nodo (GET /nodes/<id>/telemetry)
+        'TELEMETRY_ENABLED': env.get('TELEMETRY_ENABLED', 'True').lower() == 'true',
+        'TELEMETRY_RAW_SAMPLES': int(env.get('TELEMETRY_RAW_SAMPLES', 120)),
+        'TELEMETRY_1M_SAMPLES': int(env.get('TELEMETRY_1M_SAMPLES', 360)),
+        'TELEMETRY_15M_SAMPLES': int(env.get('TELEMETRY_15M_SAMPLES', 672)),
+        'TELEMETRY_MAX_NODES': int(env.get('TELEMETRY_MAX_NODES', 256)),
+        'TELEMETRY_ALERTS': env.get('TELEMETRY_ALERTS', ''),
+        'TELEMETRY_ALERT_COOLDOWN': float(env.get('TELEMETRY_ALERT_COOLDOWN', 3600)),
+        'TELEMETRY_ALERT_WEBHOOK_URL': env.get('TELEMETRY_ALERT_WEBHOOK_URL', ''),
+
+        # Memoria conversazioni (storico per mittente inviato a n8n)
+        'CONTEXT_ENABLED': env.get('CONTEXT_ENABLED', 'False').lower() == 'true',
+        'CONTEXT_MAX_TURNS': int(env.get('CONTEXT_MAX_TURNS', 10)),
+        'CONTEXT_MAX_BYTES': int(env.get('CONTEXT_MAX_BYTES', 2048)),
+        'CONTEXT_MAX_TOTAL_BYTES': int(env.get('CONTEXT_MAX_TOTAL_BYTES', 1048576)),
+        'CONTEXT_IDLE_TIMEOUT': int(env.get('CONTEXT_IDLE_TIMEOUT', 3600)),
+
+        # Regole di instradamento locali
+        'RULES_FILE': env.get('RULES_FILE', 'rules.json'),
+        'RULES_RELOAD_INTERVAL': float(env.get('RULES_RELOAD_INTERVAL', 5.0)),
+
+        # Cache risposte AI per domande ripetute
+        'REPLY_CACHE_ENABLED': env.get('REPLY_CACHE_ENABLED', 'False').lower() == 'true',
+        'REPLY_CACHE_TTL': int(env.get('REPLY_CACHE_TTL', 3600)),
+        'REPLY_CACHE_MAX_ENTRIES': int(env.get('REPLY_CACHE_MAX_ENTRIES', 256)),
+        'REPLY_CACHE_SCOPE': env.get('REPLY_CACHE_SCOPE', 'global'),
+        'REPLY_CACHE_PAIR_WINDOW': int(env.get('REPLY_CACHE_PAIR_WINDOW', 120)),
+
+        # Limitazione messaggi in ingresso (messaggi al minuto)
+        'RATE_LIMIT_ENABLED': env.get('RATE_LIMIT_ENABLED', 'False').lower() == 'true',
+        'RATE_LIMIT_PER_MINUTE': float(env.get('RATE_LIMIT_PER_MINUTE', 10)),
+        'RATE_LIMIT_BURST': int(env.get('RATE_LIMIT_BURST', 5)),
+        'RATE_LIMIT_GLOBAL_PER_MINUTE': float(env.get('RATE_LIMIT_GLOBAL_PER_MINUTE', 60)),
+        'RATE_LIMIT_GLOBAL_BURST': int(env.get('RATE_LIMIT_GLOBAL_BURST', 20)),
+        'RATE_LIMIT_MAX_NODES': int(env.get('RATE_LIMIT_MAX_NODES', 1024)),
+        'RATE_LIMIT_ACTION': env.get('RATE_LIMIT_ACTION', 'reply'),
+        'RATE_LIMIT_REPLY': env.get('RATE_LIMIT_REPLY', 'Troppi messaggi, rallenta e riprova tra poco'),
+
+        # Tracing per messaggio (GET /traces) e profiling su richiesta (/admin/profile)
+        'TRACE_ENABLED': env.get('TRACE_ENABLED', 'False').lower() == 'true',
+        'TRACE_BUFFER_SIZE': int(env.get('TRACE_BUFFER_SIZE', 200)),
+        'TRACE_PENDING_TIMEOUT': float(env.get('TRACE_PENDING_TIMEOUT', 300)),
+        'PROFILE_INTERVAL': float(env.get('PROFILE_INTERVAL', 0.01)),
+        'PROFILE_MAX_SECONDS': float(env.get('PROFILE_MAX_SECONDS', 60)),
+
+        # Contabilità della memoria (GET /debug/memory); tracemalloc con MEMORY_TRACE_FRAMES > 0
+        'MEMORY_DEBUG': env.get('MEMORY_DEBUG', 'False').lower() == 'true',
+        'MEMORY_TRACE_FRAMES': int(env.get('MEMORY_TRACE_FRAMES', 1)),
+
+        # Sicurezza
+        # Token per gli endpoint /admin/* (header X-Admin-Token); vuoto = disattivati
+        'ADMIN_TOKEN': env.get('ADMIN_TOKEN', ''),
+        'ALLOWED_HOSTS': env.get('ALLOWED_HOSTS', '0.0.0.0,localhost,127.0.0.1').split(','),
+    }
+
+
 # Configurazione caricata da environment o default
-class Config:
-    # URLs e porte
-    WEBHOOK_URL = os.getenv('WEBHOOK_URL', DEFAULT_WEBHOOK_URL)
-    HTTP_PORT = int(os.getenv('HTTP_PORT', DEFAULT_HTTP_PORT))
+class Config(metaclass=_Settings, settings=parse_settings(os.environ)):
+    def __getattr__(self, name):
+        # Le istanze leggono sempre le impostazioni attive della loro classe
+        try:
+            return type(self)._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
     
-    # Configurazione seriale
-    SERIAL_PORT = os.getenv('SERIAL_PORT', DEFAULT_SERIAL_PORT)
-    SERIAL_BAUDRATE = int(os.getenv('SERIAL_BAUDRATE', DEFAULT_BAUDRATE))
-    SERIAL_TIMEOUT = int(os.getenv('SERIAL_TIMEOUT', 1))
+    def get_radios(self):
+        """Ritorna la lista (nome, porta) delle radio configurate"""
+        radios = []
+        items = [item.strip() for item in self.SERIAL_PORTS.split(',') if item.strip()]
+        for index, item in enumerate(items):
+            name, separator, port = item.partition('=')
+            if not separator:
+                name, port = f"radio{index}", name
+            radios.append((name.strip(), port.strip()))
+        return radios or [("radio0", self.SERIAL_PORT)]
     
-    # Timing e performance
-    QUEUE_PROCESS_INTERVAL = float(os.getenv('QUEUE_PROCESS_INTERVAL', 2.0))
-    HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', 5))
-    CLI_TIMEOUT = int(os.getenv('CLI_TIMEOUT', 15))
-    MESSAGE_DELAY = float(os.getenv('MESSAGE_DELAY', 0.5))
+    @classmethod
+    def settings(cls):
+        """Tutte le impostazioni come dizionario nome → valore"""
+        return dict(cls._values)
     
-    # Logging
-    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-    ENABLE_DEBUG = os.getenv('ENABLE_DEBUG', 'False').lower() == 'true'
+    @classmethod
+    def from_env(cls):
+        """Rilegge .env e ambiente in una nuova configurazione, senza toccare quella
+        attiva né os.environ (vedi apply).
+        
+        Solleva ValueError se un valore non è convertibile (es. HTTP_PORT=abc).
+        """
+        with _reload_lock:
+            values = {key: value for key, value in dotenv_values(find_dotenv()).items() if value is not None}
+            env = {key: value for key, value in os.environ.items() if key not in _dotenv_keys}
+            for key, value in values.items():
+                if key not in _PROCESS_ENV:
+                    env[key] = value
+        
+        # Una sottoclasse con i propri valori: la configurazione attiva resta com'è
+        snapshot = _Settings(cls.__name__, (cls,), {}, settings=parse_settings(env))
+        config = snapshot()
+        config.environ = env
+        config.dotenv_keys = set(values) - set(_PROCESS_ENV)
+        return config
     
-    # Sicurezza
-    ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '0.0.0.0,localhost,127.0.0.1').split(',')
+    def validate(self):
+        """Ritorna la lista degli errori (vuota se la configurazione è valida)"""
+        errors = []
+        if not 0 < self.HTTP_PORT < 65536:
+            errors.append(f"HTTP_PORT fuori intervallo: {self.HTTP_PORT}")
+        if self.BRIDGE_RUNTIME not in ('threads', 'asyncio'):
+            errors.append(f"BRIDGE_RUNTIME non valido: {self.BRIDGE_RUNTIME}")
+        if self.PROCESS_MODE not in ('single', 'split'):
+            errors.append(f"PROCESS_MODE non valido: {self.PROCESS_MODE}")
+        if self.LOG_FORMAT not in ('text', 'json'):
+            errors.append(f"LOG_FORMAT non valido: {self.LOG_FORMAT}")
+        if self.RATE_LIMIT_ACTION not in ('reply', 'drop'):
+            errors.append(f"RATE_LIMIT_ACTION non valido: {self.RATE_LIMIT_ACTION}")
+        if self.REPLY_CACHE_SCOPE not in ('global', 'sender'):
+            errors.append(f"REPLY_CACHE_SCOPE non valido: {self.REPLY_CACHE_SCOPE}")
+        for name in ('SERIAL_TIMEOUT', 'QUEUE_PROCESS_INTERVAL', 'HTTP_TIMEOUT', 'CLI_TIMEOUT',
+                     'WEBHOOK_CONCURRENCY', 'WEBHOOK_QUEUE_SIZE', 'WEBHOOK_MAX_IN_FLIGHT',
+                     'IPC_BUFFER_LINES'):
+            if getattr(self, name) <= 0:
+                errors.append(f"{name} deve essere maggiore di zero")
+        for name in ('MESSAGE_DELAY', 'DRAIN_TIMEOUT', 'WEBHOOK_RETRIES', 'WEBHOOK_RETRY_BACKOFF',
+                     'WORKER_RESTART_DELAY', 'MEMORY_TRACE_FRAMES'):
+            if getattr(self, name) < 0:
+                errors.append(f"{name} non può essere negativo")
+        if not self.WEBHOOK_URL.startswith(('http://', 'https://')):
+            errors.append(f"WEBHOOK_URL non valido: {self.WEBHOOK_URL}")
+        if not self.get_radios():
+            errors.append("nessuna radio configurata")
+        
+        from telemetry_store import parse_alert_rules
+        try:
+            parse_alert_rules(self.TELEMETRY_ALERTS)
+        except ValueError as e:
+            errors.append(f"TELEMETRY_ALERTS: {e}")
+        return errors
+    
+    @classmethod
+    def diff(cls, other):
+        """Impostazioni che cambiano passando a other: nome → (vecchio, nuovo)"""
+        current = cls.settings()
+        return {
+            name: (current.get(name), value)
+            for name, value in other.settings().items()
+            if current.get(name) != value
+        }
+    
+    @classmethod
+    def apply(cls, values, source=None):
+        """Sostituisce le impostazioni indicate nella configurazione attiva, tutte
+        insieme. Con source (da from_env) aggiorna anche os.environ, così i
+        processi figli partono con la configurazione applicata"""
+        global _dotenv_keys
+        with _reload_lock:
+            cls._values = {**cls._values, **values}
+            if source is not None:
+                for key in _dotenv_keys - source.dotenv_keys:
+                    os.environ.pop(key, None)  # Tolta da .env: torna il default
+                for key in source.dotenv_keys:
+                    os.environ[key] = source.environ[key]
+                _dotenv_keys = source.dotenv_keys
     
     @classmethod
     def display_config(cls):
         """Mostra la configurazione attuale"""
-        print("📋 Configurazione attuale:")
-        print(f"   🌐 Webhook URL: {cls.WEBHOOK_URL}")
-        print(f"   🔌 Porta seriale: {cls.SERIAL_PORT} @ {cls.SERIAL_BAUDRATE} baud")
-        print(f"   📡 Server HTTP: http://localhost:{cls.HTTP_PORT}")
-        print(f"   ⏱️  Intervallo coda: {cls.QUEUE_PROCESS_INTERVAL}s")
-        print(f"   🐛 Debug: {'Abilitato' if cls.ENABLE_DEBUG else 'Disabilitato'}")
-        print("=" * 60)
\ No newline at end of file
+        logger.info("📋 Configurazione attuale:")
+        logger.info("   🌐 Webhook URL: %s", cls.WEBHOOK_URL)
+        if cls.SERIAL_PORTS:
+            logger.info("   🔌 Radio: %s @ %s baud", cls.SERIAL_PORTS, cls.SERIAL_BAUDRATE)
+        else:
+            logger.info("   🔌 Porta seriale: %s @ %s baud", cls.SERIAL_PORT, cls.SERIAL_BAUDRATE)
+        logger.info("   📡 Server HTTP: http://localhost:%s", cls.HTTP_PORT)
+        logger.info("   ⏱️  Intervallo coda: %ss", cls.QUEUE_PROCESS_INTERVAL)
+        logger.info("   🐛 Debug: %s", 'Abilitato' if cls.ENABLE_DEBUG else 'Disabilitato')
+        logger.info("=" * 60)
\ No newline at end of file
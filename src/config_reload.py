@@ -0,0 +1,150 @@
+"""
+Config Reload: ricarica della configurazione a caldo (SIGHUP o POST
+/admin/reload) senza chiudere le connessioni alle radio.
+
+La nuova configurazione (.env e ambiente) viene letta a parte e validata:
+se c'è anche un solo errore non si applica nulla. Altrimenti le impostazioni
+cambiate sostituiscono quelle attive in un solo passaggio e si
+riconfigurano solo i componenti interessati: cambiare WEBHOOK_URL ricrea i
+worker dei webhook ma non riapre la porta seriale; cambiare la porta di una
+radio riapre solo quella radio.
+
+Alcune impostazioni valgono solo all'avvio (RESTART_REQUIRED): restano al
+valore attuale e vengono segnalate nella risposta.
+"""
+
+import os
+import threading
+import time
+
+from config import Config
+from bridge_logging import get_logger
+
+logger = get_logger("config")
+
+# Componenti da riconfigurare: nome → prefissi delle impostazioni che li riguardano
+COMPONENTS = (
+    ("logging", ("LOG_", "ENABLE_DEBUG")),
+    ("webhooks", ("WEBHOOK", "HTTP_TIMEOUT")),
+    ("radios", ("SERIAL_PORT", "SERIAL_BAUDRATE", "SERIAL_TIMEOUT")),
+    ("reconnect", ("MAX_RECONNECT_ATTEMPTS", "RECONNECT_", "SERIAL_AUTODISCOVER")),
+    ("http", ("HTTP_PORT",)),
+    ("pacing", ("PACING_", "MESSAGE_DELAY")),
+    ("telemetry", ("TELEMETRY_", "WEBHOOK_URL")),
+    ("conversations", ("CONTEXT_",)),
+    ("rules", ("RULES_",)),
+    ("reply_cache", ("REPLY_CACHE_", "CONTEXT_ENABLED")),
+    ("rate_limit", ("RATE_LIMIT_",)),
+    ("tracing", ("TRACE_",)),
+    ("profiler", ("PROFILE_",)),
+    ("memory", ("MEMORY_",)),
+    ("node_db", ("NODE_DB_FLUSH_INTERVAL",)),
+)
+
+# Impostazioni lette solo all'avvio
+RESTART_REQUIRED = frozenset((
+    "BRIDGE_RUNTIME", "PROCESS_MODE", "IPC_BUFFER_LINES", "WORKER_RESTART_DELAY",
+    "HANDOFF_SOCKET", "NODE_DB_PATH",
+    "TELEMETRY_RAW_SAMPLES", "TELEMETRY_1M_SAMPLES", "TELEMETRY_15M_SAMPLES",
+    "CAPTURE_DIR", "CAPTURE_MAX_BYTES", "CAPTURE_MAX_FILES",
+))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime if path else None
+    except OSError:
+        return None
+
+
+def _direct(function, *args):
+    return function(*args)
+
+
+def components_for(names):
+    """Componenti interessati dalle impostazioni indicate, nell'ordine di COMPONENTS"""
+    return [
+        component for component, prefixes in COMPONENTS
+        if any(name.startswith(prefixes) for name in names)
+    ]
+
+
+class ConfigReloader:
+    """Rilegge, valida e applica la configurazione per un bridge in esecuzione"""
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.lock = threading.Lock()
+        self.last_result = None
+        # Anche il contenuto di WEBHOOKS_FILE conta come cambiamento
+        self._webhooks_mtime = _mtime(Config.WEBHOOKS_FILE)
+
+    def reload(self, call=None):
+        """Esegue una ricarica. Ritorna un dizionario con l'esito (status: ok, unchanged, error).
+        call(funzione, *argomenti): dove applicare la nuova configurazione (default: qui;
+        il runtime asyncio la esegue sul suo loop, lettura e validazione restano fuori)"""
+        with self.lock:
+            logger.info("🔄 Ricarica configurazione...")
+            try:
+                new_config = Config.from_env()
+            except ValueError as e:
+                return self._fail([f"valore non valido: {e}"])
+            errors = new_config.validate()
+            if errors:
+                return self._fail(errors)
+
+            changes = Config.diff(new_config)
+            restart_required = {name for name in changes if name in RESTART_REQUIRED}
+            # Radio aggiunte, tolte o rinominate: code e supervisori sono creati all'avvio
+            new_gateways = [name for name, _ in new_config.get_radios()]
+            if new_gateways != self.bridge.message_handler.gateways:
+                restart_required.update(name for name in ("SERIAL_PORT", "SERIAL_PORTS") if name in changes)
+            restart_required = sorted(restart_required)
+            applied = {name: values for name, values in changes.items() if name not in restart_required}
+
+            components = components_for(applied)
+            webhooks_mtime = _mtime(new_config.WEBHOOKS_FILE)
+            if webhooks_mtime != self._webhooks_mtime and "webhooks" not in components:
+                components.append("webhooks")
+            self._webhooks_mtime = webhooks_mtime
+
+            restarted = (call or _direct)(self._commit, new_config, applied, components)
+            result = {
+                "status": "ok" if applied or restarted else "unchanged",
+                "changed": sorted(applied),
+                "restarted": restarted,
+                "restart_required": restart_required,
+                "timestamp": time.time()
+            }
+            self.last_result = result
+            if applied or restarted:
+                logger.info("✅ Configurazione ricaricata: %s (componenti: %s)",
+                            ", ".join(sorted(applied)) or "nessuna impostazione",
+                            ", ".join(restarted) or "nessuno")
+            else:
+                logger.info("✅ Configurazione invariata")
+            if restart_required:
+                logger.warning("⚠️ Richiedono un riavvio (valore attuale mantenuto): %s",
+                               ", ".join(restart_required))
+            return result
+
+    def _commit(self, new_config, applied, components):
+        """Applica le impostazioni e riconfigura i componenti. Ritorna quelli riconfigurati"""
+        Config.apply({name: new for name, (_, new) in applied.items()}, source=new_config)
+        restarted = []
+        for component in components:
+            try:
+                self.bridge.reconfigure(component, applied)
+                restarted.append(component)
+            except Exception as e:
+                logger.error("❌ Riconfigurazione di %s fallita: %s", component, e)
+                logger.debug("Dettagli errore", exc_info=True)
+        return restarted
+
+    def _fail(self, errors):
+        for error in errors:
+            logger.error("❌ Configurazione non valida: %s", error)
+        logger.warning("⚠️ Ricarica annullata, configurazione attuale mantenuta")
+        result = {"status": "error", "errors": errors, "timestamp": time.time()}
+        self.last_result = result
+        return result
@@ -0,0 +1,211 @@
+"""
+Connection Supervisor per mantenere viva la connessione con il dispositivo:
+stati espliciti, riconnessione con backoff esponenziale e ricerca della porta
+"""
+
+import random
+import threading
+import time
+
+from bridge_logging import get_logger
+
+logger = get_logger("link")
+
+CONNECTING = 'connecting'
+UP = 'up'
+DEGRADED = 'degraded'
+DOWN = 'down'
+
+# USB vendor ID dei chip più usati sulle schede Meshtastic
+MESHTASTIC_USB_VIDS = {
+    0x10C4,  # Silicon Labs CP210x
+    0x1A86,  # WCH CH340/CH9102
+    0x0403,  # FTDI
+    0x303A,  # Espressif (ESP32-S3 USB nativo)
+    0x239A,  # Adafruit (nRF52, RAK4631)
+    0x2E8A,  # Raspberry Pi (RP2040)
+}
+
+
+class ConnectionSupervisor:
+    """Macchina a stati della connessione di una radio"""
+
+    def __init__(self, serial_manager, config):
+        self.serial_manager = serial_manager
+        self.configure(config)
+
+        self.state = CONNECTING
+        self.state_since = time.time()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+
+        self.consecutive_failures = 0
+        self.reconnects = 0
+        self.outages = 0
+        self.downtime_total = 0.0
+        self.last_error = None
+        self._outage_start = None
+        self._ever_up = False
+
+        # Identità USB del dispositivo, per ritrovarlo se cambia porta
+        self._usb_serial_number = None
+
+    def configure(self, config):
+        """Applica i parametri di riconnessione dal prossimo tentativo"""
+        self.config = config
+        self.max_attempts = max(1, config.MAX_RECONNECT_ATTEMPTS)
+        self.backoff_initial = config.RECONNECT_BACKOFF_INITIAL
+        self.backoff_max = max(config.RECONNECT_INTERVAL, self.backoff_initial)
+        self.autodiscover = config.SERIAL_AUTODISCOVER
+
+    def add_listener(self, callback):
+        """Registra callback(nome_radio, vecchio_stato, nuovo_stato)"""
+        self.listeners.append(callback)
+
+    def _set_state(self, new_state):
+        with self.lock:
+            old_state = self.state
+            if old_state == new_state:
+                return
+            now = time.time()
+            self.state = new_state
+            self.state_since = now
+            if new_state == UP:
+                if self._outage_start is not None:
+                    self.downtime_total += now - self._outage_start
+                    self._outage_start = None
+                self._ever_up = True
+            elif old_state == UP:
+                self._outage_start = now
+                self.outages += 1
+
+        if new_state == UP:
+            logger.info("🟢 Radio %s: connessione attiva", self.serial_manager.name)
+        elif new_state == DOWN:
+            logger.warning("🔴 Radio %s: connessione persa, nuovi tentativi ogni %.0fs", self.serial_manager.name, self.backoff_max)
+        elif new_state == DEGRADED:
+            logger.warning("🟠 Radio %s: connessione instabile, riconnessione in corso", self.serial_manager.name)
+
+        for callback in list(self.listeners):
+            try:
+                callback(self.serial_manager.name, old_state, new_state)
+            except Exception as e:
+                logger.error("❌ Errore notifica stato connessione: %s", e)
+
+    def is_up(self):
+        return self.state == UP
+
+    def needs_reconnect(self):
+        return self.state != UP
+
+    def mark_up(self):
+        """Connessione (ri)stabilita"""
+        self.consecutive_failures = 0
+        self._remember_device()
+        self._set_state(UP)
+
+    def report_error(self, error):
+        """Errore di I/O dal dispositivo: passa a degraded e sveglia il supervisore"""
+        self.last_error = str(error)
+        if self.state == UP:
+            self._set_state(DEGRADED)
+        self._wake.set()
+
+    def next_delay(self):
+        """Attesa prima del prossimo tentativo (backoff esponenziale con jitter)"""
+        delay = self.backoff_initial * (2 ** max(0, self.consecutive_failures - 1))
+        delay = min(delay, self.backoff_max)
+        return delay * random.uniform(0.8, 1.2) if self.consecutive_failures else 0
+
+    def reconnect_once(self):
+        """Esegue un tentativo di riconnessione. Ritorna True se riuscito"""
+        if self.serial_manager.cli_active:
+            return False  # Porta occupata dal CLI Meshtastic, non è un guasto
+        if self.autodiscover:
+            new_port = self._discover_port()
+            if new_port and new_port != self.serial_manager.port:
+                logger.info("🔎 Radio %s: dispositivo trovato su %s", self.serial_manager.name, new_port)
+                self.serial_manager.port = new_port
+
+        if self.serial_manager.reopen():
+            self.reconnects += 1
+            self.mark_up()
+            return True
+
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.max_attempts:
+            self._set_state(DOWN)
+        elif self.state != DOWN:
+            self._set_state(DEGRADED if self._ever_up else CONNECTING)
+        return False
+
+    def run(self, stop_event):
+        """Loop del supervisore (runtime a thread)"""
+        while not stop_event.is_set():
+            if not self.needs_reconnect():
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            if stop_event.wait(self.next_delay()):
+                break
+            self.reconnect_once()
+
+    # === Ricerca della porta ===
+
+    def _remember_device(self):
+        info = self._port_info(self.serial_manager.port)
+        if info is not None and getattr(info, 'serial_number', None):
+            self._usb_serial_number = info.serial_number
+
+    def _port_info(self, port):
+        try:
+            from serial.tools import list_ports
+        except ImportError:
+            return None
+        for info in list_ports.comports():
+            if info.device == port:
+                return info
+        return None
+
+    def _discover_port(self):
+        """Cerca il dispositivo tra le porte USB (stesso numero di serie o VID noto)"""
+        port = self.serial_manager.port
+        if '://' in port:
+            return None
+        try:
+            from serial.tools import list_ports
+        except ImportError:
+            return None
+
+        # Le porte delle altre radio (attuali o da configurazione) non sono candidate
+        taken = set()
+        for other in type(self.serial_manager).get_instances():
+            if other is not self.serial_manager:
+                taken.update((other.port, other.configured_port))
+        candidates = [info for info in list_ports.comports() if info.device not in taken]
+        if self._usb_serial_number:
+            for info in candidates:
+                if info.serial_number == self._usb_serial_number:
+                    return info.device
+        if any(info.device == port for info in candidates):
+            return port
+        for info in candidates:
+            if info.vid in MESHTASTIC_USB_VIDS:
+                return info.device
+        return None
+
+    def get_status(self):
+        """Ritorna stato e contatori della connessione"""
+        downtime = self.downtime_total
+        if self._outage_start is not None:
+            downtime += time.time() - self._outage_start
+        return {
+            "state": self.state,
+            "state_since": self.state_since,
+            "consecutive_failures": self.consecutive_failures,
+            "reconnects": self.reconnects,
+            "outages": self.outages,
+            "downtime_seconds": round(downtime, 1),
+            "last_error": self.last_error
+        }
@@ -0,0 +1,135 @@
+"""
+Conversation Store per mantenere nel bridge una memoria
+limitata delle conversazioni con ogni nodo
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from node_db import parse_node_id
+
+
+class Conversation:
+    """Storico dei turni di un singolo mittente"""
+
+    __slots__ = ('turns', 'size', 'last_activity')
+
+    def __init__(self):
+        self.turns = deque()
+        self.size = 0
+        self.last_activity = time.time()
+
+
+class ConversationStore:
+    """Storico per mittente con limiti per turni, byte e memoria globale (LRU)"""
+
+    def __init__(self, config):
+        self.configure(config)
+
+        # OrderedDict: il primo elemento è il mittente usato meno di recente
+        self.conversations = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def configure(self, config):
+        """Applica i limiti; gli storici esistenti si adeguano al prossimo messaggio"""
+        self.config = config
+        self.enabled = getattr(config, 'CONTEXT_ENABLED', False)
+        self.max_turns = getattr(config, 'CONTEXT_MAX_TURNS', 10)
+        self.max_bytes = getattr(config, 'CONTEXT_MAX_BYTES', 2048)
+        self.max_total_bytes = getattr(config, 'CONTEXT_MAX_TOTAL_BYTES', 1024 * 1024)
+        self.idle_timeout = getattr(config, 'CONTEXT_IDLE_TIMEOUT', 3600)
+
+    def _key(self, node_id):
+        try:
+            return parse_node_id(node_id)
+        except ValueError:
+            return None
+
+    def record(self, node_id, role, text):
+        """Aggiunge un turno (role: 'user' o 'assistant') allo storico del nodo"""
+        if not self.enabled or not text:
+            return
+        key = self._key(node_id)
+        if key is None:
+            return
+
+        turn = (role, text, int(time.time()))
+        turn_size = len(text.encode('utf-8'))
+
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                conversation = Conversation()
+                self.conversations[key] = conversation
+            else:
+                self.conversations.move_to_end(key)
+
+            conversation.turns.append(turn)
+            conversation.size += turn_size
+            conversation.last_activity = time.time()
+            self.total_bytes += turn_size
+
+            # Limiti per mittente: numero di turni e byte
+            while conversation.turns and (len(conversation.turns) > self.max_turns or
+                                          conversation.size > self.max_bytes):
+                self._drop_oldest_turn(conversation)
+
+            self._enforce_global_limit()
+
+    def _drop_oldest_turn(self, conversation):
+        _, old_text, _ = conversation.turns.popleft()
+        old_size = len(old_text.encode('utf-8'))
+        conversation.size -= old_size
+        self.total_bytes -= old_size
+
+    def _remove(self, key):
+        conversation = self.conversations.pop(key)
+        self.total_bytes -= conversation.size
+        self.evictions += 1
+
+    def _enforce_global_limit(self):
+        """Rimuove i mittenti inattivi e poi quelli usati meno di recente"""
+        now = time.time()
+        while self.conversations:
+            key, conversation = next(iter(self.conversations.items()))
+            if now - conversation.last_activity > self.idle_timeout:
+                self._remove(key)
+            elif self.total_bytes > self.max_total_bytes and len(self.conversations) > 1:
+                self._remove(key)
+            else:
+                break
+
+    def get_history(self, node_id):
+        """Ritorna lo storico del nodo come lista di dizionari"""
+        if not self.enabled:
+            return []
+        key = self._key(node_id)
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                return []
+            if time.time() - conversation.last_activity > self.idle_timeout:
+                self._remove(key)
+                return []
+            return [{"role": role, "text": text, "timestamp": ts}
+                    for role, text, ts in conversation.turns]
+
+    def clear(self, node_id):
+        """Cancella lo storico di un nodo"""
+        key = self._key(node_id)
+        with self.lock:
+            if key in self.conversations:
+                self._remove(key)
+
+    def get_status(self):
+        """Ritorna statistiche sulla memoria delle conversazioni"""
+        return {
+            "enabled": self.enabled,
+            "conversations": len(self.conversations),
+            "total_bytes": self.total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "evictions": self.evictions
+        }
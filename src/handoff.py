@@ -0,0 +1,284 @@
+"""
+Handoff: passaggio di consegne tra il vecchio e il nuovo processo del bridge
+durante un deploy, senza chiudere la porta HTTP e senza perdere la coda.
+
+Con HANDOFF_SOCKET impostato il bridge ascolta su un socket Unix. Un nuovo
+processo avviato con --takeover vi si collega e:
+
+    nuovo → vecchio   {"op": "takeover", "pid": ...}
+    vecchio → nuovo   {"op": "listen"} + socket HTTP in ascolto (SCM_RIGHTS)
+                      il vecchio smette di accettare connessioni: le risposte
+                      di n8n arrivano già al nuovo, che le tiene in coda
+    vecchio           attende le chiamate webhook in corso, ferma la coda
+    vecchio → nuovo   {"op": "released", "pending": [...]} dopo aver chiuso le radio
+    nuovo → vecchio   {"op": "done"}; il nuovo apre le radio e invia la coda
+
+Un messaggio per riga (JSON). Solo Linux/macOS (socket Unix e passaggio di
+file descriptor).
+
+Se il socket HTTP non si può cedere, il vecchio processo torna a servire e
+resta in attesa di un nuovo takeover. Prima di "released" la coda viene anche
+scritta in HANDOFF_SOCKET + ".pending"; il nuovo processo cancella il file
+quando la riceve. Se uno dei due processi termina a metà, il file resta e la
+coda si reinvia al successivo avvio.
+"""
+
+import json
+import os
+import socket
+import threading
+
+from bridge_logging import get_logger
+
+logger = get_logger("handoff")
+
+# Attesa massima del socket HTTP dopo la richiesta di takeover (secondi)
+LISTEN_TIMEOUT = 10
+
+
+def is_supported():
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def pending_path(config):
+    """File della coda in transito tra i due processi (None senza HANDOFF_SOCKET)"""
+    return config.HANDOFF_SOCKET + '.pending' if config.HANDOFF_SOCKET else None
+
+
+def save_pending(path, pending):
+    """Scrive la coda su disco prima di consegnarla. False se non è stato possibile"""
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pending, f)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error("❌ Impossibile salvare la coda in %s: %s", path, e)
+        return False
+    return True
+
+
+def discard_pending(path):
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def recover_pending(path):
+    """Coda rimasta su disco da un passaggio di consegne interrotto ([] se non c'è)"""
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            pending = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("❌ Coda di handoff illeggibile in %s: %s", path, e)
+        return []
+    discard_pending(path)
+    if not isinstance(pending, list):
+        return []
+    pending = [msg for msg in pending if isinstance(msg, dict) and 'to' in msg]
+    if pending:
+        logger.info("📥 %s messaggi recuperati da un passaggio di consegne interrotto", len(pending))
+    return pending
+
+
+class HandoffChannel:
+    """Connessione tra i due processi: messaggi JSON su righe, con file descriptor allegati"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+        self.fds = []
+
+    def send(self, data, fds=()):
+        payload = json.dumps(data).encode('utf-8') + b"\n"
+        if fds:
+            # I descrittori viaggiano col primo blocco del messaggio
+            sent = socket.send_fds(self.sock, [payload], list(fds))
+            payload = payload[sent:]
+        if payload:
+            self.sock.sendall(payload)
+
+    def recv(self, timeout=None):
+        """Prossimo messaggio come (dati, descrittori ricevuti); None se la connessione è chiusa"""
+        self.sock.settimeout(timeout)
+        while b"\n" not in self.buffer:
+            data, fds, _, _ = socket.recv_fds(self.sock, 65536, 4)
+            self.fds.extend(fds)
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        fds, self.fds = self.fds, []
+        return json.loads(line.decode('utf-8')), fds
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class HandoffRequest:
+    """Lato del processo in esecuzione durante un takeover"""
+
+    def __init__(self, channel, pid=None, pending_path=None):
+        self.channel = channel
+        self.pid = pid
+        self.pending_path = pending_path
+
+    def send_listen_socket(self, fileno):
+        """Cede il socket HTTP in ascolto (resta aperto anche qui finché non lo si chiude)"""
+        self.channel.send({"op": "listen"}, fds=[fileno])
+
+    def release(self, pending, timeout=LISTEN_TIMEOUT):
+        """Consegna i messaggi non inviati dopo aver chiuso le radio. True se confermato.
+        La coda resta anche su disco finché il nuovo processo non la riceve"""
+        saved = bool(pending) and bool(self.pending_path) and save_pending(self.pending_path, pending)
+        try:
+            self.channel.send({"op": "released", "pending": pending})
+            message = self.channel.recv(timeout=timeout)
+        except (OSError, ValueError) as e:
+            logger.error("❌ Handoff interrotto: %s", e)
+            return False
+        finally:
+            self.channel.close()
+            if saved and os.path.exists(self.pending_path):
+                logger.warning("⚠️ Coda conservata in %s: verrà inviata al prossimo avvio", self.pending_path)
+        return bool(message) and message[0].get('op') == 'done'
+
+    def abort(self):
+        self.channel.close()
+
+
+class HandoffListener:
+    """Lato del processo in esecuzione: attende una richiesta di takeover"""
+
+    def __init__(self, config, on_takeover):
+        self.path = config.HANDOFF_SOCKET
+        self.pending_path = pending_path(config)
+        self.on_takeover = on_takeover
+        self.sock = None
+        self.inode = None
+        self.thread = None
+
+    def start(self):
+        if not self.path:
+            return False
+        if not is_supported():
+            logger.warning("⚠️ HANDOFF_SOCKET ignorato: servono socket Unix e passaggio di descrittori")
+            return False
+        try:
+            # Il file può essere di un processo precedente (o di quello che ci ha ceduto il posto)
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.path)
+            os.chmod(self.path, 0o600)
+            self.sock.listen(1)
+            self.inode = os.stat(self.path).st_ino
+        except OSError as e:
+            logger.error("❌ Impossibile aprire il socket di handoff %s: %s", self.path, e)
+            self.sock = None
+            return False
+        self.thread = threading.Thread(target=self._accept_loop, name="handoff", daemon=True)
+        self.thread.start()
+        logger.info("🤝 In attesa di takeover su %s", self.path)
+        return True
+
+    def _accept_loop(self):
+        while self.sock is not None:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            channel = HandoffChannel(conn)
+            try:
+                message = channel.recv(timeout=LISTEN_TIMEOUT)
+            except (OSError, ValueError):
+                message = None
+            if not message or message[0].get('op') != 'takeover':
+                channel.close()
+                continue
+            logger.info("🤝 Richiesta di takeover dal processo %s", message[0].get('pid'))
+            # Dopo un takeover riuscito close() chiude il socket e il ciclo termina;
+            # se è fallito si resta in attesa del prossimo
+            self.on_takeover(HandoffRequest(channel, message[0].get('pid'), self.pending_path))
+
+    def close(self):
+        """Chiude il socket; il file resta se nel frattempo è di un altro processo"""
+        sock, self.sock = self.sock, None
+        if sock is None:
+            return
+        try:
+            sock.close()
+            if os.stat(self.path).st_ino == self.inode:
+                os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class Takeover:
+    """Lato del nuovo processo: riceve il socket HTTP e poi la coda"""
+
+    def __init__(self, channel, listen_socket, pending_path=None):
+        self.channel = channel
+        self.listen_socket = listen_socket
+        self.pending_path = pending_path
+
+    def wait_release(self, timeout):
+        """Attende che il vecchio processo chiuda le radio; ritorna i messaggi ancora da inviare.
+        Se il vecchio processo non conferma, la coda eventualmente rimasta su disco"""
+        try:
+            message = self.channel.recv(timeout=timeout)
+        except (OSError, ValueError) as e:
+            logger.error("❌ Handoff interrotto: %s", e)
+            message = None
+        if not message or message[0].get('op') != 'released':
+            logger.warning("⚠️ Il vecchio processo non ha confermato il rilascio delle radio")
+            self.channel.close()
+            return recover_pending(self.pending_path)
+        pending = message[0].get('pending', [])
+        discard_pending(self.pending_path)
+        try:
+            self.channel.send({"op": "done"})
+        except OSError:
+            pass
+        self.channel.close()
+        return pending
+
+
+def take_over(config):
+    """Chiede il socket HTTP al processo in esecuzione. None se non c'è nessuno a cui subentrare"""
+    path = config.HANDOFF_SOCKET
+    if not path or not is_supported():
+        logger.warning("⚠️ Takeover non disponibile (HANDOFF_SOCKET vuoto o piattaforma non supportata)")
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        sock.close()
+        logger.warning("⚠️ Nessun bridge in esecuzione su %s (%s): avvio normale", path, e)
+        return None
+
+    channel = HandoffChannel(sock)
+    try:
+        channel.send({"op": "takeover", "pid": os.getpid()})
+        message = channel.recv(timeout=LISTEN_TIMEOUT)
+    except (OSError, ValueError) as e:
+        logger.error("❌ Takeover fallito: %s", e)
+        channel.close()
+        return None
+    if not message or message[0].get('op') != 'listen' or not message[1]:
+        logger.error("❌ Takeover fallito: socket HTTP non ricevuto")
+        channel.close()
+        return None
+    fds = message[1]
+    for extra in fds[1:]:
+        os.close(extra)
+    logger.info("🤝 Socket HTTP ricevuto dal processo precedente")
+    return Takeover(channel, socket.socket(fileno=fds[0]), pending_path(config))
@@ -3,140 +3,253 @@ HTTP Server per ricevere richieste da n8n
 e gestire l'API del bridge
 """
 
+import asyncio
+import hmac
 import json
+import logging
+import socket
 import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
-class BridgeRequestHandler(BaseHTTPRequestHandler):
-    """Handler per le richieste HTTP del bridge"""
+from profiler import SamplingProfiler
+from memory_monitor import MemoryMonitor, GROUP_BY, TOP_LIMIT
+from node_db import parse_node_id, format_node_id
+from bridge_logging import get_logger, get_status as get_logging_status
+
+logger = get_logger("http")
+# Dump dei payload in DEBUG, campionabile a parte (LOG_SAMPLE_RATES=http.payload=...)
+payload_logger = get_logger("http.payload")
+
+class BridgeAPI:
+    """Logica delle API del bridge, indipendente dal server HTTP usato"""
     
-    def __init__(self, message_handler, config, *args, **kwargs):
-        self.message_handler = message_handler
+    # Gestori che possono bloccare a lungo (snapshot tracemalloc, ricarica della
+    # configurazione): il server asyncio li esegue fuori dal loop
+    BLOCKING_PATHS = ("/admin/", "/debug/memory")
+    
+    def __init__(self, config, message_handler):
         self.config = config
-        super().__init__(*args, **kwargs)
+        self.message_handler = message_handler
+        self.profiler = SamplingProfiler(config)
+        self.memory = MemoryMonitor(config)
+        # Ricarica della configurazione, impostata dal bridge (POST /admin/reload)
+        self.reload_config = None
     
-    def do_POST(self):
-        """Gestisce richieste POST per inviare messaggi Meshtastic"""
-        try:
-            print(f"🔔 Richiesta POST ricevuta da {self.client_address[0]}")
-            
-            # Verifica Content-Length
-            content_length = int(self.headers.get('Content-Length', 0))
-            if self.config.ENABLE_DEBUG:
-                print(f"📏 Content-Length: {content_length}")
-            
-            # Leggi body della richiesta
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                if self.config.ENABLE_DEBUG:
-                    print(f"📄 Dati ricevuti: {post_data}")
-                
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                    if self.config.ENABLE_DEBUG:
-                        print(f"📋 JSON decodificato: {data}")
-                except json.JSONDecodeError as e:
-                    print(f"❌ Errore JSON: {e}")
-                    self._send_error_response(400, "JSON malformato")
-                    return
-            else:
-                print("⚠️ Richiesta POST senza body")
-                data = {}
-            
-            # Gestisci formato n8n (array con oggetti)
-            data = self._normalize_n8n_data(data)
-            
-            # Estrai parametri
-            to_node = data.get('to', '') if isinstance(data, dict) else ''
-            message = data.get('message', '') if isinstance(data, dict) else ''
-            
-            if self.config.ENABLE_DEBUG:
-                print(f"👤 Destinatario: {to_node}")
-                print(f"💬 Messaggio: {message}")
-            
-            # Valida parametri
-            if not to_node or not message:
-                error_msg = f"Parametri mancanti - to: '{to_node}', message: '{message}'"
-                print(f"❌ {error_msg}")
-                self._send_error_response(400, error_msg)
-                return
-            
-            # Aggiungi messaggio alla coda
-            success = self.message_handler.queue_message(to_node, message)
+    def handle_post(self, path, body, client_ip='', headers=None, query=None):
+        """Gestisce richieste POST per inviare messaggi Meshtastic.
+        
+        Ritorna una tupla (status_code, dati_risposta).
+        """
+        if path.startswith("/admin/"):
+            return self.handle_admin('POST', path, query or {}, headers)
+        
+        if path == "/debug/memory":
+            return self.handle_memory('POST', query or {}, headers)
+        
+        logger.info("🔔 Richiesta POST ricevuta da %s", client_ip)
+        logger.debug("📏 Content-Length: %s", len(body))
+        
+        # Leggi body della richiesta
+        if body:
+            payload_logger.debug("📄 Dati ricevuti: %s", body)
             
-            if success:
-                response = {
-                    "status": "success", 
-                    "message": "Messaggio aggiunto alla coda",
-                    "queued_message": {"to": to_node, "text": message}
-                }
-                self._send_json_response(200, response)
-                print("✅ Messaggio accodato con successo")
-            else:
-                self._send_error_response(500, "Errore durante accodamento messaggio")
-                
-        except Exception as e:
-            print(f"❌ Errore nel gestore POST: {e}")
-            if self.config.ENABLE_DEBUG:
-                import traceback
-                traceback.print_exc()
-            self._send_error_response(500, f"Errore server: {str(e)}")
+            try:
+                data = json.loads(body.decode('utf-8'))
+                payload_logger.debug("📋 JSON decodificato: %s", data)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                logger.error("❌ Errore JSON: %s", e)
+                return self.error_response(400, "JSON malformato")
+        else:
+            logger.warning("⚠️ Richiesta POST senza body")
+            data = {}
+        
+        # Gestisci formato n8n (array con oggetti)
+        data = self._normalize_n8n_data(data)
+        
+        # Estrai parametri
+        to_node = data.get('to', '') if isinstance(data, dict) else ''
+        message = data.get('message', '') if isinstance(data, dict) else ''
+        
+        logger.debug("👤 Destinatario: %s", to_node)
+        logger.debug("💬 Messaggio: %s", message)
+        
+        # Valida parametri
+        if not to_node or not message:
+            error_msg = f"Parametri mancanti - to: '{to_node}', message: '{message}'"
+            logger.error("❌ %s", error_msg)
+            return self.error_response(400, error_msg)
+        
+        # Arresto in corso: solo risposte a messaggi già inoltrati a n8n
+        if (self.message_handler.draining.is_set()
+                and not self.message_handler.accepts_while_draining(to_node)):
+            logger.warning("⏳ Richiesta rifiutata: bridge in arresto")
+            return self.error_response(503, "Bridge in arresto, riprova tra poco")
+        
+        # Aggiungi messaggio alla coda
+        gateway = data.get('gateway') if isinstance(data, dict) else None
+        success = self.message_handler.queue_message(to_node, message, gateway)
+        
+        if success:
+            # Memorizza la risposta per le domande ripetute
+            self.message_handler.reply_cache.learn(to_node, message, data)
+            response = {
+                "status": "success",
+                "message": "Messaggio aggiunto alla coda",
+                "queued_message": {"to": to_node, "text": message}
+            }
+            logger.info("✅ Messaggio accodato con successo")
+            return 200, response
+        return self.error_response(500, "Errore durante accodamento messaggio")
     
-    def do_GET(self):
+    def handle_get(self, path, query=None, headers=None):
         """Gestisce richieste GET per status e test"""
+        logger.info("🔔 Richiesta GET: %s", path)
+        query = query or {}
+        
+        if path.startswith("/admin/"):
+            return self.handle_admin('GET', path, query, headers)
+        
+        if path == "/" or path == "/status":
+            # Status del bridge
+            return 200, self._get_bridge_status()
+        
+        elif path == "/test":
+            # Test del bridge
+            return 200, {
+                "status": "ok",
+                "message": "Bridge HTTP funzionante",
+                "timestamp": self._get_timestamp()
+            }
+        
+        elif path == "/queue":
+            # Status della coda
+            return 200, self.message_handler.get_queue_status()
+        
+        elif path == "/nodes":
+            # Tabella dei nodi conosciuti
+            nodes = self.message_handler.node_db.to_list()
+            return 200, {"count": len(nodes), "nodes": nodes}
+        
+        elif path.startswith("/nodes/") and path.endswith("/telemetry"):
+            # Storico telemetria di un nodo (?from=&to= epoch, oppure ?last=secondi; &resolution=raw|1m|15m)
+            return self._get_node_telemetry(path[len("/nodes/"):-len("/telemetry")], query)
+        
+        elif path == "/traces":
+            # Ultime tracce per messaggio (?limit=50&node=0x...)
+            tracer = self.message_handler.tracer
+            if not tracer.enabled:
+                return self.error_response(404, "Tracing disattivato (TRACE_ENABLED=false)")
+            try:
+                limit = int(query.get('limit', ['50'])[0])
+            except ValueError:
+                return self.error_response(400, "Parametro 'limit' non valido")
+            traces = tracer.recent(limit, query.get('node', [None])[0])
+            return 200, {"count": len(traces), "traces": traces}
+        
+        elif path == "/debug/memory":
+            # Memoria, thread e allocazioni (?limit=20&group=lineno|filename|traceback)
+            return self.handle_memory('GET', query, headers)
+        
+        # Endpoint non trovato
+        return self.error_response(404, f"Endpoint '{path}' non trovato")
+    
+    def _get_node_telemetry(self, node_id, query):
+        """Campioni di telemetria di un nodo in un intervallo di tempo"""
+        telemetry = self.message_handler.telemetry
+        resolution = query.get('resolution', ['auto'])[0]
+        if resolution not in ('auto', 'raw', '1m', '15m'):
+            return self.error_response(400, "Parametro 'resolution' non valido (auto, raw, 1m, 15m)")
         try:
-            url_parts = urlparse(self.path)
-            path = url_parts.path
-            
-            print(f"🔔 Richiesta GET: {path}")
-            
-            if path == "/" or path == "/status":
-                # Status del bridge
-                response = self._get_bridge_status()
-                self._send_json_response(200, response)
-                
-            elif path == "/test":
-                # Test del bridge
-                response = {
-                    "status": "ok", 
-                    "message": "Bridge HTTP funzionante",
-                    "timestamp": self._get_timestamp()
-                }
-                self._send_json_response(200, response)
-                
-            elif path == "/queue":
-                # Status della coda
-                queue_status = self.message_handler.get_queue_status()
-                self._send_json_response(200, queue_status)
-                
-            else:
-                # Endpoint non trovato
-                self._send_error_response(404, f"Endpoint '{path}' non trovato")
-                
-        except Exception as e:
-            print(f"❌ Errore nel gestore GET: {e}")
-            self._send_error_response(500, f"Errore server: {str(e)}")
+            until = float(query['to'][0]) if 'to' in query else None
+            since = float(query['from'][0]) if 'from' in query else None
+            if 'last' in query:
+                since = (until or time.time()) - float(query['last'][0])
+            result = telemetry.query(node_id, since, until, resolution)
+        except ValueError:
+            return self.error_response(400, "Parametri 'from', 'to', 'last' o ID nodo non validi")
+        if result is None:
+            return self.error_response(404, f"Nessuna telemetria per il nodo '{node_id}'")
+        resolution, samples = result
+        return 200, {
+            "node": format_node_id(parse_node_id(node_id)),
+            "resolution": resolution,
+            "latest": telemetry.latest(node_id),
+            "count": len(samples),
+            "samples": samples
+        }
     
-    def do_OPTIONS(self):
-        """Gestisce preflight CORS"""
-        self._send_cors_headers()
-        self.send_response(200)
-        self.end_headers()
+    def handle_admin(self, method, path, query, headers):
+        """Endpoint di amministrazione, protetti da ADMIN_TOKEN"""
+        if not self.config.ADMIN_TOKEN:
+            return self.error_response(404, "Endpoint di amministrazione disattivati (ADMIN_TOKEN vuoto)")
+        if not self._valid_admin_token(headers):
+            return self.error_response(401, "Token di amministrazione non valido")
+        
+        if path == "/admin/profile":
+            if method == 'GET':
+                return 200, self.profiler.get_status()
+            try:
+                seconds = float(query.get('seconds', ['10'])[0])
+            except ValueError:
+                return self.error_response(400, "Parametro 'seconds' non valido")
+            if not self.profiler.start(seconds):
+                return self.error_response(409, "Profiling già in corso")
+            logger.info("🔬 Profiling avviato per %.0fs", self.profiler.seconds)
+            return 202, self.profiler.get_status()
+        
+        if path == "/admin/reload" and self.reload_config is not None:
+            if method != 'POST':
+                return self.error_response(405, "Usa POST per ricaricare la configurazione")
+            result = self.reload_config()
+            return (400 if result["status"] == "error" else 200), result
+        
+        return self.error_response(404, f"Endpoint '{path}' non trovato")
+    
+    def is_blocking(self, path):
+        return path.startswith(self.BLOCKING_PATHS)
+    
+    def _valid_admin_token(self, headers):
+        token = (headers or {}).get('X-Admin-Token') or (headers or {}).get('x-admin-token') or ''
+        return hmac.compare_digest(token.encode('utf-8'), self.config.ADMIN_TOKEN.encode('utf-8'))
+    
+    def handle_memory(self, method, query, headers):
+        """Contabilità della memoria (MEMORY_DEBUG=true); con ADMIN_TOKEN serve anche il token"""
+        if not self.memory.enabled:
+            return self.error_response(404, "Contabilità della memoria disattivata (MEMORY_DEBUG=false)")
+        if self.config.ADMIN_TOKEN and not self._valid_admin_token(headers):
+            return self.error_response(401, "Token di amministrazione non valido")
+        
+        if method == 'POST':
+            # Nuova baseline, es. dopo il riscaldamento
+            if not self.memory.reset_baseline():
+                return self.error_response(409, "tracemalloc non attivo (MEMORY_TRACE_FRAMES=0)")
+            logger.info("🧮 Nuova baseline della memoria")
+            return 200, {"status": "ok", "baseline_at": self.memory.baseline_at}
+        
+        group_by = query.get('group', ['lineno'])[0]
+        if group_by not in GROUP_BY:
+            return self.error_response(400, "Parametro 'group' non valido (lineno, filename, traceback)")
+        try:
+            limit = int(query.get('limit', [str(TOP_LIMIT)])[0])
+        except ValueError:
+            return self.error_response(400, "Parametro 'limit' non valido")
+        return 200, self.memory.get_report(max(0, limit), group_by)
     
     def _normalize_n8n_data(self, data):
         """Normalizza dati provenienti da n8n"""
         # n8n invia spesso array: [{"output": {...}}]
         if isinstance(data, list) and len(data) > 0:
             data = data[0]
-            if self.config.ENABLE_DEBUG:
-                print(f"📦 Primo elemento array: {data}")
+            payload_logger.debug("📦 Primo elemento array: %s", data)
         
         # n8n può incapsulare in "output"
         if isinstance(data, dict) and 'output' in data:
             data = data['output']
-            if self.config.ENABLE_DEBUG:
-                print(f"📦 Contenuto 'output': {data}")
+            payload_logger.debug("📦 Contenuto 'output': %s", data)
         
         return data
     
@@ -148,7 +261,7 @@ class BridgeRequestHandler(BaseHTTPRequestHandler):
         queue_status = self.message_handler.get_queue_status()
         
         return {
-            "status": "running",
+            "status": "draining" if self.message_handler.draining.is_set() else "running",
             "timestamp": self._get_timestamp(),
             "config": {
                 "webhook_url": self.config.WEBHOOK_URL,
@@ -156,14 +269,76 @@ class BridgeRequestHandler(BaseHTTPRequestHandler):
                 "serial_port": self.config.SERIAL_PORT
             },
             "serial": serial_manager.get_status() if serial_manager else {"connected": False},
-            "queue": queue_status
+            "radios": [manager.get_status() for manager in SerialManager.get_instances()],
+            "queue": queue_status,
+            "nodes": self.message_handler.node_db.get_status(),
+            "conversations": self.message_handler.conversations.get_status(),
+            "rules": self.message_handler.rules.get_status(),
+            "reply_cache": self.message_handler.reply_cache.get_status(),
+            "rate_limit": self.message_handler.rate_limiter.get_status(),
+            "webhooks": [target.get_status() for target in self.message_handler.webhook_targets],
+            "telemetry": self.message_handler.telemetry.get_status(),
+            "tracing": self.message_handler.tracer.get_status(),
+            "logging": get_logging_status()
         }
     
     def _get_timestamp(self):
         """Ritorna timestamp corrente"""
-        from datetime import datetime
         return datetime.now().isoformat()
     
+    def error_response(self, status_code, error_message):
+        """Costruisce una risposta di errore"""
+        return status_code, {
+            "status": "error",
+            "message": error_message,
+            "timestamp": self._get_timestamp()
+        }
+
+class BridgeRequestHandler(BaseHTTPRequestHandler):
+    """Handler per le richieste HTTP del bridge"""
+    
+    def __init__(self, api, config, *args, **kwargs):
+        self.api = api
+        self.config = config
+        super().__init__(*args, **kwargs)
+    
+    def do_POST(self):
+        """Gestisce richieste POST per inviare messaggi Meshtastic"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length) if content_length > 0 else b''
+            
+            url_parts = urlparse(self.path)
+            status_code, response = self.api.handle_post(
+                url_parts.path, body, self.client_address[0],
+                self.headers, parse_qs(url_parts.query)
+            )
+            self._send_json_response(status_code, response)
+        
+        except Exception as e:
+            logger.error("❌ Errore nel gestore POST: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
+            self._send_json_response(*self.api.error_response(500, f"Errore server: {str(e)}"))
+    
+    def do_GET(self):
+        """Gestisce richieste GET per status e test"""
+        try:
+            url_parts = urlparse(self.path)
+            status_code, response = self.api.handle_get(
+                url_parts.path, parse_qs(url_parts.query), self.headers
+            )
+            self._send_json_response(status_code, response)
+        
+        except Exception as e:
+            logger.error("❌ Errore nel gestore GET: %s", e)
+            self._send_json_response(*self.api.error_response(500, f"Errore server: {str(e)}"))
+    
+    def do_OPTIONS(self):
+        """Gestisce preflight CORS"""
+        self.send_response(200)
+        self._send_cors_headers()
+        self.end_headers()
+    
     def _send_json_response(self, status_code, data):
         """Invia risposta JSON"""
         self.send_response(status_code)
@@ -174,23 +349,13 @@ class BridgeRequestHandler(BaseHTTPRequestHandler):
         response_json = json.dumps(data, indent=2)
         self.wfile.write(response_json.encode('utf-8'))
         
-        if self.config.ENABLE_DEBUG:
-            print(f"📡 Risposta {status_code}: {response_json}")
-    
-    def _send_error_response(self, status_code, error_message):
-        """Invia risposta di errore"""
-        error_data = {
-            "status": "error",
-            "message": error_message,
-            "timestamp": self._get_timestamp()
-        }
-        self._send_json_response(status_code, error_data)
+        payload_logger.debug("📡 Risposta %s: %s", status_code, response_json)
     
     def _send_cors_headers(self):
         """Invia header CORS"""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Admin-Token')
     
     def log_message(self, format, *args):
         """Silenzia log standard del server HTTP"""
@@ -203,49 +368,199 @@ class HTTPBridgeServer:
     def __init__(self, config, message_handler):
         self.config = config
         self.message_handler = message_handler
+        self.api = BridgeAPI(config, message_handler)
         self.server = None
         self.server_thread = None
         self.running = False
+        # Socket già in ascolto ricevuto dal processo precedente (handoff)
+        self.listen_socket = None
     
     def start(self):
         """Avvia il server HTTP"""
         try:
             # Crea handler factory con parametri iniettati
             def handler_factory(*args, **kwargs):
-                return BridgeRequestHandler(self.message_handler, self.config, *args, **kwargs)
+                return BridgeRequestHandler(self.api, self.config, *args, **kwargs)
             
             # Crea server HTTP
-            self.server = HTTPServer(('0.0.0.0', self.config.HTTP_PORT), handler_factory)
+            if self.listen_socket is not None:
+                server = HTTPServer(('0.0.0.0', self.config.HTTP_PORT), handler_factory, bind_and_activate=False)
+                server.socket.close()
+                server.socket = self.listen_socket
+                self.server = server
+            else:
+                self.server = HTTPServer(('0.0.0.0', self.config.HTTP_PORT), handler_factory)
             self.running = True
             
-            print(f"🌐 Server HTTP avviato su:")
-            print(f"   - http://localhost:{self.config.HTTP_PORT}")
-            print(f"   - http://127.0.0.1:{self.config.HTTP_PORT}")
+            logger.info("🌐 Server HTTP avviato su:")
+            logger.info("   - http://localhost:%s", self.config.HTTP_PORT)
+            logger.info("   - http://127.0.0.1:%s", self.config.HTTP_PORT)
             
             # Avvia server
             self.server.serve_forever()
-            
+        
         except OSError as e:
             if "Address already in use" in str(e):
-                print(f"❌ Porta {self.config.HTTP_PORT} già in uso!")
-                print(f"   Prova a cambiare porta o chiudi il processo che la sta usando")
+                logger.error("❌ Porta %s già in uso!", self.config.HTTP_PORT)
+                logger.info("   Prova a cambiare porta o chiudi il processo che la sta usando")
             else:
-                print(f"❌ Errore OS server HTTP: {e}")
+                logger.error("❌ Errore OS server HTTP: %s", e)
         except Exception as e:
-            print(f"❌ Errore server HTTP: {e}")
-            if self.config.ENABLE_DEBUG:
-                import traceback
-                traceback.print_exc()
+            logger.error("❌ Errore server HTTP: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
     
     def stop(self):
         """Ferma il server HTTP"""
-        if self.server:
-            print("🛑 Arresto server HTTP...")
+        server, self.server = self.server, None
+        if server:
+            logger.info("🛑 Arresto server HTTP...")
             self.running = False
-            self.server.shutdown()
-            self.server.server_close()
-            print("✅ Server HTTP arrestato")
+            server.shutdown()
+            server.server_close()
+            logger.info("✅ Server HTTP arrestato")
+    
+    def fileno(self):
+        """File descriptor del socket in ascolto (None se il server non è attivo)"""
+        return self.server.socket.fileno() if self.server else None
+    
+    def rebind(self):
+        """Passa alla HTTP_PORT attuale: il server si ferma solo se la nuova porta
+        è libera (altrimenti OSError). Blocca finché il nuovo server è attivo"""
+        sock = socket.create_server(('0.0.0.0', self.config.HTTP_PORT))
+        self.stop()
+        self.listen_socket = sock
+        self.start()
     
     def is_running(self):
         """Verifica se il server è in esecuzione"""
-        return self.running and self.server is not None
\ No newline at end of file
+        return self.running and self.server is not None
+
+class AsyncHTTPBridgeServer:
+    """Server HTTP asyncio per il runtime asincrono del bridge"""
+    
+    MAX_BODY_SIZE = 1024 * 1024
+    REQUEST_TIMEOUT = 30
+    
+    def __init__(self, config, api):
+        self.config = config
+        self.api = api
+        self.server = None
+    
+    async def start(self, sock=None):
+        """Avvia il server HTTP sul loop corrente (sock: socket ereditato con l'handoff)"""
+        try:
+            if sock is not None:
+                self.server = await asyncio.start_server(self._handle_client, sock=sock)
+            else:
+                self.server = await asyncio.start_server(
+                    self._handle_client, '0.0.0.0', self.config.HTTP_PORT
+                )
+        except OSError as e:
+            logger.error("❌ Errore OS server HTTP: %s", e)
+            raise
+        logger.info("🌐 Server HTTP (asyncio) avviato su:")
+        logger.info("   - http://localhost:%s", self.config.HTTP_PORT)
+    
+    async def stop(self):
+        """Ferma il server HTTP"""
+        if self.server:
+            logger.info("🛑 Arresto server HTTP...")
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            logger.info("✅ Server HTTP arrestato")
+    
+    def fileno(self):
+        """File descriptor del socket in ascolto (None se il server non è attivo)"""
+        return self.server.sockets[0].fileno() if self.server and self.server.sockets else None
+    
+    async def rebind(self):
+        """Passa alla HTTP_PORT attuale; il vecchio server chiude solo se il nuovo è in ascolto.
+        Le connessioni già aperte terminano normalmente"""
+        server = await asyncio.start_server(self._handle_client, '0.0.0.0', self.config.HTTP_PORT)
+        old, self.server = self.server, server
+        if old:
+            old.close()
+        logger.info("🌐 Server HTTP (asyncio) spostato su http://localhost:%s", self.config.HTTP_PORT)
+    
+    async def _handle_client(self, reader, writer):
+        """Gestisce una connessione (con keep-alive HTTP/1.1)"""
+        peer = writer.get_extra_info('peername')
+        client_ip = peer[0] if peer else ''
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), self.REQUEST_TIMEOUT)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), self.REQUEST_TIMEOUT)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                content_length = int(headers.get('content-length', 0) or 0)
+                if content_length > self.MAX_BODY_SIZE:
+                    status_code, data = self.api.error_response(413, "Richiesta troppo grande")
+                    writer.write(self._build_response(status_code, data, False))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(content_length) if content_length else b''
+                
+                # Gli altri gestori leggono solo lo stato in memoria: sul loop, senza executor
+                if self.api.is_blocking(urlparse(target).path):
+                    status_code, data = await asyncio.get_running_loop().run_in_executor(
+                        None, self._dispatch, method, target, body, client_ip, headers
+                    )
+                else:
+                    status_code, data = self._dispatch(method, target, body, client_ip, headers)
+                keep_alive = (version == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                writer.write(self._build_response(status_code, data, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    def _dispatch(self, method, target, body, client_ip, headers=None):
+        """Instrada la richiesta verso la BridgeAPI"""
+        try:
+            url_parts = urlparse(target)
+            query = parse_qs(url_parts.query)
+            if method == 'GET':
+                return self.api.handle_get(url_parts.path, query, headers)
+            if method == 'POST':
+                return self.api.handle_post(url_parts.path, body, client_ip, headers, query)
+            if method == 'OPTIONS':
+                return 200, None
+            return self.api.error_response(405, f"Metodo {method} non supportato")
+        except Exception as e:
+            logger.error("❌ Errore nel gestore %s: %s", method, e)
+            return self.api.error_response(500, f"Errore server: {str(e)}")
+    
+    def _build_response(self, status_code, data, keep_alive):
+        """Costruisce la risposta HTTP completa"""
+        try:
+            reason = HTTPStatus(status_code).phrase
+        except ValueError:
+            reason = ''
+        body = json.dumps(data, indent=2).encode('utf-8') if data is not None else b''
+        head = (
+            f"HTTP/1.1 {status_code} {reason}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+            "Access-Control-Allow-Headers: Content-Type, X-Admin-Token\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        if data is not None and payload_logger.isEnabledFor(logging.DEBUG):
+            payload_logger.debug("📡 Risposta %s: %s", status_code, body.decode('utf-8'))
+        return head.encode('latin-1') + body
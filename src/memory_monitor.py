@@ -0,0 +1,166 @@
+"""
+Memory Monitor: contabilità della memoria per GET /debug/memory
+(MEMORY_DEBUG=true).
+
+Riporta RSS, thread per nome e oggetti tracciati dal garbage collector per
+tipo. Con MEMORY_TRACE_FRAMES > 0 attiva anche tracemalloc: righe del codice
+che hanno allocato di più e crescita rispetto a una baseline, presa
+all'attivazione o con POST /debug/memory (es. dopo il riscaldamento).
+Su un bridge che gira per settimane, una voce che cresce a ogni controllo
+è una perdita. Nessun costo quando è disattivato.
+"""
+
+import gc
+import os
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+TOP_LIMIT = 20
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Le allocazioni di tracemalloc e dell'import dei moduli non interessano
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def read_rss_kb():
+    """Memoria residente del processo in kB (None se /proc non è disponibile)"""
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _where(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+class MemoryMonitor:
+    """Statistiche di memoria del processo e allocazioni tracciate"""
+
+    def __init__(self, config):
+        self.lock = threading.Lock()
+        # Un report completo alla volta: le richieste girano in thread diversi
+        # (anche nel runtime asyncio, fuori dal loop) e ognuna copia l'heap
+        self.report_lock = threading.Lock()
+        self.enabled = False
+        self.frames = 0
+        # Solo il tracing avviato qui viene fermato qui
+        self.started_tracing = False
+        self.baseline = None
+        self.baseline_at = None
+        self.configure(config)
+
+    def configure(self, config):
+        """Attiva o ferma tracemalloc secondo MEMORY_DEBUG e MEMORY_TRACE_FRAMES"""
+        with self.lock:
+            self.enabled = getattr(config, 'MEMORY_DEBUG', False)
+            frames = getattr(config, 'MEMORY_TRACE_FRAMES', 1) if self.enabled else 0
+            if self.started_tracing and frames != self.frames:
+                tracemalloc.stop()
+                self.started_tracing = False
+                self.baseline = None
+            self.frames = frames
+            if frames > 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.started_tracing = True
+                self._take_baseline()
+
+    @property
+    def tracing(self):
+        return self.enabled and tracemalloc.is_tracing()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    def _take_baseline(self):
+        self.baseline = self._snapshot()
+        self.baseline_at = time.time()
+
+    def reset_baseline(self):
+        """Nuova baseline per la crescita. False se tracemalloc non è attivo"""
+        with self.lock:
+            if not self.tracing:
+                return False
+            self._take_baseline()
+            return True
+
+    def get_report(self, limit=TOP_LIMIT, group_by='lineno'):
+        """Stato della memoria; con limit=0 solo i totali (economico, per il campionamento)"""
+        with self.report_lock:
+            return self._report(limit, group_by)
+
+    def _report(self, limit, group_by):
+        threads = threading.enumerate()
+        objects = gc.get_objects()
+        report = {
+            "timestamp": time.time(),
+            "rss_kb": read_rss_kb(),
+            "threads": len(threads),
+            "gc": {
+                "objects": len(objects),
+                "generations": list(gc.get_count()),
+                "uncollectable": len(gc.garbage)
+            },
+            "tracemalloc": None
+        }
+        if limit > 0:
+            # Thread con lo stesso nome a meno del numero finale: webhook-n8n-0, -1...
+            names = Counter(re.sub(r"[-_]?\d+$", "", thread.name) for thread in threads)
+            report["threads_by_name"] = dict(names.most_common())
+            types = Counter(type(obj).__name__ for obj in objects)
+            report["gc"]["top_types"] = [
+                {"type": name, "count": count} for name, count in types.most_common(limit)
+            ]
+        del objects
+
+        with self.lock:
+            if not self.tracing:
+                return report
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "frames": self.frames,
+                "current_kb": round(current / 1024, 1),
+                "peak_kb": round(peak / 1024, 1),
+                "baseline_at": self.baseline_at
+            }
+            if limit <= 0:
+                return report
+            snapshot = self._snapshot()
+            baseline = self.baseline
+
+        report["tracemalloc"]["top"] = [
+            self._stat_entry(stat, group_by) for stat in snapshot.statistics(group_by)[:limit]
+        ]
+        if baseline is not None:
+            growth = [diff for diff in snapshot.compare_to(baseline, group_by) if diff.size_diff > 0]
+            report["tracemalloc"]["growth"] = [
+                dict(self._stat_entry(diff, group_by),
+                     size_diff_kb=round(diff.size_diff / 1024, 1), count_diff=diff.count_diff)
+                for diff in growth[:limit]
+            ]
+        return report
+
+    @staticmethod
+    def _stat_entry(stat, group_by):
+        entry = {
+            "where": _where(stat.traceback[-1]),
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count
+        }
+        if group_by == 'filename':
+            entry["where"] = os.path.basename(stat.traceback[-1].filename)
+        elif group_by == 'traceback':
+            entry["traceback"] = [_where(frame) for frame in stat.traceback]
+        return entry
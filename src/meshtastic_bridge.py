@@ -7,6 +7,8 @@ Author: Il tuo nome
 License: MIT
 """
 
+import os
+import signal
 import sys
 import threading
 import time
@@ -16,80 +18,189 @@ from config import Config
 from message_handler import MessageHandler
 from serial_manager import SerialManager
 from http_server import HTTPBridgeServer
+from webhook_dispatcher import WebhookDispatcher, load_webhook_targets
+from handoff import HandoffListener, take_over, recover_pending, pending_path, LISTEN_TIMEOUT
+from config_reload import ConfigReloader
+from bridge_logging import get_logger, setup_logging, reconfigure as reconfigure_logging
+
+logger = get_logger("mesh")
 
 class MeshtasticBridge:
     """Bridge principale tra Meshtastic e n8n"""
     
     def __init__(self):
         self.config = Config()
-        self.serial_manager = SerialManager(self.config)
+        setup_logging(self.config)
+        
+        # Una connessione per ogni radio configurata (la prima è la principale)
+        self.serial_managers = [
+            SerialManager(self.config, name, port)
+            for name, port in self.config.get_radios()
+        ]
+        self.serial_manager = self.serial_managers[0]
         self.message_handler = MessageHandler(self.config)
-        self.http_server = HTTPBridgeServer(self.config, self.message_handler)
+        self.http_server = self._create_http_server()
+        # Worker fissi per ogni webhook di destinazione
+        self.webhooks = self._create_webhooks()
+        
+        # La coda di invio si ferma quando una radio perde la connessione
+        for serial_manager in self.serial_managers:
+            serial_manager.supervisor.add_listener(self.message_handler.on_link_state)
         
         # Thread management
         self.running = False
         self.threads = []
+        self.queue_threads = []
+        self.supervisor_stop = threading.Event()
+        
+        # Arresto ordinato e passaggio di consegne a un nuovo processo
+        self.takeover = False  # True: subentra al bridge in ascolto su HANDOFF_SOCKET
+        self.handoff = HandoffListener(self.config, self._on_takeover_request)
+        self.handed_off = False
+        self.stop_lock = threading.Lock()
+        self.stopping = False
+        self.stopped = threading.Event()
+        
+        # Ricarica della configurazione a caldo (SIGHUP, POST /admin/reload)
+        self.reloader = ConfigReloader(self)
+        self.http_server.api.reload_config = self.reload_config
+    
+    def _create_http_server(self):
+        return HTTPBridgeServer(self.config, self.message_handler)
+    
+    def _create_webhooks(self):
+        return WebhookDispatcher(self.message_handler)
     
     def start(self):
         """Avvia tutti i componenti del bridge"""
-        print("🚀 Avvio Meshtastic ↔ n8n Bridge")
+        logger.info("🚀 Avvio Meshtastic ↔ n8n Bridge")
         Config.display_config()
         
         try:
+            # Subentro a un bridge in esecuzione: prima il socket HTTP, poi le radio
+            takeover = take_over(self.config) if self.takeover else None
+            if takeover:
+                self.http_server.listen_socket = takeover.listen_socket
+            
             # Avvia server HTTP
-            print("🌐 Avvio server HTTP...")
+            logger.info("🌐 Avvio server HTTP...")
             http_thread = threading.Thread(target=self.http_server.start, daemon=True)
             http_thread.start()
             self.threads.append(http_thread)
             
-            # Avvia processore coda messaggi
-            print("📦 Avvio sistema coda messaggi...")
-            queue_thread = threading.Thread(target=self.message_handler.process_queue, daemon=True)
-            queue_thread.start()
-            self.threads.append(queue_thread)
+            # Avvia processore coda messaggi (uno per radio)
+            logger.info("📦 Avvio sistema coda messaggi...")
+            for serial_manager in self.serial_managers:
+                queue_thread = threading.Thread(
+                    target=self.message_handler.process_queue,
+                    args=(serial_manager.name,),
+                    daemon=True
+                )
+                queue_thread.start()
+                self.threads.append(queue_thread)
+                self.queue_threads.append(queue_thread)
+            
+            # Avvia persistenza database nodi
+            self.message_handler.node_db.start()
+            
+            # Avvia invio ai webhook
+            self.webhooks.start()
+            
+            # Le risposte ricevute nel frattempo restano in coda finché le radio non sono libere
+            if takeover:
+                logger.info("⏳ Attesa del rilascio delle radio dal processo precedente...")
+                pending = takeover.wait_release(self.config.DRAIN_TIMEOUT + self.config.CLI_TIMEOUT + LISTEN_TIMEOUT)
+            else:
+                pending = recover_pending(pending_path(self.config))
+            self.message_handler.restore_pending(pending)
             
             # Avvia monitoraggio seriale
-            print("👂 Avvio monitoraggio messaggi Meshtastic...")
+            logger.info("👂 Avvio monitoraggio messaggi Meshtastic...")
             self.running = True
-            self.serial_manager.connect()
+            for serial_manager in self.serial_managers:
+                serial_manager.connect()
+            
+            # Supervisori di connessione: riconnessione automatica con backoff
+            for serial_manager in self.serial_managers:
+                supervisor_thread = threading.Thread(
+                    target=serial_manager.supervisor.run,
+                    args=(self.supervisor_stop,),
+                    daemon=True
+                )
+                supervisor_thread.start()
+                self.threads.append(supervisor_thread)
+            
+            # Radio aggiuntive: un thread di lettura ciascuna
+            for serial_manager in self.serial_managers[1:]:
+                reader_thread = threading.Thread(
+                    target=self._read_loop, args=(serial_manager,), daemon=True
+                )
+                reader_thread.start()
+                self.threads.append(reader_thread)
+            
+            # Pronto a cedere il posto a un nuovo processo
+            self.handoff.start()
+            
+            # SIGTERM (systemd, docker stop): arresto ordinato mentre il loop continua a leggere
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, self._on_sigterm)
+                if hasattr(signal, 'SIGHUP'):
+                    signal.signal(signal.SIGHUP, self._on_sighup)
             
             # Main loop - lettura messaggi seriali
             self._main_loop()
             
         except KeyboardInterrupt:
-            print("\n👋 Uscita richiesta dall'utente")
+            logger.info("\n👋 Uscita richiesta dall'utente")
         except Exception as e:
-            print(f"❌ Errore critico: {e}")
-            if Config.ENABLE_DEBUG:
-                import traceback
-                traceback.print_exc()
+            logger.error("❌ Errore critico: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
         finally:
             self.stop()
     
     def _main_loop(self):
         """Loop principale per la lettura dei messaggi seriali"""
-        print("✅ Bridge avviato! In ascolto per messaggi...")
-        print("   Premi Ctrl+C per uscire")
-        print("-" * 60)
+        logger.info("✅ Bridge avviato! In ascolto per messaggi...")
+        logger.info("   Premi Ctrl+C per uscire")
+        logger.info("-" * 60)
         
+        self._read_loop(self.serial_manager)
+    
+    def _read_loop(self, serial_manager):
+        """Legge le linee di una radio finché il bridge è attivo"""
         while self.running:
             try:
                 # Leggi messaggio dalla connessione seriale
-                line = self.serial_manager.read_line()
-                
-                if line and 'Received text msg' in line:
-                    # Processa messaggio ricevuto
-                    message_data = self._parse_meshtastic_message(line)
-                    if message_data:
-                        self._handle_incoming_message(message_data)
+                line = serial_manager.read_line()
+                if line:
+                    self._process_line(line, serial_manager.name)
                         
             except Exception as e:
-                print(f"❌ Errore nel loop principale: {e}")
-                if Config.ENABLE_DEBUG:
-                    import traceback
-                    traceback.print_exc()
+                logger.error("❌ Errore nel loop principale: %s", e)
+                logger.debug("Dettagli errore", exc_info=True)
                 time.sleep(1)  # Pausa in caso di errore
     
+    def _process_line(self, line, gateway=None):
+        """Elabora una linea ricevuta dal dispositivo (gateway: radio di origine)"""
+        gateway = gateway or self.serial_manager.name
+        if 'Received text msg' in line:
+            # Processa messaggio ricevuto
+            arrival = time.monotonic()
+            message_data = self._parse_meshtastic_message(line)
+            if message_data:
+                message_data['gateway'] = gateway
+                self.message_handler.tracer.begin(message_data, arrival)
+                self.message_handler.node_db.ingest_message(message_data)
+                self._handle_incoming_message(message_data)
+        else:
+            # Aggiorna tabella nodi (NodeInfo, posizione, metadati radio)
+            self.message_handler.node_db.ingest_line(line, gateway)
+            # Occupazione del canale per il ritmo degli invii
+            self.message_handler.pacer.ingest_line(line, gateway)
+            # Storico telemetria e posizione, con eventuali allarmi per n8n
+            for alert in self.message_handler.telemetry.ingest_line(line, gateway):
+                self._send_alert(alert)
+    
     def _parse_meshtastic_message(self, line):
         """Estrae dati dal messaggio Meshtastic"""
         import re
@@ -120,35 +231,226 @@ class MeshtasticBridge:
             return message_data
             
         except Exception as e:
-            print(f"❌ Errore parsing messaggio: {e}")
+            logger.error("❌ Errore parsing messaggio: %s", e)
             return None
     
     def _handle_incoming_message(self, message_data):
         """Gestisce messaggio Meshtastic ricevuto"""
-        print(f"💬 [{message_data['timestamp']}] Da: {message_data['from']}")
-        print(f"📝 Messaggio: {message_data['text']}")
+        logger.info("💬 [%s] Da: %s (via %s)", message_data['timestamp'], message_data['from'], message_data.get('gateway'))
+        logger.info("📝 Messaggio: %s", message_data['text'])
         
-        # Invia a n8n in thread separato
-        webhook_thread = threading.Thread(
-            target=self.message_handler.send_to_n8n, 
-            args=(message_data,)
-        )
-        webhook_thread.start()
+        # Regole locali (comandi, scarti, webhook dedicati)
+        webhook_url = self.message_handler.route_message(message_data)
+        if webhook_url is None:
+            self.message_handler.tracer.finish(message_data, 'local')
+            logger.info("-" * 60)
+            return
+        
+        # Accoda per i webhook (n8n e gli altri target configurati)
+        self.webhooks.dispatch(message_data, webhook_url)
+        
+        logger.info("-" * 60)
+    
+    def _send_alert(self, alert):
+        """Invia un allarme di telemetria a n8n dal worker degli allarmi"""
+        self.webhooks.dispatch_alert(alert)
+    
+    # === Ricarica configurazione ===
+    
+    def reload_config(self):
+        """Rilegge .env e applica le impostazioni cambiate (vedi config_reload)"""
+        return self.reloader.reload()
+    
+    def _on_sighup(self, signum, frame):
+        threading.Thread(target=self.reload_config, name="config-reload", daemon=True).start()
+    
+    def reconfigure(self, component, changes):
+        """Applica la configurazione già aggiornata a un componente in esecuzione.
+        changes: impostazioni cambiate, nome → (vecchio, nuovo)"""
+        handler = self.message_handler
+        if component == "logging":
+            reconfigure_logging(self.config)
+        elif component == "webhooks":
+            self._replace_webhooks()
+        elif component == "radios":
+            # Solo le radio con porta o parametri diversi; le altre restano collegate
+            reopen_all = "SERIAL_BAUDRATE" in changes or "SERIAL_TIMEOUT" in changes
+            for (_, port), serial_manager in zip(self.config.get_radios(), self.serial_managers):
+                if reopen_all or port != serial_manager.configured_port:
+                    self._switch_radio(serial_manager, port)
+        elif component == "reconnect":
+            for serial_manager in self.serial_managers:
+                serial_manager.supervisor.configure(self.config)
+        elif component == "http":
+            self._restart_http(changes["HTTP_PORT"][0])
+        elif component == "pacing":
+            handler.pacer.configure(self.config)
+        elif component == "telemetry":
+            handler.telemetry.configure(self.config)
+            handler.alert_webhook_url = self.config.TELEMETRY_ALERT_WEBHOOK_URL or self.config.WEBHOOK_URL
+        elif component == "conversations":
+            handler.conversations.configure(self.config)
+        elif component == "rules":
+            handler.rules.configure(self.config)
+        elif component == "reply_cache":
+            handler.reply_cache.configure(self.config)
+        elif component == "rate_limit":
+            handler.rate_limiter.configure(self.config)
+        elif component == "tracing":
+            handler.tracer.configure(self.config)
+        elif component == "profiler":
+            self.http_server.api.profiler.configure(self.config)
+        elif component == "memory":
+            self.http_server.api.memory.configure(self.config)
+        elif component == "node_db":
+            handler.node_db.configure(self.config)
+    
+    def _replace_webhooks(self):
+        """Nuovi target e worker; il dispatcher precedente completa le chiamate già accodate"""
+        retired = self.webhooks
+        self.message_handler.webhook_targets = load_webhook_targets(self.config)
+        self.webhooks = self._create_webhooks()
+        self.webhooks.start()
+        threading.Thread(
+            target=retired.stop, args=(self.config.DRAIN_TIMEOUT,),
+            name="webhook-retire", daemon=True
+        ).start()
+        logger.info("🔀 Webhook aggiornati: %s", ", ".join(t.name for t in self.message_handler.webhook_targets))
+    
+    def _switch_radio(self, serial_manager, port):
+        serial_manager.switch_port(port)
+    
+    def _restart_http(self, previous_port):
+        """Nuova porta HTTP. In un thread: la richiesta /admin/reload può essere
+        ancora in corso sul server da fermare"""
+        def restart():
+            try:
+                self.http_server.rebind()
+            except OSError as e:
+                logger.error("❌ Porta HTTP %s non disponibile (%s): resta %s", self.config.HTTP_PORT, e, previous_port)
+                Config.apply({"HTTP_PORT": previous_port})
+        threading.Thread(target=restart, name="http-restart", daemon=True).start()
+    
+    # === Arresto ordinato ===
+    
+    def _drain_steps(self, handing_off=False):
+        """Conteggi attesi a zero, in ordine, durante il drenaggio"""
+        steps = [self.webhooks.busy]
+        if not handing_off:
+            # Con l'handoff le risposte arrivano al nuovo processo, che invia anche la coda
+            steps.append(lambda: self.message_handler.awaiting_replies(self.config.DRAIN_TIMEOUT))
+            steps.append(lambda: self.message_handler.pending_sends(connected_only=True))
+        return steps
+    
+    def _drain_summary(self):
+        return {
+            "webhook": self.webhooks.busy(),
+            "risposte attese": self.message_handler.awaiting_replies(self.config.DRAIN_TIMEOUT),
+            "messaggi in coda": self.message_handler.pending_sends()
+        }
+    
+    def _begin_drain(self):
+        self.message_handler.draining.set()
+        summary = ", ".join(f"{name}: {count}" for name, count in self._drain_summary().items())
+        logger.info("⏳ Drenaggio (max %ss) - %s", self.config.DRAIN_TIMEOUT, summary)
+        return time.monotonic()
+    
+    def _end_drain(self, started, handing_off=False):
+        left = {name: count for name, count in self._drain_summary().items() if count}
+        if handing_off:
+            left.pop("risposte attese", None)
+            left.pop("messaggi in coda", None)
+        if left:
+            logger.warning("⚠️ Drenaggio incompleto dopo %.1fs: %s", time.monotonic() - started,
+                           ", ".join(f"{name}: {count}" for name, count in left.items()))
+        else:
+            logger.info("✅ Drenaggio completato in %.1fs", time.monotonic() - started)
+    
+    def drain(self, handing_off=False):
+        """Rifiuta le nuove richieste HTTP (503) e attende, entro DRAIN_TIMEOUT,
+        le chiamate webhook in corso, le risposte di n8n e la coda di invio"""
+        started = self._begin_drain()
+        deadline = started + self.config.DRAIN_TIMEOUT
+        for remaining in self._drain_steps(handing_off):
+            while remaining() and time.monotonic() < deadline:
+                time.sleep(0.1)
+        self._end_drain(started, handing_off)
+    
+    def _on_sigterm(self, signum, frame):
+        threading.Thread(target=self.stop, name="drain", daemon=True).start()
+    
+    def _on_takeover_request(self, request):
+        """Un nuovo processo subentra: riceve il socket HTTP subito e la coda
+        dopo che le chiamate webhook in corso sono finite e le radio chiuse"""
+        with self.stop_lock:
+            fileno = self.http_server.fileno()
+            if self.stopping or fileno is None:
+                request.abort()
+                return
+            self.stopping = True
+        logger.info("🤝 Passaggio di consegne al processo %s...", request.pid)
+        try:
+            request.send_listen_socket(fileno)
+        except OSError as e:
+            # Il socket è ancora nostro: si continua a servire in attesa di un altro takeover
+            logger.error("❌ Invio del socket HTTP fallito, il bridge resta attivo: %s", e)
+            request.abort()
+            with self.stop_lock:
+                self.stopping = False
+            return
+        # Da qui le nuove connessioni vanno al nuovo processo
+        self.http_server.stop()
+        self.drain(handing_off=True)
         
-        print("-" * 60)
+        # Coda ferma dopo il messaggio in corso; il resto passa al nuovo processo
+        self.message_handler.stop()
+        for thread in self.queue_threads:
+            thread.join(timeout=self.config.CLI_TIMEOUT + 5)
+        pending = self.message_handler.take_pending()
+        self._release_radios()
+        if request.release(pending):
+            logger.info("✅ Radio rilasciate, %s messaggi consegnati al nuovo processo", len(pending))
+        else:
+            logger.error("❌ Nuovo processo non raggiungibile durante il passaggio di consegne")
+        self.handed_off = True
+        self._shutdown()
     
     def stop(self):
-        """Ferma tutti i componenti"""
-        print("🛑 Arresto bridge...")
+        """Ferma tutti i componenti dopo aver drenato il lavoro in corso"""
+        with self.stop_lock:
+            already_stopping = self.stopping
+            self.stopping = True
+        if already_stopping:
+            self.stopped.wait()
+            return
+        logger.info("🛑 Arresto bridge...")
+        self.drain()
+        self._shutdown()
+    
+    def _release_radios(self):
         self.running = False
+        self.supervisor_stop.set()
+        self.message_handler.stop()
         
-        # Chiudi connessione seriale
-        self.serial_manager.disconnect()
+        # Chiudi connessioni seriali
+        for serial_manager in self.serial_managers:
+            serial_manager.disconnect()
+    
+    def _shutdown(self):
+        self._release_radios()
         
         # Ferma server HTTP
         self.http_server.stop()
+        self.handoff.close()
+        
+        # Ferma i worker dei webhook
+        self.webhooks.stop()
+        
+        # Salva modifiche pendenti del database nodi
+        self.message_handler.node_db.stop()
         
-        print("✅ Bridge arrestato")
+        logger.info("✅ Bridge arrestato")
+        self.stopped.set()
 
 def setup_interactive():
     """Setup interattivo per configurazione iniziale"""
@@ -177,15 +479,30 @@ def setup_interactive():
 
 def main():
     """Funzione principale"""
-    print("📡 Meshtastic ↔ n8n Bridge v1.0")
-    print("=" * 40)
+    setup_logging(Config)
+    logger.info("📡 Meshtastic ↔ n8n Bridge v1.0")
+    logger.info("=" * 40)
     
     # Setup interattivo se richiesto
     if len(sys.argv) > 1 and sys.argv[1] == '--setup':
         setup_interactive()
     
-    # Avvia bridge
-    bridge = MeshtasticBridge()
+    # Modalità split: questo è il processo radio, il bridge gira in un worker
+    if Config.PROCESS_MODE == 'split':
+        from process_split import RadioProcess
+        RadioProcess(Config()).run()
+        return
+    if 'BRIDGE_IPC_FD' in os.environ:
+        from process_split import attach_to_radio_process
+        attach_to_radio_process(Config)
+    
+    # Avvia bridge (runtime a thread o asyncio)
+    if Config.BRIDGE_RUNTIME == 'asyncio':
+        from async_bridge import AsyncMeshtasticBridge
+        bridge = AsyncMeshtasticBridge()
+    else:
+        bridge = MeshtasticBridge()
+    bridge.takeover = '--takeover' in sys.argv[1:]
     bridge.start()
 
 if __name__ == "__main__":
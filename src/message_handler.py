@@ -9,156 +9,446 @@ import subprocess
 import threading
 import time
 import requests
+from collections import OrderedDict
 from datetime import datetime
 
+from node_db import NodeDatabase, parse_node_id
+from conversation_store import ConversationStore
+from rules_engine import RulesEngine
+from reply_cache import ReplyCache
+from rate_limiter import RateLimiter, ALLOW, THROTTLE_NOTIFY, THROTTLE_GLOBAL
+from tracing import Tracer, WEBHOOK_END, DEQUEUED
+from telemetry_store import TelemetryStore
+from send_pacer import SendPacer
+from webhook_dispatcher import load_webhook_targets
+from bridge_logging import get_logger
+
+logger = get_logger("queue")
+n8n_logger = get_logger("n8n")
+
+# Nodi di cui si ricorda la risposta attesa da n8n (per il drenaggio)
+MAX_AWAITING_REPLIES = 1024
+
+def build_cli_command(config, to_node, message, cli_args=None):
+    """Costruisce il comando CLI Meshtastic per inviare un messaggio"""
+    # Converti formato indirizzo (0x433df694 → !433df694)
+    if to_node.startswith('0x'):
+        cli_address = '!' + to_node[2:]
+    else:
+        cli_address = to_node
+    
+    return [
+        "meshtastic", 
+        *(cli_args or ["--port", config.SERIAL_PORT]), 
+        "--dest", cli_address, 
+        "--sendtext", message
+    ]
+
+def send_via_cli(config, to_node, message, cli_args=None):
+    """Invia singolo messaggio tramite CLI Meshtastic"""
+    try:
+        cmd = build_cli_command(config, to_node, message, cli_args)
+        
+        logger.debug("🚀 Comando CLI: %s", ' '.join(cmd))
+        
+        result = subprocess.run(
+            cmd, 
+            capture_output=True, 
+            text=True, 
+            timeout=config.CLI_TIMEOUT
+        )
+        
+        if result.returncode == 0:
+            logger.debug("📤 CLI output: %s", result.stdout)
+            return True
+        else:
+            logger.error("❌ CLI errore: %s", result.stderr)
+            return False
+            
+    except subprocess.TimeoutExpired:
+        logger.warning("⏰ CLI timeout (%ss)", config.CLI_TIMEOUT)
+        return False
+    except FileNotFoundError:
+        logger.error("❌ CLI non trovato: Assicurati che 'meshtastic' sia installato")
+        return False
+    except Exception as e:
+        logger.error("❌ CLI errore generico: %s", e)
+        return False
+
 class MessageHandler:
     """Gestisce l'invio e ricezione di messaggi"""
     
     def __init__(self, config):
         self.config = config
-        self.message_queue = queue.Queue()
-        self.queue_lock = threading.Lock()
         
-    def send_to_n8n(self, message_data):
-        """Invia messaggio a n8n tramite webhook"""
+        # Una coda e un lock di invio per ogni radio, nessuno stato condiviso tra radio
+        self.gateways = [name for name, _ in config.get_radios()]
+        self.primary_gateway = self.gateways[0]
+        self.queues = {name: queue.Queue() for name in self.gateways}
+        self.queue_locks = {name: threading.Lock() for name in self.gateways}
+        self.message_queue = self.queues[self.primary_gateway]
+        self.queue_lock = self.queue_locks[self.primary_gateway]
+        # Invii sospesi finché la radio non è connessa (vedi on_link_state)
+        self.link_up = {name: threading.Event() for name in self.gateways}
+        self.node_db = NodeDatabase(config)
+        self.conversations = ConversationStore(config)
+        self.rules = RulesEngine(config)
+        self.reply_cache = ReplyCache(config)
+        self.rate_limiter = RateLimiter(config)
+        self.tracer = Tracer(config)
+        # Webhook a cui inoltrare i messaggi ricevuti (il dispatcher dipende dal runtime)
+        self.webhook_targets = load_webhook_targets(config)
+        self.telemetry = TelemetryStore(config, self.node_db)
+        self.alert_webhook_url = config.TELEMETRY_ALERT_WEBHOOK_URL or config.WEBHOOK_URL
+        # Ritardo tra invii adattato all'occupazione del canale di ogni radio
+        self.pacer = SendPacer(config)
+        
+        # Arresto ordinato: fine dei cicli di invio, drenaggio in corso,
+        # messaggi in invio per radio e risposte ancora attese da n8n
+        self.stop_event = threading.Event()
+        self.draining = threading.Event()
+        self.sending = {name: 0 for name in self.gateways}
+        self.awaiting_reply = OrderedDict()
+        self.awaiting_lock = threading.Lock()
+    
+    def build_webhook_payload(self, message_data):
+        """Arricchisce il messaggio con i dati del nodo mittente"""
+        payload = dict(message_data)
+        record = self.node_db.get(message_data.get('from', ''))
+        if record is not None:
+            payload['from_name'] = record.long_name
+            payload['from_short_name'] = record.short_name
+            payload['from_snr'] = record.snr
+            payload['from_rssi'] = record.rssi
+            payload['from_hops'] = record.hops
+        if self.conversations.enabled:
+            payload['history'] = self.conversations.get_history(message_data.get('from', ''))
+        return payload
+        
+    def route_message(self, message_data):
+        """Applica rate limiting, regole e cache al messaggio ricevuto.
+        
+        Ritorna '' per inviarlo ai webhook configurati, l'URL dedicato di
+        una regola "webhook" (sostituisce quello dell'assistente), oppure
+        None se il messaggio è stato gestito localmente (risposta o scarto).
+        """
+        verdict = self.rate_limiter.check(message_data['from'])
+        if verdict == THROTTLE_GLOBAL:
+            logger.warning("🚦 Limite globale di messaggi raggiunto, scartato messaggio da %s", message_data['from'])
+            return None
+        if verdict != ALLOW:
+            logger.warning("🚦 Troppi messaggi da %s, scartato", message_data['from'])
+            if verdict == THROTTLE_NOTIFY:
+                self.queue_message(message_data['from'], self.config.RATE_LIMIT_REPLY)
+            return None
+        
+        rule = self.rules.match(message_data)
+        if rule is None:
+            # Risposta già nota per questa domanda?
+            cached_parts = self.reply_cache.lookup(message_data)
+            if cached_parts is None:
+                return ''  # Webhook configurati (WEBHOOK_URL o WEBHOOKS_FILE)
+            logger.info("⚡ Risposta dalla cache")
+            self.conversations.record(message_data['from'], 'user', message_data['text'])
+            for part in cached_parts:
+                self.queue_message(message_data['from'], part)
+            return None
+        
+        logger.info("📜 Regola '%s' → %s", rule.name, rule.action)
+        if rule.action == 'webhook':
+            return rule.webhook_url
+        if rule.action == 'reply':
+            long_name, short_name = self.node_db.get_node_name(message_data['from'])
+            reply = self.rules.render_reply(rule, message_data, {
+                'from_name': long_name or message_data['from'],
+                'from_short_name': short_name or '',
+                'queue_size': self.get_queue_status()['queue_size'],
+                'nodes': len(self.node_db.nodes)
+            })
+            self.queue_message(message_data['from'], reply)
+        return None
+        
+    def prepare_webhook_call(self, message_data):
+        """Prepara il payload per n8n e registra il messaggio in ingresso"""
+        payload = self.build_webhook_payload(message_data)
+        self.conversations.record(message_data['from'], 'user', message_data['text'])
+        self.reply_cache.note_inbound(message_data)
+        return payload
+    
+    def report_webhook_result(self, message_data, status_code, response_text=''):
+        """Mostra l'esito di una chiamata al webhook n8n"""
+        self.tracer.mark(message_data, WEBHOOK_END)
+        if status_code == 200:
+            n8n_logger.info("✅ Inviato a n8n: %s", message_data['text'])
+        else:
+            self.tracer.finish(message_data, 'webhook_error')
+            self._forget_reply(message_data['from'])
+            n8n_logger.error("❌ Errore n8n: HTTP %s", status_code)
+            n8n_logger.debug("   Risposta: %s", response_text)
+    
+    def report_webhook_error(self, message_data, target_name, error):
+        """Mostra un errore di rete nella chiamata al webhook n8n"""
+        n8n_logger.error("❌ Errore invio a n8n (%s): %s", target_name, error)
+        self.tracer.finish(message_data, 'webhook_error')
+        self._forget_reply(message_data['from'])
+    
+    # === Risposte attese (drenaggio) ===
+    
+    def _node_key(self, node):
+        try:
+            return parse_node_id(node)
+        except (ValueError, TypeError):
+            return node
+    
+    def expect_reply(self, message_data):
+        """Il messaggio è andato all'assistente: n8n potrebbe rispondere"""
+        key = self._node_key(message_data['from'])
+        with self.awaiting_lock:
+            self.awaiting_reply.pop(key, None)
+            self.awaiting_reply[key] = time.monotonic()
+            while len(self.awaiting_reply) > MAX_AWAITING_REPLIES:
+                self.awaiting_reply.popitem(last=False)
+    
+    def _forget_reply(self, node):
+        with self.awaiting_lock:
+            self.awaiting_reply.pop(self._node_key(node), None)
+    
+    def awaiting_replies(self, max_age):
+        """Numero di risposte attese da n8n per messaggi degli ultimi max_age secondi"""
+        limit = time.monotonic() - max_age
+        with self.awaiting_lock:
+            return sum(1 for started in self.awaiting_reply.values() if started >= limit)
+    
+    def accepts_while_draining(self, to_node):
+        """Durante il drenaggio si accettano solo le risposte a messaggi già inoltrati"""
+        with self.awaiting_lock:
+            return self._node_key(to_node) in self.awaiting_reply
+        
+    def report_alert_result(self, alert, status_code):
+        """Mostra l'esito dell'invio di un allarme di telemetria"""
+        if status_code == 200:
+            n8n_logger.info("✅ Allarme inviato a n8n: %s da %s", alert['rule'], alert['from'])
+        else:
+            n8n_logger.error("❌ Errore invio allarme a n8n: HTTP %s", status_code)
+            self.telemetry.alert_failed(alert)
+    
+    def send_alert(self, alert):
+        """Invia un allarme di telemetria al webhook n8n"""
         try:
             response = requests.post(
-                self.config.WEBHOOK_URL, 
-                json=message_data, 
+                self.alert_webhook_url,
+                json=alert,
                 timeout=self.config.HTTP_TIMEOUT
             )
-            
-            if response.status_code == 200:
-                print(f"✅ Inviato a n8n: {message_data['text']}")
-            else:
-                print(f"❌ Errore n8n: HTTP {response.status_code}")
-                if self.config.ENABLE_DEBUG:
-                    print(f"   Risposta: {response.text}")
-                    
-        except requests.exceptions.Timeout:
-            print(f"⏰ Timeout connessione n8n ({self.config.HTTP_TIMEOUT}s)")
-        except requests.exceptions.ConnectionError:
-            print(f"❌ Errore connessione n8n: Impossibile raggiungere {self.config.WEBHOOK_URL}")
+            self.report_alert_result(alert, response.status_code)
         except requests.exceptions.RequestException as e:
-            print(f"❌ Errore richiesta n8n: {e}")
-        except Exception as e:
-            print(f"❌ Errore generico invio n8n: {e}")
+            n8n_logger.error("❌ Errore invio allarme a n8n: %s", e)
+            self.telemetry.alert_failed(alert)
+    
+    def resolve_gateway(self, to_node, gateway=None):
+        """Sceglie la radio per un messaggio: quella indicata, altrimenti
+        quella da cui il destinatario è stato sentito per ultimo"""
+        if gateway in self.queues:
+            return gateway
+        last_heard = self.node_db.get_gateway(to_node)
+        if last_heard in self.queues:
+            return last_heard
+        return self.primary_gateway
     
-    def queue_message(self, to_node, message):
+    def queue_message(self, to_node, message, gateway=None):
         """Aggiunge messaggio alla coda di invio"""
         try:
-            self.message_queue.put({
+            gateway = self.resolve_gateway(to_node, gateway)
+            self.queues[gateway].put({
                 'to': to_node, 
                 'message': message,
-                'timestamp': datetime.now().isoformat()
+                'gateway': gateway,
+                'timestamp': datetime.now().isoformat(),
+                'trace': self.tracer.claim_reply(to_node)
             })
-            print(f"📤 Messaggio aggiunto alla coda: {message} → {to_node}")
+            self.conversations.record(to_node, 'assistant', message)
+            self._forget_reply(to_node)
+            logger.info("📤 Messaggio aggiunto alla coda: %s → %s (via %s)", message, to_node, gateway)
             return True
         except Exception as e:
-            print(f"❌ Errore aggiunta coda: {e}")
+            logger.error("❌ Errore aggiunta coda: %s", e)
             return False
     
-    def process_queue(self):
+    def drain_queue(self, gateway=None):
+        """Estrae tutti i messaggi attualmente in coda per la radio"""
+        message_queue = self.queues[gateway or self.primary_gateway]
+        messages = []
+        while not message_queue.empty():
+            try:
+                messages.append(message_queue.get_nowait())
+            except queue.Empty:
+                break
+        if self.tracer.enabled:
+            for msg in messages:
+                self.tracer.mark_trace(msg.get('trace'), DEQUEUED)
+        return messages
+    
+    def pending_sends(self, connected_only=False):
+        """Messaggi ancora da inviare: in coda o nel gruppo in invio
+        (connected_only: solo sulle radio connesse, le uniche che possono svuotarsi)"""
+        return sum(
+            self.queues[name].qsize() + self.sending[name]
+            for name in self.gateways
+            if not connected_only or self.link_up[name].is_set()
+        )
+    
+    def take_pending(self):
+        """Estrae tutte le code per consegnarle a un altro processo (handoff)"""
+        pending = []
+        for gateway in self.gateways:
+            for msg in self.drain_queue(gateway):
+                self.tracer.finish_trace(msg.get('trace'), 'handed_off')
+                pending.append({key: value for key, value in msg.items() if key != 'trace'})
+        return pending
+    
+    def restore_pending(self, messages):
+        """Rimette in testa alle code i messaggi ricevuti dal processo precedente"""
+        restored = {name: [] for name in self.gateways}
+        for msg in messages:
+            gateway = self.resolve_gateway(msg['to'], msg.get('gateway'))
+            restored[gateway].append(dict(msg, gateway=gateway, trace=None))
+        for gateway, items in restored.items():
+            if items:
+                self._put_front(gateway, items)
+                logger.info("📥 %s messaggi ricevuti dal processo precedente (%s)", len(items), gateway)
+    
+    def _put_front(self, gateway, messages):
+        """Rimette i messaggi in coda prima di quelli già presenti"""
+        message_queue = self.queues[gateway]
+        newer = []
+        while not message_queue.empty():
+            try:
+                newer.append(message_queue.get_nowait())
+            except queue.Empty:
+                break
+        for msg in messages + newer:
+            message_queue.put(msg)
+    
+    def stop(self):
+        """Ferma i cicli di invio dopo il gruppo di messaggi in corso"""
+        self.stop_event.set()
+    
+    def on_link_state(self, gateway, old_state, new_state):
+        """Notifica del supervisore di connessione: sospende o riprende gli invii"""
+        link_up = self.link_up.get(gateway)
+        if link_up is None:
+            return
+        if new_state == 'up':
+            link_up.set()
+            if self.queues[gateway].qsize():
+                logger.info("▶️ Invii ripresi su %s (%s in coda)", gateway, self.queues[gateway].qsize())
+        else:
+            link_up.clear()
+            if old_state == 'up':
+                logger.info("⏸️ Invii sospesi su %s: radio non connessa", gateway)
+    
+    def process_queue(self, gateway=None):
         """Processa periodicamente la coda dei messaggi da inviare"""
-        print("📦 Sistema coda messaggi avviato")
+        gateway = gateway or self.primary_gateway
+        logger.info("📦 Sistema coda messaggi avviato (%s)", gateway)
         
-        while True:
+        while not self.stop_event.is_set():
             try:
-                # Controlla se ci sono messaggi da inviare
-                if not self.message_queue.empty():
-                    # Raccogli tutti i messaggi nella coda
-                    messages_to_send = []
-                    while not self.message_queue.empty():
-                        try:
-                            msg = self.message_queue.get_nowait()
-                            messages_to_send.append(msg)
-                        except queue.Empty:
-                            break
-                    
-                    if messages_to_send:
-                        print(f"📦 Elaborazione {len(messages_to_send)} messaggi dalla coda...")
-                        self._send_queued_messages(messages_to_send)
+                # Radio non connessa: i messaggi restano in coda
+                if not self.link_up[gateway].is_set():
+                    self.link_up[gateway].wait(self.config.QUEUE_PROCESS_INTERVAL)
+                    continue
+                
+                # Raccogli tutti i messaggi nella coda
+                messages_to_send = self.drain_queue(gateway)
+                if messages_to_send:
+                    logger.info("📦 Elaborazione %s messaggi dalla coda (%s)...", len(messages_to_send), gateway)
+                    self.sending[gateway] = len(messages_to_send)
+                    try:
+                        self._send_queued_messages(messages_to_send, gateway)
+                    finally:
+                        self.sending[gateway] = 0
                 
                 # Aspetta prima del prossimo controllo
-                time.sleep(self.config.QUEUE_PROCESS_INTERVAL)
+                self.stop_event.wait(self.config.QUEUE_PROCESS_INTERVAL)
                 
             except Exception as e:
-                print(f"❌ Errore nel processamento coda: {e}")
-                time.sleep(5)  # Pausa più lunga in caso di errore
+                logger.error("❌ Errore nel processamento coda: %s", e)
+                self.stop_event.wait(5)  # Pausa più lunga in caso di errore
+        
+        logger.info("📦 Sistema coda messaggi fermato (%s)", gateway)
     
-    def _send_queued_messages(self, messages):
-        """Invia lista di messaggi utilizzando il CLI Meshtastic"""
+    def _send_queued_messages(self, messages, gateway=None):
+        """Invia lista di messaggi (diretto se il transport lo supporta, altrimenti CLI Meshtastic)"""
         from serial_manager import SerialManager
         
-        # Ottieni riferimento al serial manager (shared instance)
-        serial_manager = SerialManager.get_instance()
+        # Ottieni riferimento al serial manager della radio
+        gateway = gateway or self.primary_gateway
+        serial_manager = SerialManager.get_instance(gateway)
         
-        with self.queue_lock:
+        with self.queue_locks[gateway]:
+            if serial_manager and serial_manager.supports_direct_send():
+                # TCP/loopback: nessuna chiusura della connessione
+                for index, msg in enumerate(messages):
+                    if self.stop_requested(messages, index, gateway):
+                        return
+                    success = serial_manager.send_text(msg['to'], msg['message'])
+                    self.report_send_result(msg, success)
+                    time.sleep(self.pacer.next_delay(gateway))
+                return
+            
+            cli_args = serial_manager.cli_args() if serial_manager else None
+            
             # Chiudi temporaneamente connessione seriale
             if serial_manager:
                 serial_manager.disconnect_for_cli()
             
             # Invia tutti i messaggi
-            for msg in messages:
-                success = self._send_message_via_cli(msg['to'], msg['message'])
-                if success:
-                    print(f"✅ Inviato: {msg['message']} → {msg['to']}")
-                else:
-                    print(f"❌ Fallito: {msg['message']} → {msg['to']}")
-                time.sleep(self.config.MESSAGE_DELAY)
+            for index, msg in enumerate(messages):
+                if self.stop_requested(messages, index, gateway):
+                    break
+                success = self._send_message_via_cli(msg['to'], msg['message'], cli_args)
+                self.report_send_result(msg, success)
+                if index + 1 < len(messages):
+                    time.sleep(self.pacer.cli_delay(gateway))
             
             # Riapri connessione seriale
             time.sleep(1)  # Pausa di sicurezza
             if serial_manager:
                 serial_manager.reconnect_after_cli()
     
-    def _send_message_via_cli(self, to_node, message):
-        """Invia singolo messaggio tramite CLI Meshtastic"""
-        try:
-            # Converti formato indirizzo (0x433df694 → !433df694)
-            if to_node.startswith('0x'):
-                cli_address = '!' + to_node[2:]
-            else:
-                cli_address = to_node
-            
-            cmd = [
-                "meshtastic", 
-                "--port", self.config.SERIAL_PORT, 
-                "--dest", cli_address, 
-                "--sendtext", message
-            ]
-            
-            if self.config.ENABLE_DEBUG:
-                print(f"🚀 Comando CLI: {' '.join(cmd)}")
-            
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                timeout=self.config.CLI_TIMEOUT
-            )
-            
-            if result.returncode == 0:
-                if self.config.ENABLE_DEBUG:
-                    print(f"📤 CLI output: {result.stdout}")
-                return True
-            else:
-                print(f"❌ CLI errore: {result.stderr}")
-                return False
-                
-        except subprocess.TimeoutExpired:
-            print(f"⏰ CLI timeout ({self.config.CLI_TIMEOUT}s)")
-            return False
-        except FileNotFoundError:
-            print(f"❌ CLI non trovato: Assicurati che 'meshtastic' sia installato")
-            return False
-        except Exception as e:
-            print(f"❌ CLI errore generico: {e}")
+    def stop_requested(self, messages, index, gateway):
+        """Con l'arresto richiesto il resto del gruppo torna in coda (es. per l'handoff)"""
+        if not self.stop_event.is_set():
             return False
+        if index < len(messages):
+            self._put_front(gateway, messages[index:])
+        return True
+    
+    def report_send_result(self, msg, success):
+        """Mostra l'esito dell'invio di un messaggio"""
+        self.tracer.finish_trace(msg.get('trace'), 'sent' if success else 'send_failed')
+        if success:
+            logger.info("✅ Inviato: %s → %s", msg['message'], msg['to'])
+        else:
+            logger.error("❌ Fallito: %s → %s", msg['message'], msg['to'])
+    
+    def build_cli_command(self, to_node, message, cli_args=None):
+        """Costruisce il comando CLI Meshtastic per inviare un messaggio"""
+        return build_cli_command(self.config, to_node, message, cli_args)
+    
+    def _send_message_via_cli(self, to_node, message, cli_args=None):
+        """Invia singolo messaggio tramite CLI Meshtastic"""
+        return send_via_cli(self.config, to_node, message, cli_args)
     
     def get_queue_status(self):
         """Ritorna statistiche sulla coda"""
+        queue_size = sum(q.qsize() for q in self.queues.values())
         return {
-            "queue_size": self.message_queue.qsize(),
-            "queue_empty": self.message_queue.empty()
+            "queue_size": queue_size,
+            "queue_empty": queue_size == 0,
+            "gateways": {name: q.qsize() for name, q in self.queues.items()},
+            "paused": [name for name, event in self.link_up.items() if not event.is_set()],
+            "sending": sum(self.sending.values()),
+            "pacing": self.pacer.get_status(self.gateways)
         }
\ No newline at end of file
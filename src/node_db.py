@@ -0,0 +1,321 @@
+"""
+Node Database per tenere traccia dei nodi Meshtastic
+visti dal bridge (nome, ultimo contatto, segnale, posizione)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from bridge_logging import get_logger
+
+logger = get_logger("nodes")
+
+# Pattern per le linee di log del firmware Meshtastic
+RE_FROM = re.compile(r'\b(?:from|fr)=(0x[0-9a-fA-F]+)')
+RE_SNR = re.compile(r'rxSNR=(-?[\d.]+)')
+RE_RSSI = re.compile(r'rxRSSI=(-?\d+)')
+RE_HOP_LIMIT = re.compile(r'HopLim=(\d+)')
+RE_HOP_START = re.compile(r'hopStart=(\d+)')
+RE_USER = re.compile(r'user !([0-9a-fA-F]{1,8})/([^/]*)/([^/,]*)')
+RE_POSITION = re.compile(r'POSITION node=(?:0x)?([0-9a-fA-F]+).*?\blat=(-?\d+) lon=(-?\d+)(?: msl=(-?\d+))?')
+RE_UPDATE_NODE = re.compile(r'Update DB node (0x[0-9a-fA-F]+)')
+
+
+def parse_node_id(node_id):
+    """Converte un ID nodo (0x433df694, !433df694, 1128134292) in numero"""
+    if isinstance(node_id, int):
+        return node_id
+    node_id = str(node_id).strip()
+    if node_id.startswith('!'):
+        return int(node_id[1:], 16)
+    if node_id.lower().startswith('0x'):
+        return int(node_id, 16)
+    return int(node_id)
+
+
+def format_node_id(node_num):
+    """Converte un numero nodo nel formato esadecimale usato nei payload"""
+    return f"0x{node_num:08x}"
+
+
+class NodeRecord:
+    """Record compatto di un nodo Meshtastic"""
+
+    __slots__ = ('num', 'long_name', 'short_name', 'last_heard',
+                 'snr', 'rssi', 'hops', 'lat', 'lon', 'alt', 'gateway')
+
+    def __init__(self, num):
+        self.num = num
+        self.long_name = None
+        self.short_name = None
+        self.last_heard = 0
+        self.snr = None
+        self.rssi = None
+        self.hops = None
+        self.lat = None
+        self.lon = None
+        self.alt = None
+        self.gateway = None
+
+    def to_dict(self):
+        """Ritorna il record come dizionario serializzabile"""
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data['id'] = format_node_id(self.num)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Ricostruisce un record da dizionario"""
+        record = cls(int(data['num']))
+        for slot in cls.__slots__[1:]:
+            if slot in data:
+                setattr(record, slot, data[slot])
+        return record
+
+
+class NodeDatabase:
+    """Tabella in memoria dei nodi, indicizzata per numero nodo"""
+
+    def __init__(self, config):
+        self.config = config
+        self.nodes = {}
+        self.lock = threading.Lock()
+        self.path = getattr(config, 'NODE_DB_PATH', '')
+        self.flush_interval = getattr(config, 'NODE_DB_FLUSH_INTERVAL', 30.0)
+
+        # Stato per la persistenza incrementale
+        self._dirty = set()
+        self._journal_lines = 0
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+        # Un solo scrittore del file alla volta: un'aggiunta durante os.replace
+        # della compattazione finirebbe nel file sostituito
+        self._write_lock = threading.RLock()
+
+        self._load()
+
+    def configure(self, config):
+        """Solo l'intervallo di salvataggio; NODE_DB_PATH vale all'avvio"""
+        self.flush_interval = getattr(config, 'NODE_DB_FLUSH_INTERVAL', 30.0)
+
+    def _get_or_create(self, num):
+        record = self.nodes.get(num)
+        if record is None:
+            record = NodeRecord(num)
+            self.nodes[num] = record
+        return record
+
+    def ingest_line(self, line, gateway=None):
+        """Aggiorna la tabella a partire da una linea di log del firmware.
+
+        gateway è il nome della radio che ha ricevuto la linea.
+        """
+        if 'Received from' in line or 'rxSNR=' in line:
+            self._ingest_packet_metadata(line, gateway)
+        elif 'user !' in line:
+            self._ingest_user(line)
+        elif 'POSITION node=' in line:
+            self._ingest_position(line)
+        elif 'Update DB node' in line:
+            match = RE_UPDATE_NODE.search(line)
+            if match:
+                self.touch(int(match.group(1), 16), gateway)
+
+    def _ingest_packet_metadata(self, line, gateway=None):
+        from_match = RE_FROM.search(line)
+        if not from_match:
+            return
+        num = int(from_match.group(1), 16)
+        snr = RE_SNR.search(line)
+        rssi = RE_RSSI.search(line)
+        hop_limit = RE_HOP_LIMIT.search(line)
+        hop_start = RE_HOP_START.search(line)
+
+        hops = None
+        if hop_limit and hop_start:
+            hops = max(0, int(hop_start.group(1)) - int(hop_limit.group(1)))
+
+        with self.lock:
+            record = self._get_or_create(num)
+            record.last_heard = int(time.time())
+            if snr:
+                record.snr = float(snr.group(1))
+            if rssi:
+                record.rssi = int(rssi.group(1))
+            if hops is not None:
+                record.hops = hops
+            if gateway:
+                record.gateway = gateway
+            self._dirty.add(num)
+
+    def _ingest_user(self, line):
+        match = RE_USER.search(line)
+        if not match:
+            return
+        num = int(match.group(1), 16)
+        with self.lock:
+            record = self._get_or_create(num)
+            record.long_name = match.group(2).strip() or record.long_name
+            record.short_name = match.group(3).strip() or record.short_name
+            self._dirty.add(num)
+
+    def _ingest_position(self, line):
+        match = RE_POSITION.search(line)
+        if not match:
+            return
+        num = int(match.group(1), 16)
+        lat_i = int(match.group(2))
+        lon_i = int(match.group(3))
+        # Il firmware logga lat=0 lon=0 quando non ha fix GPS
+        if lat_i == 0 and lon_i == 0:
+            return
+        with self.lock:
+            record = self._get_or_create(num)
+            record.lat = lat_i / 1e7
+            record.lon = lon_i / 1e7
+            if match.group(4) is not None:
+                record.alt = int(match.group(4))
+            self._dirty.add(num)
+
+    def touch(self, node_id, gateway=None):
+        """Aggiorna l'ultimo contatto di un nodo"""
+        num = parse_node_id(node_id)
+        with self.lock:
+            record = self._get_or_create(num)
+            record.last_heard = int(time.time())
+            if gateway:
+                record.gateway = gateway
+            self._dirty.add(num)
+        return record
+
+    def ingest_message(self, message_data):
+        """Registra il mittente di un messaggio di testo ricevuto"""
+        try:
+            self.touch(message_data['from'], message_data.get('gateway'))
+        except (KeyError, ValueError):
+            pass
+
+    def get(self, node_id):
+        """Ritorna il record di un nodo o None"""
+        try:
+            return self.nodes.get(parse_node_id(node_id))
+        except ValueError:
+            return None
+
+    def get_gateway(self, node_id):
+        """Ritorna la radio da cui il nodo è stato sentito per ultimo"""
+        record = self.get(node_id)
+        return record.gateway if record is not None else None
+
+    def get_node_name(self, node_id):
+        """Ritorna (long_name, short_name) del nodo, se conosciuti"""
+        record = self.get(node_id)
+        if record is None:
+            return None, None
+        return record.long_name, record.short_name
+
+    def find_by_short_name(self, short_name):
+        """Ritorna il numero del nodo con quel nome breve, se unico"""
+        with self.lock:
+            matches = [num for num, record in self.nodes.items() if record.short_name == short_name]
+        return matches[0] if len(matches) == 1 else None
+
+    def to_list(self):
+        """Ritorna tutti i nodi, ordinati per ultimo contatto"""
+        with self.lock:
+            records = [record.to_dict() for record in self.nodes.values()]
+        records.sort(key=lambda r: r['last_heard'] or 0, reverse=True)
+        return records
+
+    def get_status(self):
+        """Ritorna statistiche sulla tabella nodi"""
+        return {
+            "nodes": len(self.nodes),
+            "pending_writes": len(self._dirty),
+            "persistence": bool(self.path)
+        }
+
+    # === Persistenza incrementale ===
+
+    def _load(self):
+        """Carica il journal dei nodi da disco"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = NodeRecord.from_dict(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self.nodes[record.num] = record
+                    self._journal_lines += 1
+            logger.info("📇 Caricati %s nodi da %s", len(self.nodes), self.path)
+        except OSError as e:
+            logger.error("❌ Errore caricamento database nodi: %s", e)
+
+    def flush(self):
+        """Scrive su disco solo i record modificati dall'ultimo flush"""
+        if not self.path:
+            return
+        with self._write_lock:
+            with self.lock:
+                if not self._dirty:
+                    return
+                lines = [json.dumps(self.nodes[num].to_dict(), separators=(',', ':'))
+                         for num in self._dirty if num in self.nodes]
+                self._dirty.clear()
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+                self._journal_lines += len(lines)
+            except OSError as e:
+                logger.error("❌ Errore scrittura database nodi: %s", e)
+                return
+
+            # Compatta il journal quando contiene troppe versioni obsolete
+            if self._journal_lines > 4 * max(len(self.nodes), 64):
+                self.compact()
+
+    def compact(self):
+        """Riscrive il journal con un solo record per nodo"""
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with self._write_lock:
+            with self.lock:
+                lines = [json.dumps(record.to_dict(), separators=(',', ':'))
+                         for record in self.nodes.values()]
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + ('\n' if lines else ''))
+                os.replace(tmp_path, self.path)
+                self._journal_lines = len(lines)
+            except OSError as e:
+                logger.error("❌ Errore compattazione database nodi: %s", e)
+
+    def start(self):
+        """Avvia il thread di persistenza periodica"""
+        if not self.path or self._flush_thread:
+            return
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """Ferma la persistenza e scrive le modifiche pendenti (dopo l'ultimo
+        flush periodico, per non sovrapporsi a una compattazione)"""
+        self._stop_event.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
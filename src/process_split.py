@@ -0,0 +1,456 @@
+"""
+Process Split: bridge su due processi (PROCESS_MODE=split).
+
+Il processo radio apre le radio, legge le linee e invia i messaggi; non
+analizza nulla e non serve HTTP, così un picco di lavoro (JSON, log di
+debug, richieste HTTP) non ritarda la lettura della porta. Tutto il resto
+gira nel processo worker: il bridge di sempre (runtime a thread o asyncio)
+con le radio configurate come ipc://<nome> (vedi transports.IPCTransport).
+
+I due processi comunicano su un socketpair Unix con frame a lunghezza
+prefissata (4 byte big-endian + JSON):
+
+    radio → worker   {"op": "hello", "radios": {"radio0": true}}     all'avvio del worker
+                     {"op": "lines", "radio": "radio0", "lines": [...]}
+                     {"op": "link", "radio": "radio0", "up": true, "status": {...}}
+                     {"op": "sent", "id": 7, "ok": true}
+    worker → radio   {"op": "send", "id": 7, "radio": "radio0", "to": 1128134292, "text": "..."}
+
+Se il worker non tiene il passo le linee restano in un buffer limitato
+(IPC_BUFFER_LINES, si scartano le più vecchie): la lettura delle radio non
+si ferma mai. Se il worker termina, il processo radio lo riavvia dopo
+WORKER_RESTART_DELAY secondi e gli consegna le linee rimaste nel buffer.
+Solo Linux/macOS.
+"""
+
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+from collections import deque
+
+from serial_manager import SerialManager
+from message_handler import send_via_cli
+from node_db import format_node_id
+from transports import RemoteRadio
+from bridge_logging import get_logger
+
+logger = get_logger("ipc")
+
+IPC_FD_ENV = "BRIDGE_IPC_FD"
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+# Stato delle radio inviato al worker anche senza cambiamenti (per /status)
+STATUS_INTERVAL = 5.0
+# Con il CLI la porta resta chiusa finché arrivano altri invii entro questo tempo
+CLI_LINGER = 2.0
+
+
+def is_supported():
+    return os.name == 'posix' and hasattr(socket, 'AF_UNIX')
+
+
+class FrameChannel:
+    """Frame JSON con lunghezza prefissata su un socket stream"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.send_lock = threading.Lock()
+
+    def send(self, *messages):
+        """Invia uno o più messaggi con una sola scrittura"""
+        data = b"".join(self._encode(message) for message in messages)
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    @staticmethod
+    def _encode(message):
+        payload = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return HEADER.pack(len(payload)) + payload
+
+    def recv(self):
+        """Prossimo messaggio; None se il canale è chiuso"""
+        header = self.reader.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        (length,) = HEADER.unpack(header)
+        if length > MAX_FRAME:
+            raise ValueError(f"frame troppo grande ({length} byte)")
+        payload = self.reader.read(length)
+        if len(payload) < length:
+            return None
+        return json.loads(payload.decode('utf-8'))
+
+    def close(self):
+        for closable in (self.reader, self.sock):
+            try:
+                closable.close()
+            except OSError:
+                pass
+
+
+def _line_frames(lines):
+    """Raggruppa le linee consecutive della stessa radio in un solo frame"""
+    frames = []
+    for name, line in lines:
+        if frames and frames[-1]["radio"] == name:
+            frames[-1]["lines"].append(line)
+        else:
+            frames.append({"op": "lines", "radio": name, "lines": [line]})
+    return frames
+
+
+class RadioProcess:
+    """Processo radio: possiede le porte, avvia il worker e lo riavvia se termina"""
+
+    def __init__(self, config):
+        self.config = config
+        self.serial_managers = [
+            SerialManager(config, name, port)
+            for name, port in config.get_radios()
+        ]
+        self.buffer_size = max(1, getattr(config, 'IPC_BUFFER_LINES', 10000))
+        self.restart_delay = getattr(config, 'WORKER_RESTART_DELAY', 2.0)
+
+        # Linee da inoltrare (buffer limitato) e messaggi di controllo (mai scartati)
+        self.lines = deque()
+        self.control = deque()
+        self.outbox_lock = threading.Lock()
+        self.outbox_ready = threading.Event()
+        self.forwarded = 0
+        self.dropped = 0
+
+        self.send_queues = {manager.name: queue.Queue() for manager in self.serial_managers}
+        self.channel = None
+        self.worker = None
+        self.worker_starts = 0
+        self.running = False
+        self.stopping = threading.Event()
+        self.supervisor_stop = threading.Event()
+
+    def run(self):
+        """Avvia radio e worker; blocca fino all'arresto"""
+        if not is_supported():
+            logger.error("❌ PROCESS_MODE=split richiede socket Unix (Linux/macOS)")
+            return
+        logger.info("🚀 Avvio processo radio (PROCESS_MODE=split)")
+        self.running = True
+        for serial_manager in self.serial_managers:
+            serial_manager.supervisor.add_listener(self._on_link_state)
+            serial_manager.connect()
+
+        targets = [(self._write_loop, ()), (self._status_loop, ())]
+        for serial_manager in self.serial_managers:
+            targets.append((serial_manager.supervisor.run, (self.supervisor_stop,)))
+            targets.append((self._read_loop, (serial_manager,)))
+            targets.append((self._send_loop, (serial_manager,)))
+        for target, args in targets:
+            threading.Thread(target=target, args=args, daemon=True).start()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_stop_signal)
+        signal.signal(signal.SIGHUP, self._forward_signal)
+
+        try:
+            while not self.stopping.is_set():
+                code = self._run_worker()
+                if not self.stopping.is_set():
+                    logger.error("❌ Worker terminato (codice %s), riavvio tra %ss", code, self.restart_delay)
+                    self.stopping.wait(self.restart_delay)
+        finally:
+            self._shutdown()
+
+    # === Radio ===
+
+    def _read_loop(self, serial_manager):
+        """Solo lettura e accodamento: nessuna analisi nel processo radio"""
+        name = serial_manager.name
+        while self.running:
+            line = serial_manager.read_line()
+            if line:
+                self._push_line(name, line)
+
+    def _push_line(self, name, line):
+        with self.outbox_lock:
+            full = len(self.lines) >= self.buffer_size
+            if full:
+                self.lines.popleft()
+                self.dropped += 1
+            self.lines.append((name, line))
+        self.outbox_ready.set()
+        if full and self.dropped % 1000 == 1:
+            logger.warning("⚠️ Worker in ritardo: buffer IPC pieno, %s linee scartate", self.dropped)
+
+    def _queue_control(self, message):
+        with self.outbox_lock:
+            self.control.append(message)
+        self.outbox_ready.set()
+
+    def _send_loop(self, serial_manager):
+        requests = self.send_queues[serial_manager.name]
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            if serial_manager.supports_direct_send():
+                self._reply(request, serial_manager.send_text(request['to'], request['text']))
+            elif not self._send_via_cli(serial_manager, request, requests):
+                break
+
+    def _send_via_cli(self, serial_manager, request, requests):
+        """Invii con il CLI Meshtastic: la porta resta chiusa finché arrivano
+        altri messaggi entro CLI_LINGER secondi. False se è richiesto l'arresto"""
+        cli_args = serial_manager.cli_args()
+        serial_manager.disconnect_for_cli()
+        try:
+            while request is not None:
+                success = send_via_cli(self.config, format_node_id(request['to']), request['text'], cli_args)
+                self._reply(request, success)
+                try:
+                    request = requests.get(timeout=CLI_LINGER)
+                except queue.Empty:
+                    return True
+            return False
+        finally:
+            self.stopping.wait(1)  # Pausa di sicurezza
+            serial_manager.reconnect_after_cli()
+
+    def _reply(self, request, success):
+        self._queue_control({"op": "sent", "id": request['id'], "ok": bool(success)})
+
+    def _link_frame(self, serial_manager):
+        return {
+            "op": "link",
+            "radio": serial_manager.name,
+            "up": serial_manager.supervisor.is_up(),
+            "status": dict(serial_manager.get_status(), ipc=self.get_status())
+        }
+
+    def _on_link_state(self, gateway, old_state, new_state):
+        serial_manager = SerialManager.get_instance(gateway)
+        if serial_manager is not None:
+            self._queue_control(self._link_frame(serial_manager))
+
+    def _status_loop(self):
+        while not self.stopping.wait(STATUS_INTERVAL):
+            for serial_manager in self.serial_managers:
+                self._queue_control(self._link_frame(serial_manager))
+
+    # === Worker ===
+
+    def _worker_env(self, fd):
+        """Il worker è un bridge normale con le radio ipc:// verso questo processo"""
+        env = dict(os.environ)
+        env.update({
+            IPC_FD_ENV: str(fd),
+            "PROCESS_MODE": "single",
+            "SERIAL_PORTS": ",".join(f"{manager.name}=ipc://{manager.name}" for manager in self.serial_managers),
+            "SERIAL_AUTODISCOVER": "false",
+            "CAPTURE_DIR": "",
+            "HANDOFF_SOCKET": "",
+            # Aprire ipc:// non costa nulla: il worker segue subito lo stato della radio
+            "RECONNECT_BACKOFF_INITIAL": "0.2",
+            "RECONNECT_INTERVAL": "1",
+        })
+        return env
+
+    def _run_worker(self):
+        """Avvia il worker e ne serve le richieste finché non termina. Ritorna il codice di uscita"""
+        parent_sock, child_sock = socket.socketpair()
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "meshtastic_bridge.py")
+        try:
+            self.worker = subprocess.Popen(
+                [sys.executable, script], env=self._worker_env(child_sock.fileno()),
+                pass_fds=[child_sock.fileno()]
+            )
+        finally:
+            child_sock.close()
+        self.worker_starts += 1
+        logger.info("👷 Worker avviato (pid %s)", self.worker.pid)
+
+        channel = FrameChannel(parent_sock)
+        try:
+            channel.send({
+                "op": "hello",
+                "radios": {manager.name: manager.supervisor.is_up() for manager in self.serial_managers}
+            })
+            with self.outbox_lock:
+                self.control.clear()  # Esiti e stati destinati al worker precedente
+            self.channel = channel
+            self.outbox_ready.set()
+            while True:
+                message = channel.recv()
+                if message is None:
+                    break
+                if message.get('op') == 'send':
+                    requests = self.send_queues.get(message.get('radio'))
+                    if requests is None:
+                        self._reply(message, False)
+                    else:
+                        requests.put(message)
+        except (OSError, ValueError) as e:
+            logger.error("❌ Errore sul canale con il worker: %s", e)
+        finally:
+            self.channel = None
+            channel.close()
+        return self.worker.wait()
+
+    def _write_loop(self):
+        """Inoltra al worker linee e messaggi di controllo, in blocco"""
+        while self.running:
+            self.outbox_ready.wait(1.0)
+            channel = self.channel
+            if channel is None:
+                self.outbox_ready.clear()
+                continue  # Worker in avvio: le linee restano nel buffer
+            with self.outbox_lock:
+                self.outbox_ready.clear()
+                control = list(self.control)
+                lines = list(self.lines)
+                self.control.clear()
+                self.lines.clear()
+            if not control and not lines:
+                continue
+            try:
+                channel.send(*control, *_line_frames(lines))
+                self.forwarded += len(lines)
+            except OSError:
+                # Worker terminato: le linee aspettano il prossimo
+                with self.outbox_lock:
+                    self.lines.extendleft(reversed(lines))
+                    while len(self.lines) > self.buffer_size:
+                        self.lines.popleft()
+                        self.dropped += 1
+
+    # === Segnali e arresto ===
+
+    def _on_stop_signal(self, signum, frame):
+        """Il worker drena (webhook, risposte, coda) mentre questo processo continua a inviare"""
+        if self.stopping.is_set():
+            return
+        logger.info("🛑 Arresto: attesa del worker...")
+        self.stopping.set()
+        self._forward_signal(signal.SIGTERM, None)
+        timeout = self.config.DRAIN_TIMEOUT + self.config.CLI_TIMEOUT + 10
+        threading.Thread(target=self._kill_worker_after, args=(timeout,), daemon=True).start()
+
+    def _forward_signal(self, signum, frame):
+        worker = self.worker
+        if worker is not None and worker.poll() is None:
+            worker.send_signal(signum)
+
+    def _kill_worker_after(self, timeout):
+        worker = self.worker
+        try:
+            worker.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.error("❌ Worker non terminato dopo %ss, terminazione forzata", timeout)
+            worker.kill()
+
+    def _shutdown(self):
+        self.running = False
+        self.stopping.set()
+        self.supervisor_stop.set()
+        self._forward_signal(signal.SIGTERM, None)
+        for requests in self.send_queues.values():
+            requests.put(None)
+        for serial_manager in self.serial_managers:
+            serial_manager.disconnect()
+        logger.info("✅ Processo radio arrestato")
+
+    def get_status(self):
+        with self.outbox_lock:
+            buffered = len(self.lines)
+        return {
+            "buffered_lines": buffered,
+            "forwarded_lines": self.forwarded,
+            "dropped_lines": self.dropped,
+            "worker_pid": self.worker.pid if self.worker else None,
+            "worker_starts": self.worker_starts
+        }
+
+
+class WorkerLink:
+    """Lato worker del canale: consegna le linee alle RemoteRadio e attende
+    l'esito degli invii dal processo radio"""
+
+    def __init__(self, sock, config):
+        self.channel = FrameChannel(sock)
+        self.config = config
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def start(self):
+        hello = self.channel.recv()
+        if not hello or hello.get('op') != 'hello':
+            raise ConnectionError("processo radio non raggiungibile")
+        for name, up in hello.get('radios', {}).items():
+            radio = RemoteRadio.get(name)
+            radio.send = self.send
+            radio.set_up(up)
+        threading.Thread(target=self._receive_loop, name="ipc", daemon=True).start()
+        logger.info("🔗 Collegato al processo radio: %s", ", ".join(hello.get('radios', {})))
+
+    def send(self, name, destination, text):
+        """Chiede l'invio al processo radio e ne attende l'esito"""
+        done = threading.Event()
+        entry = [done, False]
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            self.pending[request_id] = entry
+        try:
+            self.channel.send({"op": "send", "id": request_id, "radio": name, "to": destination, "text": text})
+            # Con il CLI: invio, attesa di altri messaggi e riapertura della porta
+            if not done.wait(self.config.CLI_TIMEOUT + CLI_LINGER + 5):
+                logger.warning("⏰ Nessun esito dal processo radio per l'invio a %s", format_node_id(destination))
+        except OSError as e:
+            logger.error("❌ Invio al processo radio fallito: %s", e)
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+        return entry[1]
+
+    def _receive_loop(self):
+        try:
+            while True:
+                message = self.channel.recv()
+                if message is None:
+                    break
+                op = message.get('op')
+                if op == 'lines':
+                    RemoteRadio.get(message['radio']).deliver(message['lines'])
+                elif op == 'link':
+                    radio = RemoteRadio.get(message['radio'])
+                    radio.status = message.get('status')
+                    radio.set_up(message.get('up', False))
+                elif op == 'sent':
+                    with self.lock:
+                        entry = self.pending.get(message.get('id'))
+                    if entry is not None:
+                        entry[1] = bool(message.get('ok'))
+                        entry[0].set()
+        except (OSError, ValueError) as e:
+            logger.error("❌ Errore sul canale con il processo radio: %s", e)
+        # Senza processo radio non si riceve né si invia: arresto ordinato
+        logger.error("❌ Processo radio non raggiungibile, arresto del worker")
+        for radio in list(RemoteRadio._radios.values()):
+            radio.set_up(False)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def attach_to_radio_process(config):
+    """Nel worker: collega le radio ipc:// al processo radio (descrittore in BRIDGE_IPC_FD)"""
+    fd = os.environ.pop(IPC_FD_ENV, None)
+    if fd is None:
+        return None
+    link = WorkerLink(socket.socket(fileno=int(fd)), config)
+    link.start()
+    return link
@@ -0,0 +1,116 @@
+"""
+Profiler a campionamento per l'endpoint di amministrazione: legge gli stack
+di tutti i thread (sys._current_frames) a intervalli regolari per un periodo
+fisso. Nessun costo quando non è in esecuzione.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+TOP_LIMIT = 30
+
+
+class SamplingProfiler:
+    """Campiona gli stack dei thread del processo per un periodo limitato"""
+
+    def __init__(self, config):
+        self.configure(config)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.result = None
+        self.started_at = None
+        self.seconds = 0
+
+    def configure(self, config):
+        """Vale dal prossimo campionamento"""
+        self.interval = config.PROFILE_INTERVAL
+        self.max_seconds = config.PROFILE_MAX_SECONDS
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds):
+        """Avvia un campionamento. Ritorna False se ce n'è già uno in corso"""
+        with self.lock:
+            if self.is_running():
+                return False
+            self.seconds = min(max(seconds, 0.1), self.max_seconds)
+            self.started_at = time.time()
+            self.result = None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        self_counts = Counter()
+        total_counts = Counter()
+        stacks = Counter()
+        thread_counts = Counter()
+        samples = 0
+
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline and not self.stop_event.is_set():
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self_counts[stack[0]] += 1
+                for function in set(stack):
+                    total_counts[function] += 1
+                stack.reverse()
+                stacks[";".join(stack)] += 1
+                thread_counts[names.get(thread_id, str(thread_id))] += 1
+            samples += 1
+            self.stop_event.wait(self.interval)
+
+        # Percentuali sul totale degli stack campionati (tutti i thread)
+        stack_samples = sum(thread_counts.values())
+
+        def top(counter):
+            return [
+                {"function": function, "samples": count,
+                 "percent": round(100.0 * count / stack_samples, 1) if stack_samples else 0}
+                for function, count in counter.most_common(TOP_LIMIT)
+            ]
+
+        self.result = {
+            "started": self.started_at,
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": samples,
+            "threads": dict(thread_counts),
+            "top_self": top(self_counts),
+            "top_cumulative": top(total_counts),
+            # Formato "folded", utilizzabile con flamegraph.pl o speedscope
+            "stacks": [f"{stack} {count}" for stack, count in stacks.most_common(TOP_LIMIT * 4)]
+        }
+
+    def get_status(self):
+        if self.is_running():
+            return {
+                "status": "running",
+                "started": self.started_at,
+                "seconds": self.seconds,
+                "remaining": round(max(0.0, self.started_at + self.seconds - time.time()), 1)
+            }
+        if self.result is None:
+            return {"status": "idle"}
+        return dict(self.result, status="done")
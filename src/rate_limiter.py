@@ -0,0 +1,127 @@
+"""
+Rate Limiter per proteggere n8n e l'AI da nodi che inviano
+troppi messaggi (token bucket per nodo + limite globale)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from node_db import parse_node_id
+
+# Esiti del controllo
+ALLOW = 'allow'
+THROTTLE_NOTIFY = 'notify'  # Primo messaggio oltre il limite: avvisa il mittente
+THROTTLE_DROP = 'drop'
+THROTTLE_GLOBAL = 'global'  # Limite complessivo superato (il nodo era nei limiti)
+
+
+class TokenBucket:
+    """Token bucket compatto"""
+
+    __slots__ = ('tokens', 'updated', 'notified')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.notified = False
+
+    def refill(self, now, rate, burst):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Limita i messaggi in ingresso per nodo e in totale"""
+
+    def __init__(self, config):
+        self.configure(config)
+
+        self.buckets = OrderedDict()
+        self.global_bucket = TokenBucket(self.global_burst, time.monotonic())
+        self.lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+        self.allowed = 0
+        self.throttled_node = 0
+        self.throttled_global = 0
+        self.notifications = 0
+
+    def configure(self, config):
+        """Applica le soglie (anche a caldo: i bucket esistenti restano)"""
+        self.config = config
+        self.enabled = getattr(config, 'RATE_LIMIT_ENABLED', False)
+        # Le soglie sono espresse in messaggi al minuto
+        self.node_rate = getattr(config, 'RATE_LIMIT_PER_MINUTE', 10) / 60.0
+        self.node_burst = getattr(config, 'RATE_LIMIT_BURST', 5)
+        self.global_rate = getattr(config, 'RATE_LIMIT_GLOBAL_PER_MINUTE', 60) / 60.0
+        self.global_burst = getattr(config, 'RATE_LIMIT_GLOBAL_BURST', 20)
+        self.max_nodes = getattr(config, 'RATE_LIMIT_MAX_NODES', 1024)
+        self.notify = getattr(config, 'RATE_LIMIT_ACTION', 'reply') == 'reply'
+
+    def check(self, node_id):
+        """Ritorna ALLOW, THROTTLE_NOTIFY, THROTTLE_DROP o THROTTLE_GLOBAL per un messaggio del nodo"""
+        if not self.enabled:
+            return ALLOW
+        try:
+            node_num = parse_node_id(node_id)
+        except ValueError:
+            return ALLOW
+
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(node_num)
+            if bucket is None:
+                bucket = TokenBucket(self.node_burst, now)
+                self.buckets[node_num] = bucket
+            else:
+                bucket.refill(now, self.node_rate, self.node_burst)
+                self.buckets.move_to_end(node_num)
+
+            if bucket.tokens < 1:
+                self.throttled_node += 1
+                self._maybe_sweep(now)
+                if self.notify and not bucket.notified:
+                    bucket.notified = True
+                    self.notifications += 1
+                    return THROTTLE_NOTIFY
+                return THROTTLE_DROP
+
+            self.global_bucket.refill(now, self.global_rate, self.global_burst)
+            if self.global_bucket.tokens < 1:
+                self.throttled_global += 1
+                self._maybe_sweep(now)
+                return THROTTLE_GLOBAL
+
+            bucket.tokens -= 1
+            bucket.notified = False
+            self.global_bucket.tokens -= 1
+            self.allowed += 1
+            self._maybe_sweep(now)
+            return ALLOW
+
+    def _maybe_sweep(self, now):
+        """Rimuove i bucket tornati pieni e limita il numero di nodi tracciati"""
+        while len(self.buckets) > self.max_nodes:
+            self.buckets.popitem(last=False)
+
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        # Un bucket pieno equivale a un nodo mai visto: si può eliminare
+        full_after = self.node_burst / self.node_rate if self.node_rate > 0 else float('inf')
+        stale = [num for num, bucket in self.buckets.items()
+                 if now - bucket.updated >= full_after]
+        for num in stale:
+            del self.buckets[num]
+
+    def get_status(self):
+        """Ritorna contatori del rate limiting"""
+        return {
+            "enabled": self.enabled,
+            "tracked_nodes": len(self.buckets),
+            "allowed": self.allowed,
+            "throttled_node": self.throttled_node,
+            "throttled_global": self.throttled_global,
+            "slow_down_replies": self.notifications
+        }
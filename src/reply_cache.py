@@ -0,0 +1,208 @@
+"""
+Reply Cache per rispondere subito alle domande ripetute
+(es. "meteo?", "chi sei?") senza un nuovo giro n8n + LLM
+
+Si impara solo dalle risposte dichiarate tali: la POST di n8n indica il
+message_id del messaggio a cui risponde ("reply_to") oppure "reply": true.
+Le altre POST verso lo stesso nodo (notifiche, allarmi) non finiscono in
+cache. Con la cronologia delle conversazioni (CONTEXT_ENABLED) la risposta
+dipende dal mittente, quindi la cache è sempre per mittente.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from node_db import parse_node_id
+
+RE_PUNCTUATION = re.compile(r'[^\w\s]+')
+RE_SPACES = re.compile(r'\s+')
+
+
+def message_key(message_id):
+    """Stessa chiave per un ID messaggio in esadecimale (0x...) o decimale"""
+    try:
+        return parse_node_id(message_id)
+    except (ValueError, TypeError):
+        return str(message_id).strip()
+
+
+def normalize_text(text):
+    """Normalizza il testo per il confronto (minuscole, senza punteggiatura)"""
+    text = RE_PUNCTUATION.sub(' ', text.casefold())
+    return RE_SPACES.sub(' ', text).strip()
+
+
+class CacheEntry:
+    """Risposta memorizzata (può essere composta da più messaggi)"""
+
+    __slots__ = ('parts', 'expires_at', 'hits')
+
+    def __init__(self, expires_at):
+        self.parts = []
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class ReplyCache:
+    """Cache LRU con TTL delle risposte AI, appresa dalle risposte di n8n"""
+
+    def __init__(self, config):
+        self.entries = OrderedDict()
+        # Messaggi inoltrati a n8n in attesa di risposta:
+        # nodo → (chiave, scadenza, voce in costruzione, message_id)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.per_sender = None
+        self.configure(config)
+
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.opt_outs = 0
+
+    def configure(self, config):
+        """Applica le impostazioni; cambiando l'ambito della cache viene svuotata"""
+        per_sender = (getattr(config, 'REPLY_CACHE_SCOPE', 'global') == 'sender'
+                      or getattr(config, 'CONTEXT_ENABLED', False))
+        if self.per_sender is not None and per_sender != self.per_sender:
+            self.clear()
+        self.config = config
+        self.enabled = getattr(config, 'REPLY_CACHE_ENABLED', False)
+        self.ttl = getattr(config, 'REPLY_CACHE_TTL', 3600)
+        self.max_entries = getattr(config, 'REPLY_CACHE_MAX_ENTRIES', 256)
+        self.per_sender = per_sender
+        self.pair_window = getattr(config, 'REPLY_CACHE_PAIR_WINDOW', 120)
+
+    def _key(self, node_num, text):
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        if self.per_sender:
+            return (node_num, normalized)
+        return normalized
+
+    def lookup(self, message_data):
+        """Ritorna la lista di risposte in cache per il messaggio, o None"""
+        if not self.enabled:
+            return None
+        try:
+            node_num = parse_node_id(message_data['from'])
+        except (KeyError, ValueError):
+            return None
+        key = self._key(node_num, message_data.get('text', ''))
+        if key is None:
+            return None
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self.entries[key]
+                entry = None
+            if entry is None or not entry.parts:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return list(entry.parts)
+
+    def note_inbound(self, message_data):
+        """Registra un messaggio inoltrato a n8n, in attesa della risposta"""
+        if not self.enabled:
+            return
+        try:
+            node_num = parse_node_id(message_data['from'])
+        except (KeyError, ValueError):
+            return
+        key = self._key(node_num, message_data.get('text', ''))
+        if key is None:
+            return
+        with self.lock:
+            self.pending[node_num] = (key, time.time() + self.pair_window, None,
+                                      message_key(message_data.get('message_id')))
+            # Pulisce le attese scadute per non far crescere la tabella
+            if len(self.pending) > 4 * self.max_entries:
+                now = time.time()
+                for num in [n for n, p in self.pending.items() if p[1] <= now]:
+                    del self.pending[num]
+
+    def learn(self, to_node, message, options=None):
+        """Associa la risposta inviata da n8n all'ultimo messaggio del nodo.
+
+        options (il corpo della POST) deve contenere "reply_to" con il
+        message_id di quel messaggio, oppure "reply": true; può contenere
+        "cache": false per non memorizzare la risposta e "cache_ttl" per una
+        durata specifica.
+        """
+        if not self.enabled:
+            return False
+        options = options or {}
+        reply_to = options.get('reply_to')
+        if reply_to is None and options.get('reply') is not True:
+            return False  # Non è una risposta (es. notifica spontanea)
+        try:
+            node_num = parse_node_id(to_node)
+        except ValueError:
+            return False
+
+        now = time.time()
+        with self.lock:
+            pending = self.pending.get(node_num)
+            if pending is None or pending[1] <= now:
+                self.pending.pop(node_num, None)
+                return False
+            key, deadline, entry, message_id = pending
+            if reply_to is not None and message_key(reply_to) != message_id:
+                return False  # Risposta a un messaggio precedente
+
+            if options.get('cache') is False:
+                self.opt_outs += 1
+                self.pending.pop(node_num, None)
+                if entry is not None:
+                    self.entries.pop(key, None)
+                return False
+
+            # Risposte in più parti: si aggiungono alla stessa voce
+            if entry is None:
+                ttl = options.get('cache_ttl', self.ttl)
+                try:
+                    ttl = float(ttl)
+                except (TypeError, ValueError):
+                    ttl = self.ttl
+                if ttl <= 0:
+                    self.opt_outs += 1
+                    self.pending.pop(node_num, None)
+                    return False
+                entry = CacheEntry(now + ttl)
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                self.pending[node_num] = (key, deadline, entry, message_id)
+                self.learned += 1
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            entry.parts.append(message)
+            return True
+
+    def clear(self):
+        """Svuota la cache"""
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+
+    def get_status(self):
+        """Ritorna statistiche della cache"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "scope": "sender" if self.per_sender else "global",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "learned": self.learned,
+            "opt_outs": self.opt_outs
+        }
@@ -0,0 +1,356 @@
+"""
+Rules Engine per instradare i messaggi ricevuti senza passare dall'AI
+(comandi come /ping, /help, mittenti da ignorare, webhook dedicati)
+
+Formato del file regole (JSON):
+{
+    "rules": [
+        {"name": "ping", "prefix": "/ping", "action": "reply", "reply": "pong {from_name}"},
+        {"name": "meteo", "keywords": ["meteo", "tempo"], "action": "webhook",
+         "webhook_url": "http://localhost:5678/webhook/meteo"},
+        {"name": "spam", "sender": ["0x1234abcd"], "action": "drop"},
+        {"name": "coord", "regex": "^\\\\d+\\\\.\\\\d+,\\\\s*\\\\d+\\\\.\\\\d+$", "action": "drop"}
+    ]
+}
+"""
+
+import json
+import os
+import re
+import string
+import threading
+import time
+from datetime import datetime
+
+from node_db import parse_node_id
+from bridge_logging import get_logger
+
+logger = get_logger("rules")
+
+VALID_ACTIONS = ('reply', 'webhook', 'drop')
+
+
+class Rule:
+    """Regola compilata (il pattern entra nella regex unica del motore)"""
+
+    __slots__ = ('index', 'name', 'senders', 'pattern', 'action', 'reply', 'webhook_url')
+
+    def __init__(self, index, data):
+        self.index = index
+        self.name = data.get('name', f"rule_{index}")
+        self.action = data.get('action', 'drop')
+        self.reply = data.get('reply', '')
+        self.webhook_url = data.get('webhook_url', '')
+
+        if self.action not in VALID_ACTIONS:
+            raise ValueError(f"regola '{self.name}': azione '{self.action}' non valida")
+        if self.action == 'reply' and not self.reply:
+            raise ValueError(f"regola '{self.name}': manca il testo 'reply'")
+        if self.action == 'reply':
+            try:
+                check_template(self.reply)
+            except ValueError as e:
+                raise ValueError(f"regola '{self.name}': template 'reply' non valido ({e})") from None
+        if self.action == 'webhook' and not self.webhook_url:
+            raise ValueError(f"regola '{self.name}': manca 'webhook_url'")
+
+        # Gruppi della regex rinominati r<indice>_...: restano validi nella regex unica
+        self.senders, self.pattern = build_conditions(data, group_prefix=f"r{index}_")
+        if not self.senders and self.pattern is None:
+            raise ValueError(f"regola '{self.name}': nessuna condizione")
+
+
+def check_template(template):
+    """Valida un template di risposta: solo campi per nome, es. {from_name}"""
+    for _, field, _, _ in string.Formatter().parse(template):  # ValueError se malformato
+        if field is None:
+            continue
+        if not field or field.isdigit():
+            raise ValueError("campi posizionali non ammessi")
+        if not re.fullmatch(r"\w+", field):
+            raise ValueError(f"campo '{field}' non valido")
+
+
+def compile_rules(rules):
+    """Regex unica a passata singola: ogni regola è un'alternativa con gruppo
+    nominato r<indice>, nell'ordine di priorità. None se non ci sono regole"""
+    if not rules:
+        return None
+    return re.compile('|'.join(f"(?P<r{rule.index}>{rule.pattern or ''})" for rule in rules), re.DOTALL)
+
+
+# Flag globali a inizio regex, es. (?i) o (?im)
+_LEADING_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+def _scope_flags(regex):
+    """Trasforma i flag globali iniziali (?i)... in un gruppo (?i:...): la regex
+    finisce dentro un lookahead, dove i flag globali non sono ammessi"""
+    flags = ''
+    match = _LEADING_FLAGS.match(regex)
+    while match:
+        flags += match.group(1)
+        regex = regex[match.end():]
+        match = _LEADING_FLAGS.match(regex)
+    return f"(?{flags}:{regex})" if flags else f"(?:{regex})"
+
+
+def _rename_groups(regex, prefix):
+    """Rinomina i gruppi della regex con un prefisso per la regex unica: (...)
+    diventa (?P<prefix>g1...), (?P<nome>...) diventa (?P<prefixnome>...) e i
+    riferimenti (\\1, (?P=nome), (?(1)...)) seguono. Così i numeri dei gruppi
+    non dipendono dalle regole precedenti"""
+    names = {}  # numero del gruppo → nuovo nome
+    out = []
+    i = 0
+    length = len(regex)
+
+    def group_name(ref):
+        if ref.isdigit():
+            return names[int(ref)]
+        return prefix + ref
+
+    while i < length:
+        char = regex[i]
+        if char == '\\':
+            # \N o \NN è un riferimento al gruppo; \0 e tre cifre ottali no
+            reference = re.match(r"[1-9][0-9]?", regex[i + 1:i + 3])
+            if reference and not re.match(r"[0-7]{3}", regex[i + 1:i + 4]):
+                out.append(f"(?P={names[int(reference.group())]})")
+                i += 1 + len(reference.group())
+            else:
+                out.append(regex[i:i + 2])
+                i += 2
+        elif char == '[':
+            # Classe di caratteri: copiata così com'è (un ] iniziale è letterale)
+            end = i + 1
+            if regex[end:end + 1] == '^':
+                end += 1
+            if regex[end:end + 1] == ']':
+                end += 1
+            while end < length and regex[end] != ']':
+                end += 2 if regex[end] == '\\' else 1
+            out.append(regex[i:end + 1])
+            i = end + 1
+        elif char == '(' and regex.startswith('(?P<', i):
+            end = regex.index('>', i)
+            name = regex[i + 4:end]
+            names[len(names) + 1] = prefix + name
+            out.append(f"(?P<{prefix}{name}>")
+            i = end + 1
+        elif char == '(' and regex.startswith('(?P=', i):
+            end = regex.index(')', i)
+            out.append(f"(?P={group_name(regex[i + 4:end])})")
+            i = end + 1
+        elif char == '(' and regex.startswith('(?(', i):
+            end = regex.index(')', i + 3)
+            out.append(f"(?({group_name(regex[i + 3:end])})")
+            i = end + 1
+        elif char == '(' and not regex.startswith('(?', i):
+            name = f"{prefix}g{len(names) + 1}"
+            names[len(names) + 1] = name
+            out.append(f"(?P<{name}>")
+            i += 1
+        else:
+            out.append(char)
+            i += 1
+    return ''.join(out)
+
+
+def build_conditions(data, group_prefix=None):
+    """Mittenti e condizione sul testo (lookahead da ancorare a inizio messaggio).
+    Con group_prefix i gruppi della regex vengono rinominati (vedi _rename_groups)"""
+    senders = data.get('sender') or []
+    if isinstance(senders, str):
+        senders = [senders]
+    senders = frozenset(parse_node_id(s) for s in senders)
+
+    conditions = []
+    prefix = data.get('prefix')
+    if prefix:
+        conditions.append(f"(?=(?i:{re.escape(prefix)}))")
+    keywords = data.get('keywords')
+    if keywords:
+        alternatives = '|'.join(re.escape(k) for k in keywords)
+        # Non \\b: le parole chiave possono iniziare o finire con punteggiatura (!help, ?)
+        conditions.append(fr"(?=.*?(?i:(?<!\w)(?:{alternatives})(?!\w)))")
+    regex = data.get('regex')
+    if regex:
+        re.compile(regex)  # Valida subito per un errore più chiaro (anche flag non iniziali)
+        if group_prefix:
+            regex = _rename_groups(regex, group_prefix)
+        conditions.append(f"(?=.*?{_scope_flags(regex)})")
+    return senders, ''.join(conditions) if conditions else None
+
+
+class MessageFilter:
+    """Filtro su un messaggio con le stesse condizioni delle regole
+    (sender, prefix, keywords, regex) più la radio di arrivo (gateway)"""
+
+    __slots__ = ('senders', 'pattern', 'gateways')
+
+    def __init__(self, data):
+        senders, pattern = build_conditions(data)
+        self.senders = senders
+        self.pattern = re.compile(pattern, re.DOTALL) if pattern else None
+        gateways = data.get('gateway') or []
+        self.gateways = frozenset([gateways] if isinstance(gateways, str) else gateways)
+
+    def matches(self, message_data):
+        if self.gateways and message_data.get('gateway') not in self.gateways:
+            return False
+        if self.senders:
+            try:
+                if parse_node_id(message_data.get('from', '')) not in self.senders:
+                    return False
+            except ValueError:
+                return False
+        return self.pattern is None or self.pattern.match(message_data.get('text', '')) is not None
+
+
+class RulesEngine:
+    """Motore regole compilato in un'unica regex a passata singola
+    (più una per ogni mittente con regole dedicate)"""
+
+    def __init__(self, config):
+        self.config = config
+        self.path = getattr(config, 'RULES_FILE', '')
+        self.reload_interval = getattr(config, 'RULES_RELOAD_INTERVAL', 5.0)
+        # Controllo del file in match(); il runtime asyncio lo fa da un executor
+        self.auto_reload = True
+
+        self.rules = []
+        self.global_matcher = None
+        self.sender_matchers = {}
+
+        self.lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0
+        self.hits = {}
+
+        self.reload()
+
+    def configure(self, config):
+        """Applica le impostazioni e rilegge subito il file (anche se non è cambiato)"""
+        with self.lock:
+            self.config = config
+            self.path = getattr(config, 'RULES_FILE', '')
+            self.reload_interval = getattr(config, 'RULES_RELOAD_INTERVAL', 5.0)
+            self._mtime = None
+        if not self.path and self.rules:
+            self._install([])
+        self.reload()
+
+    def reload(self):
+        """Ricarica le regole dal file se è cambiato. Ritorna True se ricaricate"""
+        self._last_check = time.monotonic()
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if self.rules:
+                logger.warning("⚠️ File regole %s non trovato, regole disattivate", self.path)
+                self._install([])
+            self._mtime = None
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            rule_list = data.get('rules', []) if isinstance(data, dict) else data
+            rules = [Rule(i, rule_data) for i, rule_data in enumerate(rule_list)]
+            self._install(rules)
+            self._mtime = mtime
+            logger.info("📜 Caricate %s regole da %s", len(rules), self.path)
+            return True
+        except (OSError, ValueError, re.error) as e:
+            # Mantiene le regole precedenti se il nuovo file non è valido
+            logger.error("❌ Errore caricamento regole: %s", e)
+            self._mtime = mtime
+            return False
+
+    def _install(self, rules):
+        """Compila le regole e le sostituisce in modo atomico"""
+        sender_rules = {}
+        for rule in rules:
+            for sender in rule.senders:
+                sender_rules.setdefault(sender, []).append(rule)
+        global_matcher = compile_rules([r for r in rules if not r.senders])
+        sender_matchers = {sender: compile_rules(sender_list) for sender, sender_list in sender_rules.items()}
+
+        with self.lock:
+            self.rules = rules
+            self.global_matcher = global_matcher
+            self.sender_matchers = sender_matchers
+            self.hits = {rule.name: 0 for rule in rules}
+
+    def match(self, message_data):
+        """Ritorna la prima regola che corrisponde al messaggio, o None"""
+        if self.auto_reload and self.path and time.monotonic() - self._last_check >= self.reload_interval:
+            self.reload()
+
+        # Regole e regex dello stesso caricamento
+        with self.lock:
+            rules = self.rules
+            global_matcher = self.global_matcher
+            sender_matchers = self.sender_matchers
+            hits = self.hits
+        if global_matcher is None and not sender_matchers:
+            return None
+
+        text = message_data.get('text', '')
+        best = None
+
+        # La prima alternativa che corrisponde è la regola con priorità più alta
+        if global_matcher is not None:
+            match = global_matcher.match(text)
+            if match:
+                best = rules[int(match.lastgroup[1:])]
+
+        if sender_matchers:
+            try:
+                sender = parse_node_id(message_data.get('from', ''))
+            except ValueError:
+                sender = None
+            sender_matcher = sender_matchers.get(sender)
+            match = sender_matcher.match(text) if sender_matcher is not None else None
+            if match:
+                rule = rules[int(match.lastgroup[1:])]
+                if best is None or rule.index < best.index:
+                    best = rule
+
+        if best is not None:
+            hits[best.name] = hits.get(best.name, 0) + 1
+        return best
+
+    def render_reply(self, rule, message_data, extra=None):
+        """Compila il template di risposta di una regola"""
+        values = _TemplateValues(message_data)
+        values['time'] = datetime.now().strftime("%H:%M:%S")
+        values['rule'] = rule.name
+        if extra:
+            values.update(extra)
+        try:
+            return rule.reply.format_map(values)
+        except (ValueError, TypeError) as e:
+            # Template validato al caricamento: resta solo un formato incompatibile ({from:d})
+            logger.error("❌ Template della regola '%s' non applicabile: %s", rule.name, e)
+            return rule.reply
+
+    def get_status(self):
+        """Ritorna statistiche sulle regole"""
+        return {
+            "file": self.path,
+            "rules": len(self.rules),
+            "hits": dict(self.hits)
+        }
+
+
+class _TemplateValues(dict):
+    """Dizionario per i template: le chiavi mancanti restano vuote"""
+
+    def __missing__(self, key):
+        return ''
@@ -0,0 +1,166 @@
+"""
+Send Pacer: ritardo tra invii consecutivi adattato all'occupazione del canale.
+
+Il firmware riporta periodicamente channel_utilization (percentuale di tempo
+in cui il canale è occupato, da chiunque) e air_util_tx (percentuale di tempo
+in trasmissione del nodo nell'ultima ora). Con il canale tranquillo il
+bridge invia più in fretta di MESSAGE_DELAY; oltre PACING_BUSY_UTIL il
+ritardo raddoppia ogni PACING_BACKOFF_STEP punti percentuali, fino a
+PACING_MAX_DELAY. Senza dati recenti si usa MESSAGE_DELAY.
+
+Fonti, per radio:
+    Send: air_util_tx=0.5, channel_utilization=12.3, ...      (nodo locale, seriale)
+    TELEMETRY node=433df694 channel_utilization=12.3 ...       (TCP; locale se è my_node_num)
+    (Received from Bob): air_util_tx=..., channel_utilization=...   (vicini)
+I valori del nodo locale prevalgono; quelli dei vicini servono finché il
+nodo locale non ne riporta.
+
+Con l'invio tramite CLI la porta seriale è chiusa per tutto il gruppo: lì
+il ritardo non supera MESSAGE_DELAY e dopo l'ultimo messaggio non si attende.
+"""
+
+import re
+import threading
+import time
+
+from telemetry_store import RE_TELEMETRY_NODE
+
+RE_CHANNEL_UTIL = re.compile(r'\bchannel_utilization=(-?[\d.]+)')
+RE_AIR_UTIL_TX = re.compile(r'\bair_util_tx=(-?[\d.]+)')
+RE_MY_NODE = re.compile(r'my_node_num=(?:0x)?([0-9a-fA-F]+)')
+
+# Peso del nuovo campione nella media mobile esponenziale
+EWMA_WEIGHT = 0.5
+# Ritardo minimo da cui parte il backoff con canale occupato (anche con MESSAGE_DELAY=0)
+BUSY_MIN_DELAY = 1.0
+
+
+class ChannelState:
+    """Occupazione del canale vista da una radio"""
+
+    __slots__ = ('my_node', 'local_util', 'local_tx', 'local_at',
+                 'neighbor_util', 'neighbor_at')
+
+    def __init__(self):
+        self.my_node = None
+        self.local_util = None
+        self.local_tx = None
+        self.local_at = 0
+        self.neighbor_util = None
+        self.neighbor_at = 0
+
+
+def _ewma(previous, value):
+    return value if previous is None else previous + EWMA_WEIGHT * (value - previous)
+
+
+class SendPacer:
+    """Calcola il ritardo tra invii per ogni radio"""
+
+    def __init__(self, config):
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.configure(config)
+
+    def configure(self, config):
+        """Applica le soglie; lo stato dei canali resta"""
+        self.enabled = getattr(config, 'PACING_ENABLED', False)
+        self.base_delay = config.MESSAGE_DELAY
+        self.min_delay = min(getattr(config, 'PACING_MIN_DELAY', 0.2), self.base_delay)
+        self.max_delay = max(getattr(config, 'PACING_MAX_DELAY', 10.0), self.base_delay)
+        self.quiet_util = getattr(config, 'PACING_QUIET_UTIL', 10.0)
+        self.busy_util = max(getattr(config, 'PACING_BUSY_UTIL', 25.0), self.quiet_util)
+        self.backoff_step = max(getattr(config, 'PACING_BACKOFF_STEP', 10.0), 1.0)
+        self.max_air_util_tx = getattr(config, 'PACING_MAX_AIR_UTIL_TX', 7.5)
+        self.stale_after = getattr(config, 'PACING_STALE_SECONDS', 1800)
+
+    def _channel(self, gateway):
+        channel = self.channels.get(gateway)
+        if channel is None:
+            channel = ChannelState()
+            self.channels[gateway] = channel
+        return channel
+
+    def ingest_line(self, line, gateway):
+        """Aggiorna lo stato del canale da una linea del firmware"""
+        if not self.enabled:
+            return
+        if 'my_node_num=' in line:
+            match = RE_MY_NODE.search(line)
+            if match:
+                with self.lock:
+                    self._channel(gateway).my_node = int(match.group(1), 16)
+            return
+        if 'channel_utilization=' not in line:
+            return
+        util = RE_CHANNEL_UTIL.search(line)
+        air_tx = RE_AIR_UTIL_TX.search(line)
+        if util is None:
+            return
+
+        with self.lock:
+            channel = self._channel(gateway)
+            local = 'Send:' in line
+            node = RE_TELEMETRY_NODE.search(line)
+            if node is not None and channel.my_node is not None:
+                local = int(node.group(1), 16) == channel.my_node
+            now = time.monotonic()
+            if local:
+                channel.local_util = _ewma(channel.local_util, float(util.group(1)))
+                if air_tx is not None:
+                    channel.local_tx = float(air_tx.group(1))
+                channel.local_at = now
+            else:
+                channel.neighbor_util = _ewma(channel.neighbor_util, float(util.group(1)))
+                channel.neighbor_at = now
+
+    def next_delay(self, gateway):
+        """Ritardo da attendere dopo un invio sulla radio"""
+        if not self.enabled:
+            return self.base_delay
+        with self.lock:
+            return self._decide(self._channel(gateway), time.monotonic())[0]
+
+    def cli_delay(self, gateway):
+        """Ritardo tra invii con il CLI: la porta resta chiusa durante l'attesa
+        (nessuna linea letta), quindi al massimo MESSAGE_DELAY. Ogni invio con
+        il CLI dura già qualche secondo"""
+        return min(self.next_delay(gateway), self.base_delay)
+
+    def _decide(self, channel, now):
+        local_fresh = channel.local_util is not None and now - channel.local_at < self.stale_after
+        if local_fresh:
+            util = channel.local_util
+            if channel.local_tx is not None and channel.local_tx >= self.max_air_util_tx:
+                # Il nodo ha già trasmesso troppo nell'ultima ora
+                return self.max_delay, 'airtime'
+        elif channel.neighbor_util is not None and now - channel.neighbor_at < self.stale_after:
+            util = channel.neighbor_util
+        else:
+            return self.base_delay, 'fixed'
+
+        if util <= self.quiet_util:
+            return self.min_delay, 'quiet'
+        if util <= self.busy_util:
+            fraction = (util - self.quiet_util) / max(self.busy_util - self.quiet_util, 1e-6)
+            return self.min_delay + fraction * (self.base_delay - self.min_delay), 'normal'
+        delay = max(self.base_delay, BUSY_MIN_DELAY) * 2 ** ((util - self.busy_util) / self.backoff_step)
+        return min(delay, self.max_delay), 'busy'
+
+    def get_status(self, gateways):
+        """Decisione di pacing corrente per radio"""
+        now = time.monotonic()
+        with self.lock:
+            status = {}
+            for gateway in gateways:
+                channel = self._channel(gateway)
+                delay, mode = self._decide(channel, now) if self.enabled else (self.base_delay, 'fixed')
+                status[gateway] = {
+                    "mode": mode,
+                    "delay": round(delay, 3),
+                    "channel_utilization": round(channel.local_util, 2) if channel.local_util is not None else None,
+                    "air_util_tx": channel.local_tx,
+                    "neighbor_channel_utilization": round(channel.neighbor_util, 2) if channel.neighbor_util is not None else None,
+                    "local_age": round(now - channel.local_at, 1) if channel.local_util is not None else None
+                }
+            return status
@@ -3,91 +3,181 @@ Serial Manager per gestire la connessione seriale
 con dispositivi Meshtastic
 """
 
-import serial
+import logging
 import time
 import threading
 
+from transports import create_transport, Transport, TransportError
+from node_db import parse_node_id
+from connection_supervisor import ConnectionSupervisor
+from capture_log import CaptureWriter
+from bridge_logging import get_logger
+
+logger = get_logger("serial")
+# Righe grezze del dispositivo (molto frequenti): categoria separata per il campionamento
+raw_logger = get_logger("serial.raw")
+
 class SerialManager:
     """Gestisce la connessione seriale con dispositivo Meshtastic"""
     
     _instance = None
+    _instances = {}
     _lock = threading.Lock()
     
-    def __init__(self, config):
+    def __init__(self, config, name=None, port=None):
         self.config = config
+        self.name = name or "radio0"
+        self.port = port or config.SERIAL_PORT
+        # Porta da configurazione (self.port può cambiare con l'autodiscover)
+        self.configured_port = self.port
         self.serial_connection = None
         self.connected = False
         self.read_lock = threading.Lock()
+        self.cli_active = False
+        self.closing = False
+        self.supervisor = ConnectionSupervisor(self, config)
         
-        # Imposta istanza singleton per accesso globale
-        SerialManager._instance = self
+        # Cattura opzionale dei byte ricevuti (per replay e debug)
+        self.capture = None
+        if config.CAPTURE_DIR:
+            self.capture = CaptureWriter(
+                config.CAPTURE_DIR, self.name,
+                config.CAPTURE_MAX_BYTES, config.CAPTURE_MAX_FILES
+            )
+        
+        # Registra l'istanza: la prima creata resta quella principale
+        with SerialManager._lock:
+            if SerialManager._instance is None or SerialManager._instance.name == self.name:
+                SerialManager._instance = self
+            SerialManager._instances[self.name] = self
+    
+    @classmethod
+    def get_instance(cls, name=None):
+        """Ritorna il SerialManager della radio indicata (default: principale)"""
+        if name is None:
+            return cls._instance
+        return cls._instances.get(name)
     
     @classmethod
-    def get_instance(cls):
-        """Ritorna l'istanza singleton del SerialManager"""
-        return cls._instance
+    def get_instances(cls):
+        """Ritorna tutti i SerialManager registrati"""
+        return list(cls._instances.values())
+    
+    def _open_transport(self):
+        """Crea e apre il transport (seriale, TCP o loopback) per la porta"""
+        transport = create_transport(self.port, self.config)
+        transport.open()
+        return transport
     
     def connect(self):
         """Stabilisce connessione seriale"""
         try:
-            print(f"🔌 Connessione a {self.config.SERIAL_PORT} @ {self.config.SERIAL_BAUDRATE} baud...")
+            logger.info("🔌 Connessione a %s @ %s baud...", self.port, self.config.SERIAL_BAUDRATE)
             
-            self.serial_connection = serial.Serial(
-                port=self.config.SERIAL_PORT,
-                baudrate=self.config.SERIAL_BAUDRATE,
-                timeout=self.config.SERIAL_TIMEOUT
-            )
+            self.closing = False
+            self.serial_connection = self._open_transport()
             
             if self.serial_connection.is_open:
                 self.connected = True
-                print(f"✅ Connessione seriale stabilita")
+                logger.info("✅ Connessione seriale stabilita")
+                self.supervisor.mark_up()
                 return True
             else:
-                print(f"❌ Impossibile aprire porta seriale")
+                logger.error("❌ Impossibile aprire porta seriale")
+                self.supervisor.report_error("porta non aperta")
                 return False
                 
-        except serial.SerialException as e:
-            print(f"❌ Errore seriale: {e}")
-            print(f"   Verifica che la porta {self.config.SERIAL_PORT} sia disponibile")
-            print(f"   e che nessun altro programma la stia utilizzando")
+        except TransportError as e:
+            logger.error("❌ Errore seriale: %s", e)
+            logger.info("   Verifica che la porta %s sia disponibile", self.port)
+            logger.info("   e che nessun altro programma la stia utilizzando")
+            logger.info("   Nuovi tentativi automatici in corso")
             self.connected = False
+            self.supervisor.report_error(e)
             return False
         except Exception as e:
-            print(f"❌ Errore generico connessione: {e}")
+            logger.error("❌ Errore generico connessione: %s", e)
             self.connected = False
+            self.supervisor.report_error(e)
             return False
     
+    def reopen(self):
+        """Chiude (se serve) e riapre il transport. Ritorna True se riuscito"""
+        with self.read_lock:
+            self._close_transport()
+            try:
+                self.serial_connection = self._open_transport()
+            except Exception as e:
+                self.supervisor.last_error = str(e)
+                logger.debug("❌ Riconnessione a %s fallita: %s", self.port, e)
+                return False
+            self.connected = self.serial_connection.is_open
+            if self.connected:
+                logger.info("🔌 Riconnesso a %s", self.port)
+            return self.connected
+    
+    def _close_transport(self):
+        """Chiude il transport ignorando gli errori (dispositivo già sparito)"""
+        connection = self.serial_connection
+        self.connected = False
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+    
+    def switch_port(self, port):
+        """Nuova porta o nuovi parametri (ricarica configurazione): chiude il
+        transport e lascia la riapertura al supervisore"""
+        with self.read_lock:
+            self.port = self.configured_port = port
+            self._close_transport()
+        logger.info("🔄 Radio %s: riapertura su %s", self.name, port)
+        self.supervisor.consecutive_failures = 0
+        self.supervisor.report_error("configurazione cambiata")
+    
+    def _link_failed(self, error):
+        """Errore di I/O: chiude la porta e lascia la riconnessione al supervisore"""
+        logger.error("❌ Errore lettura seriale (%s): %s", self.name, error)
+        self._close_transport()
+        self.supervisor.report_error(error)
+    
     def disconnect(self):
         """Chiude connessione seriale"""
+        self.closing = True
         try:
             if self.serial_connection and self.serial_connection.is_open:
                 self.serial_connection.close()
-                print("🔌 Connessione seriale chiusa")
+                logger.info("🔌 Connessione seriale chiusa")
             self.connected = False
+            if self.capture:
+                self.capture.flush()
         except Exception as e:
-            print(f"❌ Errore chiusura seriale: {e}")
+            logger.error("❌ Errore chiusura seriale: %s", e)
     
     def disconnect_for_cli(self):
         """Disconnette temporaneamente per permettere uso CLI"""
+        self.cli_active = True
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
-            print("🔌 Connessione seriale chiusa temporaneamente per CLI")
+            logger.info("🔌 Connessione seriale chiusa temporaneamente per CLI")
     
     def reconnect_after_cli(self):
-        """Riconnette dopo uso CLI"""
+        """Riconnette dopo uso CLI. Ritorna False (e avvisa il supervisore) se fallisce"""
         try:
             if not self.serial_connection or not self.serial_connection.is_open:
-                self.serial_connection = serial.Serial(
-                    port=self.config.SERIAL_PORT,
-                    baudrate=self.config.SERIAL_BAUDRATE,
-                    timeout=self.config.SERIAL_TIMEOUT
-                )
-                if self.serial_connection.is_open:
-                    print("🔌 Connessione seriale riaperta dopo CLI")
-                    return True
+                self.serial_connection = self._open_transport()
+                if not self.serial_connection.is_open:
+                    raise TransportError("porta non aperta")
+                logger.info("🔌 Connessione seriale riaperta dopo CLI")
+            return True
         except Exception as e:
-            print(f"❌ Errore riapertura seriale: {e}")
+            logger.error("❌ Errore riapertura seriale: %s", e)
+            self.connected = False
+            self.supervisor.report_error(e)
             return False
+        finally:
+            self.cli_active = False
     
     def read_line(self):
         """Legge una linea dalla connessione seriale"""
@@ -99,42 +189,108 @@ class SerialManager:
                 
                 line = self.serial_connection.readline()
                 if line:
-                    decoded_line = line.decode('utf-8', errors='ignore').strip()
-                    if self.config.ENABLE_DEBUG and decoded_line:
-                        # Mostra solo linee che contengono messaggi importanti
-                        if any(keyword in decoded_line for keyword in ['Received', 'ERROR', 'WARNING']):
-                            print(f"🔍 Serial: {decoded_line}")
-                    return decoded_line
+                    if self.capture:
+                        self.capture.write(line)
+                    return self.decode_line(line)
                 return ""
                 
-            except serial.SerialException as e:
-                if self.config.ENABLE_DEBUG:
-                    print(f"❌ Errore lettura seriale: {e}")
-                time.sleep(0.1)
+            except TransportError as e:
+                if self.cli_active or self.closing:
+                    return ""  # Porta chiusa dal CLI o in arresto
+                self._link_failed(e)
                 return ""
             except Exception as e:
-                if self.config.ENABLE_DEBUG:
-                    print(f"❌ Errore generico lettura: {e}")
+                logger.debug("❌ Errore generico lettura: %s", e)
                 time.sleep(0.1)
                 return ""
     
+    def decode_line(self, raw_line):
+        """Decodifica una linea grezza ricevuta dal dispositivo"""
+        decoded_line = raw_line.decode('utf-8', errors='ignore').strip()
+        if decoded_line and raw_logger.isEnabledFor(logging.DEBUG):
+            # Mostra solo linee che contengono messaggi importanti
+            if any(keyword in decoded_line for keyword in ['Received', 'ERROR', 'WARNING']):
+                raw_logger.debug("🔍 Serial: %s", decoded_line)
+        return decoded_line
+    
+    def fileno(self):
+        """Ritorna il file descriptor della porta (None se non disponibile)"""
+        try:
+            if self.serial_connection and self.serial_connection.is_open:
+                return self.serial_connection.fileno()
+        except Exception:
+            pass
+        return None
+    
+    def read_available(self):
+        """Legge senza bloccare i byte già disponibili sulla porta"""
+        try:
+            if not self.serial_connection or not self.serial_connection.is_open:
+                return b""
+            data = self.serial_connection.read_available()
+            if data and self.capture:
+                self.capture.write(data)
+            return data
+        except TransportError as e:
+            if not (self.cli_active or self.closing):
+                self._link_failed(e)
+            return b""
+    
+    def keepalive(self):
+        """Heartbeat del transport se dovuto (runtime asyncio: la radio può restare
+        muta a lungo e read_available non viene chiamata)"""
+        try:
+            if self.serial_connection and self.serial_connection.is_open:
+                self.serial_connection.keepalive()
+        except TransportError as e:
+            if not (self.cli_active or self.closing):
+                self._link_failed(e)
+    
+    def supports_direct_send(self):
+        """True se il transport invia messaggi senza passare dal CLI"""
+        return self.serial_connection is not None and \
+            type(self.serial_connection).send_text is not Transport.send_text
+    
+    def send_text(self, to_node, message):
+        """Invia un messaggio direttamente tramite il transport"""
+        try:
+            if not self.serial_connection or not self.serial_connection.is_open:
+                return False
+            return bool(self.serial_connection.send_text(parse_node_id(to_node), message))
+        except (TransportError, ValueError) as e:
+            logger.error("❌ Errore invio diretto: %s", e)
+            return False
+    
+    def cli_args(self):
+        """Argomenti del CLI Meshtastic per raggiungere questa radio"""
+        return create_transport(self.port, self.config).cli_args()
+    
     def is_connected(self):
         """Verifica se la connessione è attiva"""
         try:
-            return (self.serial_connection and 
+            return bool(self.serial_connection and 
                    self.serial_connection.is_open and 
-                   self.connected)
+                   self.connected and
+                   self.supervisor.is_up())
         except:
             return False
     
     def get_status(self):
         """Ritorna stato della connessione seriale"""
-        return {
+        status = {
+            "name": self.name,
             "connected": self.is_connected(),
-            "port": self.config.SERIAL_PORT,
+            "port": self.port,
             "baudrate": self.config.SERIAL_BAUDRATE,
-            "timeout": self.config.SERIAL_TIMEOUT
+            "timeout": self.config.SERIAL_TIMEOUT,
+            "link": self.supervisor.get_status(),
+            "capture": self.capture.get_status() if self.capture else None
         }
+        # Radio aperta da un altro processo (PROCESS_MODE=split): stato reale
+        remote = self.serial_connection.remote_status() if self.serial_connection else None
+        if remote is not None:
+            status["remote"] = remote
+        return status
     
     def flush_buffers(self):
         """Svuota i buffer di input e output"""
@@ -142,20 +298,19 @@ class SerialManager:
             if self.serial_connection and self.serial_connection.is_open:
                 self.serial_connection.reset_input_buffer()
                 self.serial_connection.reset_output_buffer()
-                if self.config.ENABLE_DEBUG:
-                    print("🧹 Buffer seriali svuotati")
+                logger.debug("🧹 Buffer seriali svuotati")
         except Exception as e:
-            print(f"❌ Errore svuotamento buffer: {e}")
+            logger.error("❌ Errore svuotamento buffer: %s", e)
     
     def test_connection(self):
         """Testa la connessione seriale"""
         try:
             if not self.is_connected():
-                print("❌ Test fallito: Nessuna connessione")
+                logger.error("❌ Test fallito: Nessuna connessione")
                 return False
             
             # Prova a leggere per qualche secondo per verificare che arrivino dati
-            print("🔍 Test connessione in corso...")
+            logger.info("🔍 Test connessione in corso...")
             start_time = time.time()
             lines_received = 0
             
@@ -166,13 +321,13 @@ class SerialManager:
                 time.sleep(0.1)
             
             if lines_received > 0:
-                print(f"✅ Test OK: {lines_received} linee ricevute in 5 secondi")
+                logger.info("✅ Test OK: %s linee ricevute in 5 secondi", lines_received)
                 return True
             else:
-                print("⚠️ Test dubbioso: Nessun dato ricevuto in 5 secondi")
-                print("   Verifica che il dispositivo Meshtastic sia acceso e configurato")
+                logger.warning("⚠️ Test dubbioso: Nessun dato ricevuto in 5 secondi")
+                logger.info("   Verifica che il dispositivo Meshtastic sia acceso e configurato")
                 return False
                 
         except Exception as e:
-            print(f"❌ Errore durante test: {e}")
+            logger.error("❌ Errore durante test: %s", e)
             return False
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Telemetry Store: storico di telemetria (batteria, tensione, utilizzo canale)
+e posizione per ogni nodo, in buffer circolari di dimensione fissa.
+
+Tre livelli per nodo:
+    raw    ultimi campioni così come arrivano
+    1m     medie/min/max per minuto
+    15m    medie/min/max per quarto d'ora
+Ogni livello ha un numero massimo di voci, quindi la memoria per nodo è
+costante; oltre TELEMETRY_MAX_NODES si scartano i nodi sentiti meno di recente.
+
+Le linee riconosciute sono quelle del log firmware:
+    TELEMETRY node=433df694 battery_level=87 voltage=4.01 channel_utilization=12.5 air_util_tx=1.2
+    POSITION node=433df694 l=0 lat=451234567 lon=91234567 msl=120
+    (Received from Bob): air_util_tx=1.2, channel_utilization=12.5, battery_level=87, voltage=4.01
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from node_db import parse_node_id, format_node_id, RE_POSITION
+from bridge_logging import get_logger
+
+logger = get_logger("telemetry")
+
+# Metriche aggregate con media/min/max; la posizione tiene l'ultimo valore
+METRICS = ('battery_level', 'voltage', 'channel_utilization', 'air_util_tx')
+POSITION_FIELDS = ('lat', 'lon', 'alt')
+
+RE_TELEMETRY_NODE = re.compile(r'TELEMETRY node=(?:0x)?([0-9a-fA-F]+)')
+RE_TELEMETRY_SENDER = re.compile(r'\(Received from ([^)]*)\): air_util_tx=')
+RE_METRIC = re.compile(r'\b(battery_level|voltage|channel_utilization|air_util_tx)=(-?[\d.]+)')
+RE_ALERT = re.compile(r'^\s*(\w+)\s*(<=|>=|<|>)\s*(-?[\d.]+)\s*$')
+
+# Durata dei bucket per livello (secondi); raw non è aggregato
+TIERS = (('1m', 60), ('15m', 900))
+
+
+class Bucket:
+    """Aggregato di un intervallo di tempo"""
+
+    __slots__ = ('start', 'count', 'counts', 'sums', 'mins', 'maxs', 'last')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.counts = {}
+        self.sums = {}
+        self.mins = {}
+        self.maxs = {}
+        self.last = {}
+
+    def add(self, values):
+        self.count += 1
+        for name, value in values.items():
+            if name in POSITION_FIELDS:
+                self.last[name] = value
+                continue
+            self.sums[name] = self.sums.get(name, 0.0) + value
+            self.mins[name] = min(self.mins.get(name, value), value)
+            self.maxs[name] = max(self.maxs.get(name, value), value)
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def to_dict(self):
+        data = {"ts": self.start, "count": self.count}
+        for name, total in self.sums.items():
+            data[name] = {
+                "avg": round(total / self.counts[name], 3),
+                "min": self.mins[name],
+                "max": self.maxs[name]
+            }
+        for name in POSITION_FIELDS:
+            if name in self.last:
+                data[name] = self.last[name]
+        return data
+
+
+class NodeTelemetry:
+    """Buffer circolari di un nodo: campioni grezzi e due livelli aggregati"""
+
+    __slots__ = ('raw', 'tiers', 'open_buckets', 'last_values', 'active_alerts', 'alerts_sent', 'last_update')
+
+    def __init__(self, raw_size, tier_sizes):
+        self.raw = deque(maxlen=raw_size)
+        self.tiers = {name: deque(maxlen=size) for name, size in tier_sizes.items()}
+        self.open_buckets = {}
+        self.last_values = {}
+        # Soglie attualmente superate e ultimo invio per soglia
+        self.active_alerts = set()
+        self.alerts_sent = {}
+        self.last_update = 0
+
+    def add(self, timestamp, values):
+        self.raw.append((timestamp, values))
+        self.last_values.update(values)
+        self.last_update = timestamp
+        for name, seconds in TIERS:
+            start = int(timestamp // seconds * seconds)
+            bucket = self.open_buckets.get(name)
+            if bucket is None or bucket.start != start:
+                # Il bucket precedente è completo: entra nel buffer
+                if bucket is not None:
+                    self.tiers[name].append(bucket)
+                bucket = Bucket(start)
+                self.open_buckets[name] = bucket
+            bucket.add(values)
+
+    def query(self, resolution, since, until):
+        if resolution == 'raw':
+            return [dict(values, ts=round(ts, 3)) for ts, values in self.raw if since <= ts <= until]
+        buckets = list(self.tiers[resolution])
+        if resolution in self.open_buckets:
+            buckets.append(self.open_buckets[resolution])
+        return [bucket.to_dict() for bucket in buckets if since <= bucket.start <= until]
+
+    def covers(self, resolution, since):
+        """True se il livello contiene ancora tutti i campioni successivi a since"""
+        entries = self.raw if resolution == 'raw' else self.tiers[resolution]
+        if len(entries) < entries.maxlen:
+            return True  # Nessun campione ancora scartato
+        oldest = entries[0][0] if resolution == 'raw' else entries[0].start
+        return oldest <= since
+
+
+class AlertRule:
+    """Soglia su una metrica, es. battery_level<20"""
+
+    __slots__ = ('text', 'metric', 'operator', 'threshold')
+
+    OPERATORS = {
+        '<': lambda value, threshold: value < threshold,
+        '<=': lambda value, threshold: value <= threshold,
+        '>': lambda value, threshold: value > threshold,
+        '>=': lambda value, threshold: value >= threshold
+    }
+
+    def __init__(self, metric, operator, threshold):
+        self.metric = metric
+        self.operator = operator
+        self.threshold = threshold
+        self.text = f"{metric}{operator}{threshold:g}"
+
+    def check(self, value):
+        return self.OPERATORS[self.operator](value, self.threshold)
+
+
+def parse_alert_rules(value):
+    """ "battery_level<20,channel_utilization>40" → lista di AlertRule"""
+    rules = []
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        match = RE_ALERT.match(item)
+        if not match or match.group(1) not in METRICS + POSITION_FIELDS:
+            raise ValueError(f"soglia non valida: '{item.strip()}'")
+        rules.append(AlertRule(match.group(1), match.group(2), float(match.group(3))))
+    return rules
+
+
+class TelemetryStore:
+    """Storico di telemetria e posizione per nodo, con memoria limitata (LRU)"""
+
+    def __init__(self, config, node_db=None):
+        self.node_db = node_db
+        self.raw_size = max(1, getattr(config, 'TELEMETRY_RAW_SAMPLES', 120))
+        self.tier_sizes = {
+            '1m': max(1, getattr(config, 'TELEMETRY_1M_SAMPLES', 360)),
+            '15m': max(1, getattr(config, 'TELEMETRY_15M_SAMPLES', 672))
+        }
+        self.configure(config)
+
+        # OrderedDict: il primo elemento è il nodo aggiornato meno di recente
+        self.nodes = OrderedDict()
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.evictions = 0
+        self.alerts_fired = 0
+
+    def configure(self, config):
+        """Applica soglie e limiti; le dimensioni dei buffer valgono solo all'avvio"""
+        self.config = config
+        self.enabled = getattr(config, 'TELEMETRY_ENABLED', True)
+        self.max_nodes = max(1, getattr(config, 'TELEMETRY_MAX_NODES', 256))
+        self.alert_cooldown = getattr(config, 'TELEMETRY_ALERT_COOLDOWN', 3600)
+        try:
+            self.alert_rules = parse_alert_rules(getattr(config, 'TELEMETRY_ALERTS', ''))
+        except ValueError as e:
+            logger.warning("⚠️ TELEMETRY_ALERTS ignorato: %s", e)
+            self.alert_rules = []
+
+    def ingest_line(self, line, gateway=None):
+        """Registra telemetria o posizione da una linea del firmware.
+
+        Ritorna la lista degli allarmi scattati (di solito vuota).
+        """
+        if not self.enabled:
+            return []
+        if 'TELEMETRY node=' in line:
+            match = RE_TELEMETRY_NODE.search(line)
+            num = int(match.group(1), 16) if match else None
+        elif 'air_util_tx=' in line:
+            num = self._resolve_sender(line)
+        elif 'POSITION node=' in line:
+            return self._ingest_position(line, gateway)
+        else:
+            return []
+        if num is None:
+            return []
+        values = {name: float(value) for name, value in RE_METRIC.findall(line)}
+        if not values:
+            return []
+        return self.record(num, values, gateway)
+
+    def _resolve_sender(self, line):
+        """Il firmware indica il mittente col nome breve: lo cerca nel database nodi"""
+        match = RE_TELEMETRY_SENDER.search(line)
+        if not match or self.node_db is None:
+            return None
+        return self.node_db.find_by_short_name(match.group(1).strip())
+
+    def _ingest_position(self, line, gateway):
+        match = RE_POSITION.search(line)
+        if not match:
+            return []
+        lat_i = int(match.group(2))
+        lon_i = int(match.group(3))
+        if lat_i == 0 and lon_i == 0:
+            return []
+        values = {'lat': lat_i / 1e7, 'lon': lon_i / 1e7}
+        if match.group(4) is not None:
+            values['alt'] = float(match.group(4))
+        return self.record(int(match.group(1), 16), values, gateway)
+
+    def record(self, node_id, values, gateway=None, timestamp=None):
+        """Aggiunge un campione per il nodo e ritorna gli allarmi scattati"""
+        num = parse_node_id(node_id)
+        timestamp = timestamp or time.time()
+        with self.lock:
+            node = self.nodes.get(num)
+            if node is None:
+                node = NodeTelemetry(self.raw_size, self.tier_sizes)
+                self.nodes[num] = node
+                while len(self.nodes) > self.max_nodes:
+                    self.nodes.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.nodes.move_to_end(num)
+            node.add(timestamp, values)
+            self.samples += 1
+            return self._check_alerts(num, node, values, gateway, timestamp)
+
+    def _check_alerts(self, num, node, values, gateway, now):
+        """Un allarme scatta quando la soglia viene superata (non a ogni campione),
+        e non più di una volta per TELEMETRY_ALERT_COOLDOWN secondi. Un
+        superamento soppresso dal cooldown non conta: se la soglia è ancora
+        superata a cooldown finito, l'allarme parte"""
+        alerts = []
+        for rule in self.alert_rules:
+            if rule.metric not in values:
+                continue
+            value = values[rule.metric]
+            if not rule.check(value):
+                node.active_alerts.discard(rule.text)
+                continue
+            if rule.text in node.active_alerts:
+                continue
+            if now - node.alerts_sent.get(rule.text, 0) < self.alert_cooldown:
+                continue
+            node.active_alerts.add(rule.text)
+            node.alerts_sent[rule.text] = now
+            self.alerts_fired += 1
+            alerts.append({
+                "type": "telemetry_alert",
+                "from": format_node_id(num),
+                "gateway": gateway,
+                "rule": rule.text,
+                "metric": rule.metric,
+                "value": value,
+                "threshold": rule.threshold,
+                "values": dict(node.last_values),
+                "timestamp": int(now)
+            })
+        return alerts
+
+    def alert_failed(self, alert):
+        """Invio dell'allarme non riuscito: la regola torna pronta a scattare
+        al prossimo campione oltre soglia"""
+        with self.lock:
+            node = self.nodes.get(parse_node_id(alert['from']))
+            if node is not None:
+                node.active_alerts.discard(alert['rule'])
+                node.alerts_sent.pop(alert['rule'], None)
+
+    def query(self, node_id, since=None, until=None, resolution='auto'):
+        """Campioni di un nodo in un intervallo [since, until] (epoch).
+
+        resolution 'auto' sceglie il livello più fine che copre l'intervallo.
+        Ritorna (risoluzione, campioni) oppure None se il nodo non è noto.
+        """
+        num = parse_node_id(node_id)
+        until = until if until is not None else time.time()
+        since = since if since is not None else until - 3600
+        with self.lock:
+            node = self.nodes.get(num)
+            if node is None:
+                return None
+            if resolution == 'auto':
+                resolution = next((candidate for candidate in ('raw', '1m')
+                                   if node.covers(candidate, since)), '15m')
+            return resolution, node.query(resolution, since, until)
+
+    def latest(self, node_id):
+        """Ultimi valori noti di un nodo"""
+        with self.lock:
+            node = self.nodes.get(parse_node_id(node_id))
+            return dict(node.last_values, ts=node.last_update) if node is not None else None
+
+    def get_status(self):
+        """Ritorna statistiche sullo storico di telemetria"""
+        return {
+            "enabled": self.enabled,
+            "nodes": len(self.nodes),
+            "max_nodes": self.max_nodes,
+            "samples": self.samples,
+            "evictions": self.evictions,
+            "alert_rules": [rule.text for rule in self.alert_rules],
+            "alerts_fired": self.alerts_fired
+        }
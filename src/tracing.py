@@ -0,0 +1,199 @@
+"""
+Tracing per messaggio: istanti di ogni fase del giro (arrivo, parsing,
+webhook, risposta, attesa in coda, invio) conservati in un buffer circolare
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from node_db import parse_node_id
+
+# Fasi nell'ordine in cui avvengono
+ARRIVAL = 'arrival'
+PARSED = 'parsed'
+WEBHOOK_START = 'webhook_start'
+WEBHOOK_END = 'webhook_end'
+REPLY_RECEIVED = 'reply_received'
+DEQUEUED = 'dequeued'
+SENT = 'sent'
+
+
+def _node_key(node):
+    """Stessa chiave per 0x433df694, !433df694 e 1128134292"""
+    try:
+        return parse_node_id(node)
+    except (ValueError, TypeError):
+        return node
+
+
+class Trace:
+    """Fasi di un singolo messaggio (tempi monotonic)"""
+
+    __slots__ = ('node', 'message_id', 'gateway', 'started_at', 'stages', 'outcome')
+
+    def __init__(self, node, message_id, gateway, arrival):
+        self.node = node
+        self.message_id = message_id
+        self.gateway = gateway
+        self.started_at = time.time()
+        self.stages = [(ARRIVAL, arrival)]
+        self.outcome = None
+
+    def mark(self, stage):
+        self.stages.append((stage, time.monotonic()))
+
+    def to_dict(self):
+        origin = self.stages[0][1]
+        stages = []
+        previous = origin
+        for stage, timestamp in self.stages:
+            stages.append({
+                "stage": stage,
+                "at_ms": round((timestamp - origin) * 1000, 2),
+                "delta_ms": round((timestamp - previous) * 1000, 2)
+            })
+            previous = timestamp
+        return {
+            "from": self.node,
+            "message_id": self.message_id,
+            "gateway": self.gateway,
+            "started": self.started_at,
+            "outcome": self.outcome,
+            "total_ms": round((self.stages[-1][1] - origin) * 1000, 2),
+            "stages": stages
+        }
+
+
+class Tracer:
+    """Raccoglie le tracce dei messaggi; se disattivato ogni metodo ritorna subito"""
+
+    MAX_PENDING = 1024
+
+    def __init__(self, config):
+        self.buffer = deque()
+        # Tracce in attesa di risposta, per nodo (la più vecchia per prima)
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.configure(config)
+
+    def configure(self, config):
+        """Applica le impostazioni conservando le tracce già raccolte"""
+        with self.lock:
+            self.enabled = config.TRACE_ENABLED
+            self.pending_timeout = config.TRACE_PENDING_TIMEOUT
+            size = max(1, config.TRACE_BUFFER_SIZE)
+            if self.buffer.maxlen != size:
+                self.buffer = deque(self.buffer, maxlen=size)
+
+    def begin(self, message_data, arrival):
+        """Apre la traccia di un messaggio ricevuto (arrival: time.monotonic())"""
+        if not self.enabled:
+            return
+        trace = Trace(message_data['from'], message_data.get('message_id'),
+                      message_data.get('gateway'), arrival)
+        trace.mark(PARSED)
+        key = _node_key(trace.node)
+        with self.lock:
+            self._expire(arrival)
+            self.pending.setdefault(key, []).append(trace)
+            self.pending.move_to_end(key)
+            while len(self.pending) > self.MAX_PENDING:
+                _, traces = self.pending.popitem(last=False)
+                for old in traces:
+                    self._complete(old, 'evicted')
+
+    def mark(self, message_data, stage):
+        """Registra una fase per il messaggio ancora in attesa di risposta"""
+        if not self.enabled:
+            return
+        with self.lock:
+            trace = self._find(message_data)
+            if trace is not None:
+                trace.mark(stage)
+
+    def finish(self, message_data, outcome):
+        """Chiude la traccia se nessuna risposta l'ha presa in carico"""
+        if not self.enabled:
+            return
+        with self.lock:
+            trace = self._find(message_data, remove=True)
+            if trace is not None:
+                self._complete(trace, outcome)
+
+    def claim_reply(self, to_node):
+        """Associa una risposta in uscita al messaggio più vecchio del nodo"""
+        if not self.enabled:
+            return None
+        key = _node_key(to_node)
+        with self.lock:
+            traces = self.pending.get(key)
+            if not traces:
+                return None
+            trace = traces.pop(0)
+            if not traces:
+                del self.pending[key]
+        trace.mark(REPLY_RECEIVED)
+        return trace
+
+    def mark_trace(self, trace, stage):
+        if trace is not None:
+            trace.mark(stage)
+
+    def finish_trace(self, trace, outcome):
+        if trace is not None:
+            if outcome == 'sent':
+                trace.mark(SENT)
+            with self.lock:
+                self._complete(trace, outcome)
+
+    def _find(self, message_data, remove=False):
+        key = _node_key(message_data.get('from'))
+        traces = self.pending.get(key)
+        if not traces:
+            return None
+        message_id = message_data.get('message_id')
+        for index, trace in enumerate(traces):
+            if trace.message_id == message_id:
+                if remove:
+                    del traces[index]
+                    if not traces:
+                        del self.pending[key]
+                return trace
+        return None
+
+    def _expire(self, now):
+        """Chiude le tracce rimaste senza risposta troppo a lungo"""
+        limit = now - self.pending_timeout
+        for node in list(self.pending):
+            traces = self.pending[node]
+            while traces and traces[0].stages[-1][1] < limit:
+                self._complete(traces.pop(0), 'no_reply')
+            if not traces:
+                del self.pending[node]
+
+    def _complete(self, trace, outcome):
+        trace.outcome = outcome
+        self.buffer.append(trace)
+        self.completed += 1
+
+    def recent(self, limit=50, node=None):
+        """Ultime tracce completate, dalla più recente"""
+        with self.lock:
+            traces = list(self.buffer)
+        traces.reverse()
+        if node:
+            key = _node_key(node)
+            traces = [trace for trace in traces if _node_key(trace.node) == key]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def get_status(self):
+        with self.lock:
+            pending = sum(len(traces) for traces in self.pending.values())
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self.buffer),
+            "pending": pending,
+            "completed": self.completed
+        }
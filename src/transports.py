@@ -0,0 +1,707 @@
+"""
+Transport per collegare il bridge al dispositivo Meshtastic:
+seriale (USB), TCP (API di rete sulla porta 4403) e loopback in memoria
+
+La porta configurata sceglie il transport:
+    /dev/ttyUSB0, COM3, serial:///dev/ttyUSB0  → seriale
+    tcp://192.168.1.50, tcp://meshtastic.local:4403 → TCP
+    loop://, loop://test → dispositivo finto in memoria (test e benchmark)
+    replay://captures?speed=10 → riproduzione di una cattura (vedi capture_log)
+    ipc://radio0 → radio gestita dal processo radio (PROCESS_MODE=split, vedi process_split)
+
+Tutti i transport espongono le stesse linee di testo del log del firmware
+("Received text msg from=..."), così il resto del bridge non cambia.
+"""
+
+import random
+import select
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+import serial
+
+from bridge_logging import get_logger
+
+logger = get_logger("transport")
+
+# Linee tenute da una RemoteRadio finché il worker non apre il transport
+REMOTE_PENDING_LINES = 10000
+
+class TransportError(OSError):
+    """Errore di comunicazione con il dispositivo"""
+
+
+def create_transport(port, config):
+    """Crea il transport adatto alla porta configurata"""
+    if port.startswith('tcp://'):
+        parts = urlsplit(port)
+        return TCPTransport(parts.hostname, parts.port or TCPTransport.DEFAULT_PORT,
+                            config.SERIAL_TIMEOUT)
+    if port.startswith('loop://'):
+        return LoopbackTransport(port[len('loop://'):] or 'default', config.SERIAL_TIMEOUT)
+    if port.startswith('ipc://'):
+        return IPCTransport(port[len('ipc://'):], config.SERIAL_TIMEOUT)
+    if port.startswith('replay://'):
+        parts = urlsplit(port)
+        options = parse_qs(parts.query)
+        speed = options.get('speed', ['1'])[0]
+        return ReplayTransport(parts.netloc + parts.path,
+                               0.0 if speed == 'max' else float(speed),
+                               config.SERIAL_TIMEOUT)
+    if port.startswith('serial://'):
+        port = port[len('serial://'):]
+    return SerialTransport(port, config.SERIAL_BAUDRATE, config.SERIAL_TIMEOUT)
+
+
+class Transport:
+    """Interfaccia comune dei transport (stile pyserial)"""
+
+    def open(self):
+        """Apre la connessione, solleva TransportError in caso di errore"""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    @property
+    def is_open(self):
+        raise NotImplementedError
+
+    def readline(self):
+        """Ritorna una linea (bytes) o b"" dopo il timeout"""
+        raise NotImplementedError
+
+    def read_available(self):
+        """Ritorna senza bloccare i byte di testo già disponibili"""
+        raise NotImplementedError
+
+    def fileno(self):
+        raise NotImplementedError
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def keepalive(self):
+        """Traffico periodico per i dispositivi che chiudono i client inattivi.
+        Da chiamare spesso: invia solo quando serve"""
+        pass
+
+    def send_text(self, destination, text):
+        """Invia un messaggio direttamente. Ritorna None se il transport
+        non lo supporta (in quel caso si usa il CLI Meshtastic)"""
+        return None
+
+    def cli_args(self):
+        """Argomenti del CLI Meshtastic per raggiungere il dispositivo"""
+        raise NotImplementedError
+
+    def remote_status(self):
+        """Stato della radio vera se gestita da un altro processo (None altrimenti)"""
+        return None
+
+
+class SerialTransport(Transport):
+    """Dispositivo collegato via USB/seriale"""
+
+    def __init__(self, port, baudrate, timeout):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.connection = None
+
+    def open(self):
+        try:
+            self.connection = serial.Serial(port=self.port, baudrate=self.baudrate,
+                                            timeout=self.timeout)
+        except serial.SerialException as e:
+            raise TransportError(str(e))
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+    @property
+    def is_open(self):
+        return bool(self.connection and self.connection.is_open)
+
+    def readline(self):
+        try:
+            return self.connection.readline()
+        except serial.SerialException as e:
+            raise TransportError(str(e))
+
+    def read_available(self):
+        try:
+            waiting = self.connection.in_waiting
+            return self.connection.read(waiting or 1)
+        except serial.SerialException as e:
+            raise TransportError(str(e))
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def reset_input_buffer(self):
+        self.connection.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        self.connection.reset_output_buffer()
+
+    def cli_args(self):
+        return ["--port", self.port]
+
+
+class _SocketLineTransport(Transport):
+    """Base per i transport basati su socket che producono linee di testo"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.sock = None
+        self._lines = []
+        self._text = b""
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+        self._lines = []
+        self._text = b""
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _feed(self, data):
+        """Elabora byte ricevuti e aggiunge le linee complete"""
+        self._feed_text(data)
+
+    def _feed_text(self, data):
+        self._text += data
+        while b"\n" in self._text:
+            line, self._text = self._text.split(b"\n", 1)
+            self._lines.append(line + b"\n")
+
+    def _recv(self):
+        try:
+            data = self.sock.recv(4096)
+        except socket.timeout:
+            return False
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            raise TransportError(str(e))
+        if not data:
+            raise TransportError("connessione chiusa dal dispositivo")
+        self._feed(data)
+        return True
+
+    def readline(self):
+        if self.sock is None:
+            raise TransportError("connessione non aperta")
+        deadline = time.monotonic() + self.timeout
+        while not self._lines:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return b""
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if readable:
+                self._recv()
+        return self._lines.pop(0)
+
+    def reset_input_buffer(self):
+        self._lines = []
+        self._text = b""
+
+    def read_available(self):
+        if self.sock is None:
+            raise TransportError("connessione non aperta")
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if readable:
+            self._recv()
+        data = b"".join(self._lines)
+        self._lines = []
+        return data
+
+
+def _load_protobufs():
+    """Importa i protobuf Meshtastic (forniti dal pacchetto meshtastic)"""
+    try:
+        from meshtastic.protobuf import mesh_pb2, portnums_pb2, telemetry_pb2
+    except ImportError:
+        try:
+            from meshtastic import mesh_pb2, portnums_pb2, telemetry_pb2
+        except ImportError:
+            return None
+    return mesh_pb2, portnums_pb2, telemetry_pb2
+
+
+class TCPTransport(_SocketLineTransport):
+    """Dispositivo raggiungibile in rete tramite l'API TCP Meshtastic (porta 4403).
+
+    Lo stream è fatto di frame protobuf (0x94 0xC3 + lunghezza a 16 bit);
+    i pacchetti vengono convertiti nelle stesse linee del log seriale.
+    """
+
+    DEFAULT_PORT = 4403
+    START1 = 0x94
+    START2 = 0xC3
+    MAX_FRAME = 512
+    HEARTBEAT_INTERVAL = 300
+
+    def __init__(self, host, port, timeout):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self._frame = b""
+        self._last_tx = 0
+        self._write_lock = threading.Lock()
+        self._pb = None
+
+    def open(self):
+        self._pb = _load_protobufs()
+        if self._pb is None:
+            raise TransportError("il transport TCP richiede il pacchetto 'meshtastic' (pip install meshtastic)")
+        mesh_pb2 = self._pb[0]
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise TransportError(f"impossibile connettersi a {self.host}:{self.port}: {e}")
+        self.sock.settimeout(self.timeout)
+        self._frame = b""
+        # Chiede al dispositivo di iniziare a trasmettere (config + pacchetti)
+        to_radio = mesh_pb2.ToRadio()
+        to_radio.want_config_id = random.randint(1, 0xFFFFFFFF)
+        self._write(to_radio)
+
+    def _write(self, to_radio):
+        data = to_radio.SerializeToString()
+        header = bytes([self.START1, self.START2, (len(data) >> 8) & 0xFF, len(data) & 0xFF])
+        with self._write_lock:
+            try:
+                self.sock.sendall(header + data)
+            except OSError as e:
+                raise TransportError(str(e))
+            self._last_tx = time.monotonic()
+
+    def readline(self):
+        self.keepalive()
+        return super().readline()
+
+    def read_available(self):
+        self.keepalive()
+        return super().read_available()
+
+    def keepalive(self):
+        """Il firmware chiude i client TCP inattivi: invia un heartbeat periodico"""
+        if self.sock is None or time.monotonic() - self._last_tx < self.HEARTBEAT_INTERVAL:
+            return
+        mesh_pb2 = self._pb[0]
+        to_radio = mesh_pb2.ToRadio()
+        if 'heartbeat' in mesh_pb2.ToRadio.DESCRIPTOR.fields_by_name:
+            to_radio.heartbeat.SetInParent()
+            self._write(to_radio)
+        else:
+            self._last_tx = time.monotonic()
+
+    def _feed(self, data):
+        """Separa i frame protobuf dal testo di debug eventualmente presente"""
+        buffer = self._frame + data
+        while buffer:
+            if buffer[0] != self.START1:
+                next_start = buffer.find(bytes([self.START1]))
+                if next_start == -1:
+                    self._feed_text(buffer)
+                    buffer = b""
+                    break
+                self._feed_text(buffer[:next_start])
+                buffer = buffer[next_start:]
+                continue
+            if len(buffer) < 4:
+                break
+            length = (buffer[2] << 8) | buffer[3]
+            if buffer[1] != self.START2 or length > self.MAX_FRAME:
+                self._feed_text(buffer[:1])
+                buffer = buffer[1:]
+                continue
+            if len(buffer) < 4 + length:
+                break
+            self._handle_frame(buffer[4:4 + length])
+            buffer = buffer[4 + length:]
+        self._frame = buffer
+
+    def _handle_frame(self, frame):
+        mesh_pb2 = self._pb[0]
+        from_radio = mesh_pb2.FromRadio()
+        try:
+            from_radio.ParseFromString(frame)
+        except Exception:
+            return
+        for line in describe_from_radio(from_radio, self._pb):
+            self._lines.append(line.encode('utf-8') + b"\n")
+
+    def send_text(self, destination, text):
+        mesh_pb2, portnums_pb2 = self._pb[0], self._pb[1]
+        to_radio = mesh_pb2.ToRadio()
+        packet = to_radio.packet
+        packet.to = destination
+        packet.id = random.randint(1, 0xFFFFFFFF)
+        packet.want_ack = True
+        packet.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+        packet.decoded.payload = text.encode('utf-8')
+        self._write(to_radio)
+        return True
+
+    def cli_args(self):
+        host = self.host if self.port == self.DEFAULT_PORT else f"{self.host}:{self.port}"
+        return ["--host", host]
+
+
+def describe_from_radio(from_radio, protobufs):
+    """Converte un messaggio FromRadio nelle linee equivalenti del log firmware"""
+    mesh_pb2, portnums_pb2, telemetry_pb2 = protobufs
+    kind = from_radio.WhichOneof('payload_variant')
+
+    if kind == 'log_record':
+        return [from_radio.log_record.message]
+
+    if kind == 'node_info':
+        info = from_radio.node_info
+        lines = []
+        if info.HasField('user'):
+            lines.append(f"NodeInfo user !{info.num:08x}/{info.user.long_name}/{info.user.short_name}")
+        if info.HasField('position') and (info.position.latitude_i or info.position.longitude_i):
+            lines.append(f"POSITION node={info.num:08x} l=0 lat={info.position.latitude_i} "
+                         f"lon={info.position.longitude_i} msl={info.position.altitude}")
+        if info.HasField('device_metrics'):
+            lines.append(_describe_device_metrics(info.num, info.device_metrics))
+        return lines
+
+    if kind == 'my_info':
+        return [f"MyNodeInfo my_node_num=0x{from_radio.my_info.my_node_num:08x}"]
+
+    if kind != 'packet':
+        return []
+
+    packet = from_radio.packet
+    if packet.WhichOneof('payload_variant') != 'decoded':
+        return []  # Pacchetto cifrato per un canale che non conosciamo
+    decoded = packet.decoded
+    sender = getattr(packet, 'from')
+    lines = [
+        f"(Received from RadioIf): (id=0x{packet.id:08x} fr=0x{sender:08x} to=0x{packet.to:08x}, "
+        f"HopLim={packet.hop_limit} Ch=0x{packet.channel:x} Portnum={decoded.portnum} "
+        f"rxtime={packet.rx_time} rxSNR={packet.rx_snr:g} rxRSSI={packet.rx_rssi} "
+        f"hopStart={getattr(packet, 'hop_start', packet.hop_limit)})"
+    ]
+
+    if decoded.portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
+        text = decoded.payload.decode('utf-8', errors='replace').replace('\n', ' ')
+        lines.append(f"Received text msg from=0x{sender:08x}, id=0x{packet.id:08x}, msg={text}")
+    elif decoded.portnum == portnums_pb2.PortNum.NODEINFO_APP:
+        user = mesh_pb2.User()
+        try:
+            user.ParseFromString(decoded.payload)
+            lines.append(f"NodeInfo user !{sender:08x}/{user.long_name}/{user.short_name}")
+        except Exception:
+            pass
+    elif decoded.portnum == portnums_pb2.PortNum.POSITION_APP:
+        position = mesh_pb2.Position()
+        try:
+            position.ParseFromString(decoded.payload)
+            lines.append(f"POSITION node={sender:08x} l=0 lat={position.latitude_i} "
+                         f"lon={position.longitude_i} msl={position.altitude}")
+        except Exception:
+            pass
+    elif decoded.portnum == portnums_pb2.PortNum.TELEMETRY_APP:
+        telemetry = telemetry_pb2.Telemetry()
+        try:
+            telemetry.ParseFromString(decoded.payload)
+        except Exception:
+            return lines
+        if telemetry.WhichOneof('variant') == 'device_metrics':
+            lines.append(_describe_device_metrics(sender, telemetry.device_metrics))
+    return lines
+
+
+def _describe_device_metrics(node_num, metrics):
+    return (f"TELEMETRY node={node_num:08x} battery_level={metrics.battery_level} "
+            f"voltage={metrics.voltage:.3f} channel_utilization={metrics.channel_utilization:.2f} "
+            f"air_util_tx={metrics.air_util_tx:.3f}")
+
+
+class LoopbackDevice:
+    """Dispositivo finto in memoria: si iniettano linee e si leggono gli invii"""
+
+    _devices = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.sent = []
+        self.on_send = None
+        self._transport = None
+        self._pending = []
+        self.plugged = True
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name='default'):
+        """Ritorna (creandolo se serve) il dispositivo finto con questo nome"""
+        with cls._registry_lock:
+            device = cls._devices.get(name)
+            if device is None:
+                device = cls(name)
+                cls._devices[name] = device
+            return device
+
+    def inject(self, line):
+        """Simula una linea di log emessa dal firmware"""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        with self.lock:
+            transport = self._transport
+            if transport is None:
+                self._pending.append(line)
+                return
+        transport._deliver(line)
+
+    def unplug(self):
+        """Simula la disconnessione del dispositivo (cavo USB staccato)"""
+        with self.lock:
+            self.plugged = False
+            transport, self._transport = self._transport, None
+        if transport is not None and transport._peer is not None:
+            transport._peer.close()
+            transport._peer = None
+
+    def plug(self):
+        """Ricollega il dispositivo: le aperture successive riescono di nuovo"""
+        with self.lock:
+            self.plugged = True
+
+    def _attach(self, transport):
+        with self.lock:
+            self._transport = transport
+            pending, self._pending = self._pending, []
+        for line in pending:
+            transport._deliver(line)
+
+    def _detach(self, transport):
+        with self.lock:
+            if self._transport is transport:
+                self._transport = None
+
+    def _record_send(self, destination, text):
+        self.sent.append((destination, text, time.time()))
+        if self.on_send:
+            self.on_send(destination, text)
+
+
+class LoopbackTransport(_SocketLineTransport):
+    """Transport verso un LoopbackDevice (nessun hardware necessario)"""
+
+    def __init__(self, name, timeout):
+        super().__init__(timeout)
+        self.device = LoopbackDevice.get(name)
+        self._peer = None
+
+    def open(self):
+        if not self.device.plugged:
+            raise TransportError(f"dispositivo loop://{self.device.name} scollegato")
+        # socketpair: fornisce un file descriptor vero anche al runtime asyncio
+        self.sock, self._peer = socket.socketpair()
+        self.sock.settimeout(self.timeout)
+        self.device._attach(self)
+
+    def close(self):
+        self.device._detach(self)
+        if self._peer is not None:
+            self._peer.close()
+            self._peer = None
+        super().close()
+
+    def _deliver(self, data):
+        try:
+            self._peer.sendall(data)
+        except (OSError, AttributeError):
+            pass
+
+    def send_text(self, destination, text):
+        self.device._record_send(destination, text)
+        return True
+
+    def cli_args(self):
+        return ["--port", f"loop://{self.device.name}"]
+
+
+class ReplayTransport(_SocketLineTransport):
+    """Riproduce una cattura (file .mcap o directory) come se arrivasse dal
+    dispositivo; gli invii sono solo simulati"""
+
+    def __init__(self, path, speed, timeout):
+        super().__init__(timeout)
+        self.path = path
+        self.speed = speed
+        self._peer = None
+        self._stop = threading.Event()
+
+    def open(self):
+        from capture_log import CaptureError, iter_capture, replay
+        try:
+            next(iter_capture(self.path), None)
+        except (CaptureError, OSError) as e:
+            raise TransportError(f"cattura non leggibile: {e}")
+
+        self.sock, self._peer = socket.socketpair()
+        self.sock.settimeout(self.timeout)
+        self._stop.clear()
+
+        def run():
+            try:
+                count = replay(self.path, self._peer.sendall, self.speed, self._stop)
+                logger.info("📼 Replay completato: %s record da %s", count, self.path)
+            except OSError:
+                pass  # Transport chiuso durante la riproduzione
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        if self._peer is not None:
+            self._peer.close()
+            self._peer = None
+        super().close()
+
+    def send_text(self, destination, text):
+        logger.info("📼 Invio simulato (replay) → %#010x: %s", destination, text)
+        return True
+
+    def cli_args(self):
+        return []
+
+
+class RemoteRadio:
+    """Radio aperta dal processo radio (PROCESS_MODE=split): riceve le linee
+    inoltrate sul canale IPC e gli passa le richieste di invio"""
+
+    _radios = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.up = False
+        self.status = None
+        # Impostata da process_split: send(nome, destinazione, testo) → bool
+        self.send = None
+        self._transport = None
+        # Linee arrivate prima che il worker apra il transport (avvio, riavvio)
+        self._pending = deque(maxlen=REMOTE_PENDING_LINES)
+        self._flushing = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name):
+        with cls._registry_lock:
+            radio = cls._radios.get(name)
+            if radio is None:
+                radio = cls(name)
+                cls._radios[name] = radio
+            return radio
+
+    def deliver(self, lines):
+        """Linee lette dal processo radio (già decodificate)"""
+        with self.lock:
+            transport = self._transport
+            if transport is None or self._flushing:
+                self._pending.extend(lines)
+                return
+        transport._deliver("".join(line + "\n" for line in lines).encode('utf-8'))
+
+    def set_up(self, up):
+        """Stato della connessione nel processo radio: se cade, cade anche il transport"""
+        with self.lock:
+            self.up = up
+            transport = None if up else self._transport
+        if transport is not None and transport._peer is not None:
+            transport._peer.close()
+            transport._peer = None
+
+    def _attach(self, transport):
+        with self.lock:
+            if not self.up:
+                return False
+            self._transport = transport
+            if self._pending:
+                # Consegnate da un thread: open() non deve attendere il lettore
+                self._flushing = True
+                threading.Thread(target=self._flush, args=(transport,), daemon=True).start()
+            return True
+
+    def _flush(self, transport):
+        while True:
+            with self.lock:
+                if self._transport is not transport:
+                    return
+                if not self._pending:
+                    self._flushing = False
+                    return
+                lines = list(self._pending)
+                self._pending.clear()
+            transport._deliver("".join(line + "\n" for line in lines).encode('utf-8'))
+
+    def _detach(self, transport):
+        with self.lock:
+            if self._transport is transport:
+                self._transport = None
+
+
+class IPCTransport(_SocketLineTransport):
+    """Transport verso una RemoteRadio: le linee arrivano da un socketpair
+    (file descriptor vero anche per il runtime asyncio)"""
+
+    def __init__(self, name, timeout):
+        super().__init__(timeout)
+        self.radio = RemoteRadio.get(name)
+        self._peer = None
+
+    def open(self):
+        self.sock, self._peer = socket.socketpair()
+        self.sock.settimeout(self.timeout)
+        if not self.radio._attach(self):
+            self.close()
+            raise TransportError(f"radio {self.radio.name} non connessa nel processo radio")
+
+    def close(self):
+        self.radio._detach(self)
+        if self._peer is not None:
+            self._peer.close()
+            self._peer = None
+        super().close()
+
+    def _deliver(self, data):
+        try:
+            self._peer.sendall(data)
+        except (OSError, AttributeError):
+            pass
+
+    def send_text(self, destination, text):
+        # Attende l'esito dal processo radio (False se il canale non risponde)
+        return self.radio.send is not None and self.radio.send(self.radio.name, destination, text)
+
+    def cli_args(self):
+        return []
+
+    def remote_status(self):
+        return self.radio.status
@@ -0,0 +1,404 @@
+"""
+Webhook Dispatcher: invio di ogni messaggio ricevuto a più webhook
+(assistente AI, archivio, analytics), ognuno con filtro, pool di
+connessioni, concorrenza, timeout e tentativi propri. Un webhook lento
+non ritarda gli altri: ognuno ha la sua coda e i suoi worker.
+
+Formato del file (WEBHOOKS_FILE, JSON):
+{
+    "targets": [
+        {"name": "ai", "url": "http://localhost:5678/webhook/meshtastic", "primary": true},
+        {"name": "archivio", "url": "http://localhost:5678/webhook/archivio",
+         "concurrency": 2, "timeout": 30, "retries": 3, "retry_backoff": 2},
+        {"name": "analytics", "url": "http://analytics.local/ingest",
+         "filter": {"gateway": "lora868"}, "queue_size": 200}
+    ]
+}
+
+Il target "primary" (di default il primo) è quello che risponde ai
+messaggi: il tracing segue solo lui, e le regole con azione "webhook"
+sostituiscono il suo URL. Senza file si usa WEBHOOK_URL come unico target.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from async_http import ConnectionPool, HTTPError
+from rules_engine import MessageFilter
+from tracing import WEBHOOK_START
+from bridge_logging import get_logger
+
+logger = get_logger("n8n")
+
+# Allarmi di telemetria in attesa di invio (oltre si scartano e restano da segnalare)
+ALERT_QUEUE_SIZE = 100
+
+LATENCY_WINDOW = 256
+
+
+def _is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+class WebhookTarget:
+    """Un webhook di destinazione con le sue impostazioni e statistiche"""
+
+    def __init__(self, data, config):
+        self.name = data.get('name') or data.get('url', '')
+        self.url = data.get('url', '')
+        if not self.url:
+            raise ValueError(f"webhook '{self.name}': manca 'url'")
+        self.primary = bool(data.get('primary', False))
+        self.filter = MessageFilter(data['filter']) if data.get('filter') else None
+        # Runtime a thread: un worker per slot; asyncio: solo un limite di task
+        default_concurrency = (config.WEBHOOK_MAX_IN_FLIGHT if config.BRIDGE_RUNTIME == 'asyncio'
+                               else config.WEBHOOK_CONCURRENCY)
+        self.concurrency = max(1, int(data.get('concurrency', default_concurrency)))
+        self.timeout = float(data.get('timeout', config.HTTP_TIMEOUT))
+        self.retries = max(0, int(data.get('retries', config.WEBHOOK_RETRIES)))
+        self.retry_backoff = float(data.get('retry_backoff', config.WEBHOOK_RETRY_BACKOFF))
+        self.queue_size = max(1, int(data.get('queue_size', config.WEBHOOK_QUEUE_SIZE)))
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.last_error = None
+        self.last_status = None
+
+    def accepts(self, message_data):
+        return self.filter is None or self.filter.matches(message_data)
+
+    def record(self, latency, status_code=None, error=None):
+        """Registra l'esito finale di una chiamata (dopo gli eventuali tentativi)"""
+        with self.lock:
+            self.latencies.append(latency)
+            self.last_status = status_code
+            if error is None and status_code is not None and status_code < 400:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.last_error = error or f"HTTP {status_code}"
+
+    def get_status(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            sent, failed = self.sent, self.failed
+        status = {
+            "name": self.name,
+            "url": self.url,
+            "primary": self.primary,
+            "concurrency": self.concurrency,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "sent": sent,
+            "failed": failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "error_rate": round(failed / (sent + failed), 3) if sent + failed else 0.0,
+            "last_status": self.last_status,
+            "last_error": self.last_error
+        }
+        if latencies:
+            status["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1)
+            }
+        return status
+
+
+def _unexpected(error):
+    """Descrizione di un errore imprevisto durante una chiamata (la chiamata fallisce)"""
+    logger.debug("Dettagli errore", exc_info=True)
+    return f"errore imprevisto ({error.__class__.__name__}: {error})"
+
+
+def load_webhook_targets(config):
+    """Legge i target da WEBHOOKS_FILE; senza file, solo WEBHOOK_URL"""
+    path = getattr(config, 'WEBHOOKS_FILE', '')
+    targets = []
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            target_list = data.get('targets', []) if isinstance(data, dict) else data
+            targets = [WebhookTarget(target_data, config) for target_data in target_list]
+            logger.info("🔀 Caricati %s webhook da %s", len(targets), path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error("❌ Errore caricamento webhook da %s: %s (uso WEBHOOK_URL)", path, e)
+            targets = []
+    if not targets:
+        targets = [WebhookTarget({"name": "n8n", "url": config.WEBHOOK_URL}, config)]
+    if not any(target.primary for target in targets):
+        targets[0].primary = True
+    return targets
+
+
+class _BaseDispatcher:
+    """Logica comune: scelta dei target e gestione dell'esito"""
+
+    def __init__(self, message_handler):
+        self.message_handler = message_handler
+        self.targets = message_handler.webhook_targets
+
+    def _jobs(self, message_data, webhook_url=None):
+        """Coppie (target, url) a cui inviare il messaggio"""
+        jobs = []
+        for target in self.targets:
+            if target.primary:
+                # Una regola "webhook" sostituisce l'assistente, gli altri target restano
+                if webhook_url or target.accepts(message_data):
+                    jobs.append((target, webhook_url or target.url))
+            elif target.accepts(message_data):
+                jobs.append((target, target.url))
+        return jobs
+
+    def busy(self):
+        """Chiamate in coda o in corso su tutti i target"""
+        return sum(target.queued + target.in_flight for target in self.targets)
+
+    def _reserve(self, target, message_data):
+        """Occupa un posto nella coda del target; False se è piena"""
+        with target.lock:
+            if target.queued >= target.queue_size:
+                target.dropped += 1
+                full = True
+            else:
+                target.queued += 1
+                full = False
+        if full:
+            logger.warning("⚠️ Coda webhook '%s' piena, messaggio scartato", target.name)
+            if target.primary:
+                self.message_handler.tracer.finish(message_data, 'webhook_dropped')
+        elif target.primary:
+            self.message_handler.expect_reply(message_data)
+        return not full
+
+    def _begin(self, target, message_data):
+        with target.lock:
+            target.queued -= 1
+            target.in_flight += 1
+        if target.primary:
+            self.message_handler.tracer.mark(message_data, WEBHOOK_START)
+
+    def _complete_safely(self, *args):
+        """_complete senza far terminare il worker se la gestione dell'esito fallisce"""
+        try:
+            self._complete(*args)
+        except Exception as e:
+            logger.error("❌ Errore nella gestione dell'esito webhook: %s", e)
+            logger.debug("Dettagli errore", exc_info=True)
+
+    def _complete(self, target, message_data, started, status_code=None, response_text='', error=None):
+        target.record(time.monotonic() - started, status_code, error)
+        with target.lock:
+            target.in_flight -= 1
+        if target.primary:
+            if error is None:
+                self.message_handler.report_webhook_result(message_data, status_code, response_text)
+            else:
+                self.message_handler.report_webhook_error(message_data, target.name, error)
+        elif error is not None or status_code >= 400:
+            logger.error("❌ Errore webhook '%s': %s", target.name, error or f"HTTP {status_code}")
+        else:
+            logger.debug("✅ Inviato a '%s': %s", target.name, message_data.get('text'))
+
+
+class WebhookDispatcher(_BaseDispatcher):
+    """Runtime a thread: coda e worker fissi per ogni target, nessun thread per messaggio"""
+
+    def __init__(self, message_handler):
+        super().__init__(message_handler)
+        self.queues = {}
+        self.sessions = {}
+        self.threads = []
+        # Allarmi di telemetria: una coda (limitata in dispatch_alert) e un solo worker
+        self.alerts = queue.Queue()
+
+    def start(self):
+        for target in self.targets:
+            session = requests.Session()
+            # Pool di connessioni keep-alive dimensionato sulla concorrenza del target
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=target.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions[target.name] = session
+            self.queues[target.name] = queue.Queue()
+            for index in range(target.concurrency):
+                thread = threading.Thread(
+                    target=self._worker, args=(target,),
+                    name=f"webhook-{target.name}-{index}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+        thread = threading.Thread(target=self._alert_worker, name="webhook-alerts", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def busy(self):
+        return super().busy() + self.alerts.unfinished_tasks
+
+    def dispatch_alert(self, alert):
+        """Accoda un allarme di telemetria per il webhook degli allarmi"""
+        if self.alerts.qsize() >= ALERT_QUEUE_SIZE:
+            logger.warning("⚠️ Coda allarmi piena, allarme '%s' da %s scartato", alert['rule'], alert['from'])
+            self.message_handler.telemetry.alert_failed(alert)
+            return
+        self.alerts.put(alert)
+
+    def _alert_worker(self):
+        while True:
+            alert = self.alerts.get()
+            try:
+                if alert is None:
+                    break
+                self.message_handler.send_alert(alert)
+            except Exception as e:
+                logger.error("❌ Errore invio allarme: %s", _unexpected(e))
+            finally:
+                self.alerts.task_done()
+
+    def dispatch(self, message_data, webhook_url=None):
+        """Accoda il messaggio per tutti i target interessati"""
+        payload = self.message_handler.prepare_webhook_call(message_data)
+        jobs = self._jobs(message_data, webhook_url)
+        if not any(target.primary for target, _ in jobs):
+            self.message_handler.tracer.finish(message_data, 'no_target')
+        for target, url in jobs:
+            if self._reserve(target, message_data):
+                self.queues[target.name].put((message_data, payload, url))
+
+    def _worker(self, target):
+        session = self.sessions[target.name]
+        jobs = self.queues[target.name]
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            message_data, payload, url = job
+            self._begin(target, message_data)
+            started = time.monotonic()
+            status_code, response_text, error = None, '', None
+            try:
+                status_code, response_text, error = self._post(session, target, url, payload)
+            except Exception as e:
+                error = _unexpected(e)
+            finally:
+                # Sempre: in_flight deve tornare giù anche con un errore imprevisto
+                self._complete_safely(target, message_data, started, status_code, response_text, error)
+
+    def _post(self, session, target, url, payload):
+        """Chiamata con i tentativi del target. Ritorna (status, testo, errore)"""
+        status_code, response_text, error = None, '', None
+        for attempt in range(target.retries + 1):
+            if attempt:
+                with target.lock:
+                    target.retried += 1
+                time.sleep(target.retry_backoff * 2 ** (attempt - 1))
+            try:
+                response = session.post(url, json=payload, timeout=target.timeout)
+                status_code, response_text, error = response.status_code, response.text, None
+                if not _is_retryable(status_code):
+                    break
+            except requests.exceptions.Timeout:
+                error = f"timeout ({target.timeout:g}s)"
+            except requests.exceptions.RequestException as e:
+                error = f"impossibile raggiungere {url} ({e.__class__.__name__})"
+        return status_code, response_text, error
+
+    def stop(self, timeout=0):
+        """Ferma i worker dopo le chiamate già in coda; con timeout li attende
+        prima di chiudere le sessioni (sostituzione a caldo dei target)"""
+        for target in self.targets:
+            jobs = self.queues.get(target.name)
+            if jobs is not None:
+                for _ in range(target.concurrency):
+                    jobs.put(None)
+        self.alerts.put(None)
+        if timeout:
+            deadline = time.monotonic() + timeout
+            for thread in self.threads:
+                thread.join(max(0, deadline - time.monotonic()))
+        for session in self.sessions.values():
+            session.close()
+
+
+class AsyncWebhookDispatcher(_BaseDispatcher):
+    """Runtime asyncio: un semaforo e un pool di connessioni per target"""
+
+    def __init__(self, message_handler, pending):
+        super().__init__(message_handler)
+        # Insieme dei task in corso, atteso dal bridge all'arresto
+        self.pending = pending
+        self.semaphores = {}
+        self.pools = {}
+
+    def start(self):
+        for target in self.targets:
+            self.semaphores[target.name] = asyncio.Semaphore(target.concurrency)
+            self.pools[target.name] = ConnectionPool(max_idle=target.concurrency)
+
+    def dispatch(self, message_data, webhook_url=None):
+        payload = self.message_handler.prepare_webhook_call(message_data)
+        jobs = self._jobs(message_data, webhook_url)
+        if not any(target.primary for target, _ in jobs):
+            self.message_handler.tracer.finish(message_data, 'no_target')
+        for target, url in jobs:
+            if self._reserve(target, message_data):
+                task = asyncio.ensure_future(self._send(target, message_data, payload, url))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+
+    async def _send(self, target, message_data, payload, url):
+        async with self.semaphores[target.name]:
+            self._begin(target, message_data)
+            started = time.monotonic()
+            status_code, response_text, error = None, '', None
+            try:
+                status_code, response_text, error = await self._post(target, url, payload)
+            except asyncio.CancelledError:
+                error = "chiamata annullata"
+                raise
+            except Exception as e:
+                error = _unexpected(e)
+            finally:
+                # Sempre: in_flight deve tornare giù anche con un errore imprevisto
+                self._complete_safely(target, message_data, started, status_code, response_text, error)
+
+    async def _post(self, target, url, payload):
+        """Chiamata con i tentativi del target. Ritorna (status, testo, errore)"""
+        status_code, response_text, error = None, '', None
+        for attempt in range(target.retries + 1):
+            if attempt:
+                with target.lock:
+                    target.retried += 1
+                await asyncio.sleep(target.retry_backoff * 2 ** (attempt - 1))
+            try:
+                status_code, response_text = await self.pools[target.name].post_json(
+                    url, payload, target.timeout
+                )
+                error = None
+                if not _is_retryable(status_code):
+                    break
+            except asyncio.TimeoutError:
+                error = f"timeout ({target.timeout:g}s)"
+            except (OSError, HTTPError) as e:
+                error = f"impossibile raggiungere {url} ({e})"
+        return status_code, response_text, error
+
+    def stop(self):
+        for pool in self.pools.values():
+            pool.close()
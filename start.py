@@ -58,6 +58,9 @@ def main():
             print("  python start.py          # Avvia bridge")
             print("  python start.py --setup  # Forza setup")
             print("  python start.py --test   # Test configurazione")
+            print("  python start.py --async  # Avvia bridge con runtime asyncio")
+            print("  python start.py --split  # Radio in un processo separato da webhook e HTTP")
+            print("  python start.py --takeover  # Subentra al bridge in esecuzione (HANDOFF_SOCKET)")
             print("  python start.py --help   # Mostra questo help")
             return
             
@@ -74,7 +77,13 @@ def main():
                 # Test aggiuntivi
                 try:
                     from config import Config
+                    from bridge_logging import setup_logging, shutdown_logging
+                    # display_config scrive nel log: va configurato anche qui
+                    setup_logging(Config)
                     Config.display_config()
+                    shutdown_logging()
+                    for error in Config().validate():
+                        print(f"❌ {error}")
                 except Exception as e:
                     print(f"❌ Errore configurazione: {e}")
             return
@@ -93,6 +102,10 @@ def main():
     
     # Avvia bridge
     try:
+        if "--async" in sys.argv[1:]:
+            os.environ['BRIDGE_RUNTIME'] = 'asyncio'
+        if "--split" in sys.argv[1:]:
+            os.environ['PROCESS_MODE'] = 'split'
         print("🚀 Avvio bridge...")
         from meshtastic_bridge import main
         main()
@@ -0,0 +1,70 @@
+"""
+Test del client HTTP asyncio: lettura delle risposte e riuso delle connessioni.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from async_http import _read_response, HTTPError
+
+
+def read(raw, method='POST', eof=True):
+    """Legge una risposta da un buffer; senza eof la connessione resta aperta"""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        if eof:
+            reader.feed_eof()
+        return await asyncio.wait_for(_read_response(reader, method), 1)
+    return asyncio.run(run())
+
+
+class ReadResponseTest(unittest.TestCase):
+
+    def test_content_length(self):
+        raw = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nokEXTRA"
+        self.assertEqual(read(raw), (200, "ok", True))
+
+    def test_chunked(self):
+        raw = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3;x=1\r\nabc\r\n2\r\nde\r\n0\r\n\r\n"
+        self.assertEqual(read(raw), (200, "abcde", True))
+
+    def test_no_body_statuses(self):
+        # Keep-alive senza lunghezza: non si attende la chiusura
+        self.assertEqual(read(b"HTTP/1.1 204 No Content\r\n\r\n", eof=False), (204, "", True))
+        self.assertEqual(read(b"HTTP/1.1 304 Not Modified\r\n\r\n", eof=False), (304, "", True))
+        self.assertEqual(read(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n", 'HEAD', eof=False),
+                         (200, "", True))
+
+    def test_interim_response_is_skipped(self):
+        raw = b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 1\r\n\r\nx"
+        self.assertEqual(read(raw), (200, "x", True))
+
+    def test_unframed_keep_alive_body_does_not_hang(self):
+        status, text, reusable = read(b"HTTP/1.1 200 OK\r\n\r\nbody", eof=False)
+        self.assertEqual((status, text), (200, ""))
+        self.assertFalse(reusable)
+
+    def test_body_until_close(self):
+        self.assertEqual(read(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nfino alla fine"),
+                         (200, "fino alla fine", False))
+        self.assertEqual(read(b"HTTP/1.0 200 OK\r\n\r\nvecchio"), (200, "vecchio", False))
+
+    def test_malformed_numbers_raise_http_error(self):
+        for raw in (b"HTTP/1.1 abc\r\n\r\n",
+                    b"HTTP/1.1 200 OK\r\nContent-Length: due\r\n\r\n",
+                    b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n"):
+            with self.assertRaises(HTTPError):
+                read(raw)
+        with self.assertRaises(HTTPError):
+            read(b"")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Test del server HTTP asyncio: le richieste sullo stato in memoria si
+gestiscono sul loop, quelle di amministrazione fuori dal loop.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from http_server import AsyncHTTPBridgeServer, BridgeAPI
+
+
+class _Config:
+    HTTP_PORT = 0
+
+
+class _API:
+    """BridgeAPI finta: registra il thread di ogni gestore"""
+
+    BLOCKING_PATHS = BridgeAPI.BLOCKING_PATHS
+    is_blocking = BridgeAPI.is_blocking
+
+    def __init__(self):
+        self.threads = {}
+
+    def handle_get(self, path, query=None, headers=None):
+        self.threads[path] = threading.current_thread()
+        return 200, {"path": path}
+
+    def handle_post(self, path, body, client_ip='', headers=None, query=None):
+        self.threads[path] = threading.current_thread()
+        return 200, json.loads(body)
+
+    def error_response(self, status_code, message):
+        return status_code, {"status": "error", "message": message}
+
+
+async def request(port, raw):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return data
+
+
+class AsyncServerTest(unittest.TestCase):
+
+    def test_only_blocking_routes_leave_the_loop(self):
+        api = _API()
+
+        async def run():
+            server = AsyncHTTPBridgeServer(_Config(), api)
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            try:
+                status = await request(port, b"GET /status HTTP/1.1\r\nConnection: close\r\n\r\n")
+                body = b'{"to": "0x1", "message": "ciao"}'
+                queued = await request(port, b"POST / HTTP/1.1\r\nConnection: close\r\n"
+                                       b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+                await request(port, b"POST /admin/reload HTTP/1.1\r\nConnection: close\r\n"
+                              b"Content-Length: 2\r\n\r\n{}")
+                await request(port, b"GET /debug/memory HTTP/1.0\r\n\r\n")
+            finally:
+                await server.stop()
+            return threading.current_thread(), status, queued
+
+        loop_thread, status, queued = asyncio.run(run())
+        self.assertTrue(status.startswith(b"HTTP/1.1 200 OK"))
+        self.assertIn(b'"ciao"', queued)
+        self.assertIs(api.threads["/status"], loop_thread)
+        self.assertIs(api.threads["/"], loop_thread)
+        self.assertIsNot(api.threads["/admin/reload"], loop_thread)
+        self.assertIsNot(api.threads["/debug/memory"], loop_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Test del formato di cattura: record e indice, salto a un istante,
+rotazione dei segmenti e file troncati.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from capture_log import CaptureWriter, CaptureReader, CaptureError, iter_capture, list_segments
+
+
+class CaptureLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, chunks, **kwargs):
+        """Scrive (secondi, bytes) a partire da adesso; ritorna il primo segmento"""
+        writer = CaptureWriter(self.dir.name, **kwargs)
+        base = time.monotonic() + 0.5
+        for seconds, data in chunks:
+            writer.write(data, base + seconds)
+        writer.close()
+        return list_segments(self.dir.name)
+
+    def test_records_round_trip_and_seek(self):
+        chunks = [(0, b"uno\n"), (0.5, b"due\n"), (2, b"tre\n"), (3.5, b"quattro\n")]
+        path = self.write(chunks)[0]
+        reader = CaptureReader(path)
+        try:
+            records = list(reader.records())
+            self.assertEqual([data for _, data in records], [data for _, data in chunks])
+            gaps = [later[0] - earlier[0] for earlier, later in zip(records, records[1:])]
+            for gap, expected in zip(gaps, (0.5, 1.5, 1.5)):
+                self.assertAlmostEqual(gap, expected, places=3)
+            # L'indice fa partire la lettura vicino all'istante richiesto
+            self.assertGreaterEqual(len(reader.index), 3)
+            later = list(reader.records(records[2][0]))
+            self.assertEqual([data for _, data in later], [b"tre\n", b"quattro\n"])
+        finally:
+            reader.close()
+
+    def test_truncated_record_is_ignored(self):
+        path = self.write([(0, b"completo\n"), (0.1, b"troncato\n")])[0]
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 3)
+        self.assertEqual([data for _, data in iter_capture(path)], [b"completo\n"])
+
+    def test_rotation_keeps_max_files(self):
+        chunks = [(index * 0.1, bytes([65 + index]) * 3000) for index in range(4)]
+        segments = self.write(chunks, max_bytes=4096, max_files=2)
+        self.assertEqual(len(segments), 2)
+        self.assertEqual([data[:1] for _, data in iter_capture(self.dir.name)], [b"C", b"D"])
+
+    def test_unknown_format(self):
+        path = os.path.join(self.dir.name, "altro.mcap")
+        with open(path, 'wb') as f:
+            f.write(b"NONCAPTURE" + b"\0" * 30)
+        with self.assertRaises(CaptureError):
+            CaptureReader(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Test della configurazione: lettura delle variabili, confronto e
+applicazione in blocco di una nuova configurazione.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from config import Config, parse_settings
+
+
+class ParseSettingsTest(unittest.TestCase):
+
+    def test_defaults_and_conversions(self):
+        values = parse_settings({'HTTP_PORT': '9000', 'PACING_MIN_DELAY': '0.5',
+                                 'TRACE_ENABLED': 'TRUE', 'BRIDGE_RUNTIME': 'AsyncIO'})
+        self.assertEqual(values['HTTP_PORT'], 9000)
+        self.assertEqual(values['PACING_MIN_DELAY'], 0.5)
+        self.assertIs(values['TRACE_ENABLED'], True)
+        self.assertEqual(values['BRIDGE_RUNTIME'], 'asyncio')
+        self.assertEqual(values['WEBHOOK_QUEUE_SIZE'], 1000)
+        self.assertEqual(set(values), set(parse_settings({})))
+
+    def test_invalid_number_raises(self):
+        with self.assertRaises(ValueError):
+            parse_settings({'HTTP_PORT': 'abc'})
+
+
+class DiffApplyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = Config.settings()
+
+    def tearDown(self):
+        Config._values = self.saved
+
+    def snapshot(self, **env):
+        """Come Config.from_env, ma da un dizionario"""
+        return type(Config)('Config', (Config,), {}, settings=parse_settings(env))()
+
+    def test_diff_lists_only_changed_settings(self):
+        other = self.snapshot(**{key: str(value) for key, value in self.saved.items()
+                                 if isinstance(value, str)},
+                              HTTP_PORT=str(self.saved['HTTP_PORT'] + 1))
+        changes = Config.diff(other)
+        self.assertEqual(changes['HTTP_PORT'], (self.saved['HTTP_PORT'], self.saved['HTTP_PORT'] + 1))
+        self.assertNotIn('WEBHOOK_URL', changes)
+
+    def test_snapshot_does_not_touch_active_config(self):
+        other = self.snapshot(WEBHOOK_URL='http://altro:1/hook', HTTP_PORT='70000')
+        self.assertEqual(other.WEBHOOK_URL, 'http://altro:1/hook')
+        self.assertEqual(Config.WEBHOOK_URL, self.saved['WEBHOOK_URL'])
+        self.assertIn("HTTP_PORT fuori intervallo: 70000", other.validate())
+
+    def test_apply_replaces_values_at_once(self):
+        instance = Config()
+        before = Config._values
+        Config.apply({'HTTP_PORT': 9999, 'WEBHOOK_URL': 'http://nuovo/hook'})
+        self.assertIsNot(Config._values, before)
+        self.assertEqual(before, self.saved)
+        self.assertEqual((instance.HTTP_PORT, instance.WEBHOOK_URL), (9999, 'http://nuovo/hook'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Test del supervisore di connessione: stati, backoff esponenziale e
+contatori delle interruzioni.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from connection_supervisor import ConnectionSupervisor, CONNECTING, UP, DEGRADED, DOWN
+
+
+class _Config:
+    MAX_RECONNECT_ATTEMPTS = 3
+    RECONNECT_BACKOFF_INITIAL = 1.0
+    RECONNECT_INTERVAL = 5.0
+    SERIAL_AUTODISCOVER = False
+
+
+class _Radio:
+    """SerialManager finto: reopen() segue l'esito indicato"""
+
+    def __init__(self):
+        self.name = "radio0"
+        self.port = "loop://supervisor"
+        self.cli_active = False
+        self.results = []
+
+    def reopen(self):
+        return self.results.pop(0)
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.radio = _Radio()
+        self.supervisor = ConnectionSupervisor(self.radio, _Config())
+        self.changes = []
+        self.supervisor.add_listener(lambda name, old, new: self.changes.append((old, new)))
+
+    def test_backoff_doubles_up_to_the_interval(self):
+        self.assertEqual(self.supervisor.next_delay(), 0)
+        delays = []
+        for failures in range(1, 6):
+            self.supervisor.consecutive_failures = failures
+            delays.append(self.supervisor.next_delay())
+        for delay, expected in zip(delays, (1, 2, 4, 5, 5)):
+            self.assertGreaterEqual(delay, expected * 0.8)
+            self.assertLessEqual(delay, expected * 1.2)
+
+    def test_failures_before_first_connection(self):
+        self.radio.results = [False, False, False, True]
+        self.assertFalse(self.supervisor.reconnect_once())
+        self.assertEqual(self.supervisor.state, CONNECTING)
+        self.supervisor.reconnect_once()
+        self.supervisor.reconnect_once()
+        self.assertEqual(self.supervisor.state, DOWN)
+        self.assertTrue(self.supervisor.reconnect_once())
+        self.assertEqual(self.changes, [(CONNECTING, DOWN), (DOWN, UP)])
+        self.assertEqual(self.supervisor.consecutive_failures, 0)
+        self.assertEqual(self.supervisor.outages, 0)
+
+    def test_outage_after_an_error(self):
+        self.supervisor.mark_up()
+        self.supervisor.report_error("I/O error")
+        self.assertEqual(self.supervisor.state, DEGRADED)
+        self.assertTrue(self.supervisor.needs_reconnect())
+        self.radio.results = [False, True]
+        self.supervisor.reconnect_once()
+        self.assertEqual(self.supervisor.state, DEGRADED)
+        self.supervisor.reconnect_once()
+        status = self.supervisor.get_status()
+        self.assertEqual((status["state"], status["outages"], status["reconnects"]), (UP, 1, 1))
+        self.assertEqual(status["last_error"], "I/O error")
+        self.assertEqual(self.changes, [(CONNECTING, UP), (UP, DEGRADED), (DEGRADED, UP)])
+
+    def test_busy_cli_is_not_a_failure(self):
+        self.radio.cli_active = True
+        self.assertFalse(self.supervisor.reconnect_once())
+        self.assertEqual(self.supervisor.consecutive_failures, 0)
+        self.assertEqual(self.changes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Test del passaggio di consegne: socket HTTP ceduto con SCM_RIGHTS, nuovo
+tentativo dopo un takeover fallito, coda conservata su disco.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import handoff
+from handoff import HandoffListener, take_over, recover_pending, pending_path
+
+
+class _Config:
+    def __init__(self, path):
+        self.HANDOFF_SOCKET = path
+
+
+@unittest.skipUnless(handoff.is_supported(), "servono socket Unix e passaggio di descrittori")
+class HandoffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.config = _Config(os.path.join(self.dir.name, 'bridge.sock'))
+        self.requests = []
+        self.handled = threading.Semaphore(0)
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener:
+            self.listener.close()
+        self.dir.cleanup()
+
+    def start_listener(self, on_takeover):
+        def handle(request):
+            try:
+                on_takeover(request)
+            finally:
+                self.handled.release()
+        self.listener = HandoffListener(self.config, handle)
+        self.assertTrue(self.listener.start())
+
+    def test_listen_socket_and_queue_are_handed_over(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        released = []
+
+        def on_takeover(request):
+            request.send_listen_socket(server.fileno())
+            released.append(request.release([{"to": "0x00000001", "text": "ciao"}]))
+
+        self.start_listener(on_takeover)
+        takeover = take_over(self.config)
+        self.assertIsNotNone(takeover)
+        self.assertEqual(takeover.listen_socket.getsockname()[1], port)
+        self.assertEqual(takeover.wait_release(5), [{"to": "0x00000001", "text": "ciao"}])
+        self.assertTrue(self.handled.acquire(timeout=5))
+        self.assertEqual(released, [True])
+        self.assertFalse(os.path.exists(pending_path(self.config)))
+        takeover.listen_socket.close()
+        server.close()
+
+    def test_failed_takeover_can_be_retried(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        attempts = []
+
+        def on_takeover(request):
+            attempts.append(request.pid)
+            if len(attempts) == 1:
+                request.abort()  # come un invio del socket fallito
+                return
+            request.send_listen_socket(server.fileno())
+            request.abort()
+
+        self.start_listener(on_takeover)
+        self.assertIsNone(take_over(self.config))
+        self.assertTrue(self.handled.acquire(timeout=5))
+        takeover = take_over(self.config)
+        self.assertIsNotNone(takeover)
+        self.assertEqual(len(attempts), 2)
+        takeover.listen_socket.close()
+        takeover.channel.close()
+        server.close()
+
+    def test_queue_survives_a_dead_new_process(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        released = []
+
+        def on_takeover(request):
+            request.send_listen_socket(server.fileno())
+            released.append(request.release([{"to": "0x00000002", "text": "in coda"}], timeout=1))
+
+        self.start_listener(on_takeover)
+        takeover = take_over(self.config)
+        # Il nuovo processo termina prima di ricevere la coda
+        takeover.channel.close()
+        takeover.listen_socket.close()
+        self.assertTrue(self.handled.acquire(timeout=5))
+        self.assertEqual(released, [False])
+        path = pending_path(self.config)
+        self.assertEqual(recover_pending(path), [{"to": "0x00000002", "text": "in coda"}])
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(recover_pending(path), [])
+        server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
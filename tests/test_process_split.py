@@ -0,0 +1,67 @@
+"""
+Test del canale tra processo radio e worker: frame JSON con lunghezza
+prefissata, letture parziali e raggruppamento delle linee per radio.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from process_split import FrameChannel, HEADER, MAX_FRAME, _line_frames
+
+
+@unittest.skipUnless(hasattr(socket, 'socketpair'), "servono i socket locali")
+class FrameChannelTest(unittest.TestCase):
+
+    def setUp(self):
+        left, self.right = socket.socketpair()
+        self.sender = FrameChannel(left)
+        self.receiver = FrameChannel(self.right)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_messages_in_one_write(self):
+        messages = [{"op": "hello", "radios": {"radio0": True}},
+                    {"op": "lines", "radio": "radio0", "lines": ["città ✓\n"]}]
+        self.sender.send(*messages)
+        self.assertEqual([self.receiver.recv(), self.receiver.recv()], messages)
+
+    def test_frame_split_across_writes(self):
+        data = FrameChannel._encode({"op": "sent", "id": 7, "ok": True})
+        for index in range(len(data)):
+            self.sender.sock.sendall(data[index:index + 1])
+        self.assertEqual(self.receiver.recv(), {"op": "sent", "id": 7, "ok": True})
+
+    def test_closed_mid_frame(self):
+        data = FrameChannel._encode({"op": "link", "radio": "radio0", "up": False})
+        self.sender.sock.sendall(data[:-3])
+        self.sender.close()
+        self.assertIsNone(self.receiver.recv())
+
+    def test_oversized_frame_is_rejected(self):
+        self.sender.sock.sendall(HEADER.pack(MAX_FRAME + 1))
+        with self.assertRaises(ValueError):
+            self.receiver.recv()
+
+
+class LineFramesTest(unittest.TestCase):
+
+    def test_consecutive_lines_of_a_radio_share_a_frame(self):
+        frames = _line_frames([("a", "1\n"), ("a", "2\n"), ("b", "3\n"), ("a", "4\n")])
+        self.assertEqual(frames, [
+            {"op": "lines", "radio": "a", "lines": ["1\n", "2\n"]},
+            {"op": "lines", "radio": "b", "lines": ["3\n"]},
+            {"op": "lines", "radio": "a", "lines": ["4\n"]}
+        ])
+        self.assertEqual(_line_frames([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
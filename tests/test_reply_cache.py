@@ -0,0 +1,66 @@
+"""
+Test della cache risposte: si impara solo dalle risposte correlate.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from reply_cache import ReplyCache
+
+
+class _Config:
+    REPLY_CACHE_ENABLED = True
+    REPLY_CACHE_SCOPE = 'global'
+    CONTEXT_ENABLED = False
+
+
+def inbound(text, sender='0x00000001', message_id='0x10'):
+    return {'from': sender, 'text': text, 'message_id': message_id}
+
+
+class ReplyCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ReplyCache(_Config())
+
+    def test_learns_only_declared_replies(self):
+        self.cache.note_inbound(inbound("meteo?"))
+        self.assertFalse(self.cache.learn('0x00000001', "allarme batteria", {}))
+        self.assertTrue(self.cache.learn('0x00000001', "sole", {'reply_to': '0x10'}))
+        self.assertTrue(self.cache.learn('0x00000001', "22 gradi", {'reply': True}))
+        self.assertEqual(self.cache.lookup(inbound("Meteo", sender='0x00000002')), ["sole", "22 gradi"])
+
+    def test_reply_to_an_older_message_is_ignored(self):
+        self.cache.note_inbound(inbound("meteo?", message_id='0x10'))
+        self.cache.note_inbound(inbound("chi sei?", message_id='0x11'))
+        self.assertFalse(self.cache.learn('0x00000001', "sole", {'reply_to': '0x10'}))
+        self.assertIsNone(self.cache.lookup(inbound("chi sei?")))
+        self.assertTrue(self.cache.learn('0x00000001', "un bridge", {'reply_to': '0x11'}))
+        self.assertEqual(self.cache.lookup(inbound("chi sei?")), ["un bridge"])
+
+    def test_reply_to_in_any_id_format(self):
+        self.cache.note_inbound(inbound("meteo?", message_id='0x0000001f'))
+        self.assertTrue(self.cache.learn('!00000001', "sole", {'reply_to': 31}))
+        self.assertTrue(self.cache.learn('1', "22 gradi", {'reply_to': '0x1F'}))
+        self.assertTrue(self.cache.learn('0x00000001', "vento", {'reply_to': ' 31 '}))
+        self.assertFalse(self.cache.learn('0x00000001', "pioggia", {'reply_to': '0x20'}))
+        self.assertEqual(self.cache.lookup(inbound("meteo")), ["sole", "22 gradi", "vento"])
+
+    def test_history_makes_the_cache_per_sender(self):
+        config = _Config()
+        config.CONTEXT_ENABLED = True
+        cache = ReplyCache(config)
+        cache.note_inbound(inbound("e domani?"))
+        self.assertTrue(cache.learn('0x00000001', "pioggia", {'reply': True}))
+        self.assertEqual(cache.lookup(inbound("e domani?")), ["pioggia"])
+        self.assertIsNone(cache.lookup(inbound("e domani?", sender='0x00000002')))
+        self.assertEqual(cache.get_status()["scope"], "sender")
+
+
+if __name__ == '__main__':
+    unittest.main()
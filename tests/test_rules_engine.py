@@ -0,0 +1,128 @@
+"""
+Test del motore regole: regex con flag inline e backreference.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from rules_engine import RulesEngine, MessageFilter
+
+
+class _Config:
+    RULES_RELOAD_INTERVAL = 3600
+
+    def __init__(self, path):
+        self.RULES_FILE = path
+
+
+class RulesEngineRegexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'rules.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def engine(self, rules):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"rules": rules}, f)
+        return RulesEngine(_Config(self.path))
+
+    def match(self, engine, text, sender='0x00000001'):
+        rule = engine.match({'text': text, 'from': sender})
+        return rule.name if rule else None
+
+    def test_inline_flags(self):
+        engine = self.engine([
+            {"name": "saluto", "regex": "(?i)^ciao$", "action": "reply", "reply": "ciao!"},
+            {"name": "altro", "regex": "(?im)^meteo", "action": "drop"},
+        ])
+        self.assertEqual(len(engine.rules), 2)
+        self.assertEqual(self.match(engine, "CIAO"), "saluto")
+        self.assertEqual(self.match(engine, "ciao a tutti"), None)
+        self.assertEqual(self.match(engine, "oggi\nMETEO"), "altro")
+
+    def test_backreferences(self):
+        engine = self.engine([
+            {"name": "prima", "prefix": "/x", "action": "drop"},
+            {"name": "doppia", "regex": r"(a)\1x", "action": "drop"},
+            {"name": "ripetuta", "sender": "0x00000002", "regex": r"(\w)\1", "action": "drop"},
+        ])
+        self.assertEqual(self.match(engine, "aax"), "doppia")
+        self.assertEqual(self.match(engine, "abx"), None)
+        self.assertEqual(self.match(engine, "zz", sender='0x00000002'), "ripetuta")
+        self.assertEqual(self.match(engine, "zy", sender='0x00000002'), None)
+
+    def test_priority_between_global_and_sender_rules(self):
+        engine = self.engine([
+            {"name": "mittente", "sender": "0x00000002", "prefix": "/", "action": "drop"},
+            {"name": "comando", "prefix": "/", "action": "reply", "reply": "ok"},
+        ])
+        self.assertEqual(self.match(engine, "/help", sender='0x00000002'), "mittente")
+        self.assertEqual(self.match(engine, "/help"), "comando")
+
+    def test_named_groups_and_conditionals(self):
+        engine = self.engine([
+            {"name": "nome", "regex": r"(?P<p>\w)(?P=p)", "action": "drop"},
+            {"name": "condizionale", "regex": r"(<)?x(?(1)>|$)", "action": "drop"},
+            {"name": "classe", "regex": r"[(\]]\d", "action": "drop"},
+        ])
+        self.assertEqual(self.match(engine, "oo"), "nome")
+        self.assertEqual(self.match(engine, "<x>"), "condizionale")
+        self.assertEqual(self.match(engine, "x"), "condizionale")
+        self.assertEqual(self.match(engine, "<xy"), None)
+        self.assertEqual(self.match(engine, "]5"), "classe")
+
+    def test_single_pass(self):
+        rules = [{"name": f"r{i}", "prefix": f"/cmd{i} ", "action": "drop"} for i in range(50)]
+        rules.append({"name": "ultima", "regex": r"(a)\1", "action": "drop"})
+        engine = self.engine(rules)
+
+        calls = []
+        matcher = engine.global_matcher
+
+        class Counting:
+            def match(self, text):
+                calls.append(text)
+                return matcher.match(text)
+
+        engine.global_matcher = Counting()
+        self.assertEqual(self.match(engine, "aa"), "ultima")
+        self.assertEqual(self.match(engine, "/cmd49 x"), "r49")
+        self.assertEqual(len(calls), 2)
+
+    def test_keywords_with_punctuation(self):
+        engine = self.engine([
+            {"name": "aiuto", "keywords": ["!help", "?"], "action": "drop"},
+            {"name": "meteo", "keywords": ["meteo"], "action": "drop"},
+        ])
+        self.assertEqual(self.match(engine, "!help"), "aiuto")
+        self.assertEqual(self.match(engine, "dimmi ?"), "aiuto")
+        self.assertEqual(self.match(engine, "x!helpme"), None)
+        self.assertEqual(self.match(engine, "METEO oggi"), "meteo")
+        self.assertEqual(self.match(engine, "meteorite"), None)
+
+    def test_bad_reply_template_is_rejected(self):
+        for template in ("ciao {from", "ciao {0}", "ciao {}", "ciao {from.x}"):
+            engine = self.engine([{"name": "t", "prefix": "/t", "action": "reply", "reply": template}])
+            self.assertEqual(engine.rules, [], template)
+        engine = self.engine([{"name": "t", "prefix": "/t", "action": "reply", "reply": "{{ok}} {from}"}])
+        rule = engine.match({'text': '/t', 'from': '0x00000001'})
+        self.assertEqual(engine.render_reply(rule, {'from': '0x00000001'}), "{ok} 0x00000001")
+
+    def test_filter_inline_flags(self):
+        message_filter = MessageFilter({"regex": "(?i)allarme"})
+        self.assertTrue(message_filter.matches({"text": "ALLARME fumo"}))
+        self.assertFalse(message_filter.matches({"text": "tutto ok"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
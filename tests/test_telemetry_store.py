@@ -0,0 +1,103 @@
+"""
+Test dello storico di telemetria: aggregazione per minuto e quarto d'ora,
+scelta della risoluzione, limite di nodi e allarmi sulle soglie.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from telemetry_store import TelemetryStore, parse_alert_rules
+
+# Inizio di un quarto d'ora (timestamp=0 vorrebbe dire "adesso")
+BASE = 1_700_000_100 // 900 * 900
+
+
+class _Config:
+    TELEMETRY_ENABLED = True
+    TELEMETRY_RAW_SAMPLES = 5
+    TELEMETRY_1M_SAMPLES = 30
+    TELEMETRY_15M_SAMPLES = 10
+    TELEMETRY_MAX_NODES = 2
+    TELEMETRY_ALERTS = 'battery_level<20'
+    TELEMETRY_ALERT_COOLDOWN = 600
+
+
+class DownsamplingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TelemetryStore(_Config())
+
+    def test_minute_buckets(self):
+        for second, battery in ((0, 80), (20, 70), (40, 90), (60, 50)):
+            self.store.record('0x1', {'battery_level': battery}, timestamp=BASE + second)
+        resolution, buckets = self.store.query('0x1', BASE, BASE + 120, '1m')
+        self.assertEqual(resolution, '1m')
+        self.assertEqual([bucket['ts'] for bucket in buckets], [BASE, BASE + 60])
+        self.assertEqual(buckets[0]['count'], 3)
+        self.assertEqual(buckets[0]['battery_level'], {"avg": 80.0, "min": 70, "max": 90})
+        self.assertEqual(buckets[1]['battery_level']['avg'], 50.0)
+
+    def test_auto_resolution_follows_retained_samples(self):
+        for index in range(5):
+            self.store.record('0x1', {'voltage': 4.0}, timestamp=BASE + index * 10)
+        self.assertEqual(self.store.query('0x1', BASE, BASE + 60)[0], 'raw')
+        # Il buffer raw (5 campioni) ha scartato i più vecchi: si passa ai minuti
+        for index in range(5, 20):
+            self.store.record('0x1', {'voltage': 4.0}, timestamp=BASE + index * 10)
+        resolution, samples = self.store.query('0x1', BASE, BASE + 200)
+        self.assertEqual(resolution, '1m')
+        self.assertEqual(sum(bucket['count'] for bucket in samples), 20)
+        self.assertEqual(self.store.query('0x1', BASE + 150, BASE + 200)[0], 'raw')
+
+    def test_position_keeps_last_value(self):
+        self.store.ingest_line("POSITION node=00000001 l=0 lat=451234567 lon=91234567 msl=120")
+        self.store.ingest_line("POSITION node=00000001 l=0 lat=451000000 lon=91000000 msl=100")
+        latest = self.store.latest('0x00000001')
+        self.assertEqual((latest['lat'], latest['lon'], latest['alt']), (45.1, 9.1, 100.0))
+
+    def test_least_recent_node_is_evicted(self):
+        for node in ('0x1', '0x2', '0x1', '0x3'):
+            self.store.record(node, {'voltage': 4.0}, timestamp=BASE)
+        self.assertIsNotNone(self.store.latest('0x1'))
+        self.assertIsNone(self.store.latest('0x2'))
+        self.assertEqual(self.store.get_status()['evictions'], 1)
+
+
+class AlertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TelemetryStore(_Config())
+
+    def battery(self, value, offset):
+        return self.store.record('0x1', {'battery_level': value}, timestamp=BASE + offset)
+
+    def test_alert_fires_on_crossing_then_cooldown(self):
+        self.assertEqual(self.battery(50, 0), [])
+        alerts = self.battery(15, 10)
+        self.assertEqual([(a['from'], a['rule'], a['value']) for a in alerts],
+                         [('0x00000001', 'battery_level<20', 15)])
+        self.assertEqual(self.battery(10, 20), [])   # ancora oltre soglia
+        self.assertEqual(self.battery(50, 30), [])
+        self.assertEqual(self.battery(12, 40), [])   # cooldown
+        self.assertEqual(len(self.battery(12, 700)), 1)
+
+    def test_failed_alert_is_rearmed(self):
+        alert = self.battery(15, 0)[0]
+        self.store.alert_failed(alert)
+        self.assertEqual(len(self.battery(14, 10)), 1)
+
+    def test_rule_parsing(self):
+        rules = parse_alert_rules(" battery_level <= 20 , voltage>3.3,")
+        self.assertEqual([rule.text for rule in rules], ['battery_level<=20', 'voltage>3.3'])
+        for bad in ('battery=20', 'temperature<5', 'voltage<x'):
+            with self.assertRaises(ValueError):
+                parse_alert_rules(bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
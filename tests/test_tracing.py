@@ -0,0 +1,51 @@
+"""
+Test del tracing: la risposta di n8n trova la traccia del messaggio anche
+se indica il nodo in un altro formato (0x..., !..., decimale).
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tracing import Tracer, REPLY_RECEIVED
+
+
+class _Config:
+    TRACE_ENABLED = True
+    TRACE_PENDING_TIMEOUT = 300
+    TRACE_BUFFER_SIZE = 10
+
+
+def inbound(message_id, sender='0x0000abcd'):
+    return {'from': sender, 'message_id': message_id, 'gateway': 'radio0'}
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer(_Config())
+
+    def test_reply_claims_trace_whatever_the_node_format(self):
+        for message_id in ('0x1', '0x2', '0x3'):
+            self.tracer.begin(inbound(message_id), time.monotonic())
+        claimed = [self.tracer.claim_reply(to_node) for to_node in ('!0000abcd', '43981', 0xabcd)]
+        self.assertEqual([trace.message_id for trace in claimed], ['0x1', '0x2', '0x3'])
+        self.assertEqual(claimed[0].stages[-1][0], REPLY_RECEIVED)
+        self.assertIsNone(self.tracer.claim_reply('0x0000abcd'))
+        self.assertEqual(self.tracer.get_status()['pending'], 0)
+
+    def test_finish_and_recent_normalize_the_node(self):
+        self.tracer.begin(inbound('0x1'), time.monotonic())
+        self.tracer.finish(inbound('0x1', sender='!0000abcd'), 'local')
+        self.assertEqual(self.tracer.get_status()['pending'], 0)
+        self.assertEqual([trace['outcome'] for trace in self.tracer.recent(node='43981')], ['local'])
+        self.assertEqual(self.tracer.recent(node='0x00000001'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
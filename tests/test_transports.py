@@ -0,0 +1,91 @@
+"""
+Test del transport TCP: frame protobuf (0x94 0xC3 + lunghezza) mescolati
+al testo di debug e spezzati tra più letture.
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from transports import TCPTransport, _load_protobufs
+
+PROTOBUFS = _load_protobufs()
+
+
+def frame(from_radio):
+    data = from_radio.SerializeToString()
+    return bytes([0x94, 0xC3, len(data) >> 8, len(data) & 0xFF]) + data
+
+
+@unittest.skipIf(PROTOBUFS is None, "serve il pacchetto meshtastic")
+class TCPFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mesh_pb2, self.portnums_pb2, _ = PROTOBUFS
+        self.transport = TCPTransport('127.0.0.1', 4403, 1)
+        self.transport._pb = PROTOBUFS
+
+    def text_packet(self, sender, packet_id, text):
+        from_radio = self.mesh_pb2.FromRadio()
+        packet = from_radio.packet
+        setattr(packet, 'from', sender)
+        packet.to = 0xFFFFFFFF
+        packet.id = packet_id
+        packet.decoded.portnum = self.portnums_pb2.PortNum.TEXT_MESSAGE_APP
+        packet.decoded.payload = text.encode('utf-8')
+        return frame(from_radio)
+
+    def lines(self):
+        lines, self.transport._lines = self.transport._lines, []
+        return [line.decode('utf-8') for line in lines]
+
+    def test_frame_split_across_reads(self):
+        data = self.text_packet(0x433df694, 0x10, "ciao mesh")
+        for index in range(len(data)):
+            self.transport._feed(data[index:index + 1])
+        lines = self.lines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1], "Received text msg from=0x433df694, id=0x00000010, msg=ciao mesh\n")
+        self.assertEqual(self.transport._frame, b"")
+
+    def test_debug_text_between_frames(self):
+        data = (b"DEBUG | boot\n" + self.text_packet(1, 2, "uno")
+                + b"INFO | radio\n" + self.text_packet(3, 4, "due"))
+        self.transport._feed(data)
+        lines = self.lines()
+        self.assertEqual(lines[0], "DEBUG | boot\n")
+        self.assertIn("msg=uno\n", lines[2])
+        self.assertEqual(lines[3], "INFO | radio\n")
+        self.assertIn("msg=due\n", lines[5])
+
+    def test_false_start_and_oversized_length_are_text(self):
+        # 0x94 senza 0xC3, poi un'intestazione con lunghezza oltre MAX_FRAME
+        self.transport._feed(b"\x94x\n" + bytes([0x94, 0xC3, 0xFF, 0xFF]) + b"\n" + self.text_packet(5, 6, "ok"))
+        lines = self.transport._lines
+        self.assertEqual(lines[0], b"\x94x\n")
+        self.assertEqual(lines[1], bytes([0x94, 0xC3, 0xFF, 0xFF]) + b"\n")
+        self.assertIn(b"msg=ok\n", lines[-1])
+
+    def test_send_text_writes_one_frame(self):
+        self.transport.sock, peer = socket.socketpair()
+        try:
+            self.transport.send_text(0x433df694, "risposta")
+            data = peer.recv(4096)
+        finally:
+            self.transport.close()
+            peer.close()
+        self.assertEqual(data[:2], b"\x94\xc3")
+        self.assertEqual((data[2] << 8) | data[3], len(data) - 4)
+        to_radio = self.mesh_pb2.ToRadio()
+        to_radio.ParseFromString(data[4:])
+        self.assertEqual(to_radio.packet.to, 0x433df694)
+        self.assertEqual(to_radio.packet.decoded.payload, "risposta".encode('utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
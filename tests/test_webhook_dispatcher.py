@@ -0,0 +1,146 @@
+"""
+Test del dispatcher webhook: conteggio delle chiamate in corso anche con
+errori imprevisti (il drenaggio all'arresto attende che scenda a zero).
+
+Esecuzione: python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from webhook_dispatcher import WebhookDispatcher, AsyncWebhookDispatcher, WebhookTarget, ALERT_QUEUE_SIZE
+
+
+class _Config:
+    BRIDGE_RUNTIME = 'threads'
+    WEBHOOK_CONCURRENCY = 1
+    WEBHOOK_MAX_IN_FLIGHT = 4
+    HTTP_TIMEOUT = 1
+    WEBHOOK_RETRIES = 0
+    WEBHOOK_RETRY_BACKOFF = 0
+    WEBHOOK_QUEUE_SIZE = 10
+
+
+class _Tracer:
+    def mark(self, *args):
+        pass
+
+    def finish(self, *args):
+        pass
+
+
+class _Telemetry:
+    def __init__(self):
+        self.failed = []
+
+    def alert_failed(self, alert):
+        self.failed.append(alert)
+
+
+class _Handler:
+    def __init__(self, targets):
+        self.webhook_targets = targets
+        self.tracer = _Tracer()
+        self.telemetry = _Telemetry()
+        self.errors = []
+        self.alerts = []
+
+    def send_alert(self, alert):
+        self.alerts.append(alert)
+
+    def prepare_webhook_call(self, message_data):
+        return dict(message_data)
+
+    def expect_reply(self, message_data):
+        pass
+
+    def report_webhook_result(self, message_data, status_code, response_text=''):
+        pass
+
+    def report_webhook_error(self, message_data, target_name, error):
+        self.errors.append(error)
+
+
+class _BrokenSession:
+    def post(self, *args, **kwargs):
+        raise ValueError("risposta non decodificabile")
+
+    def close(self):
+        pass
+
+
+class _BrokenPool:
+    async def post_json(self, *args):
+        raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'byte non valido')
+
+    def close(self):
+        pass
+
+
+def _target():
+    return WebhookTarget({"name": "ai", "url": "http://127.0.0.1:9/hook", "primary": True}, _Config())
+
+
+class InFlightTest(unittest.TestCase):
+
+    def test_thread_worker_survives_unexpected_error(self):
+        target = _target()
+        handler = _Handler([target])
+        dispatcher = WebhookDispatcher(handler)
+        dispatcher.start()
+        dispatcher.sessions["ai"] = _BrokenSession()
+        for text in ("uno", "due"):
+            dispatcher.dispatch({"from": "0x00000001", "text": text})
+        deadline = time.monotonic() + 2
+        while dispatcher.busy() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(dispatcher.busy(), 0)
+        self.assertEqual(target.failed, 2)
+        self.assertEqual(len(handler.errors), 2)
+        self.assertTrue(all(thread.is_alive() for thread in dispatcher.threads))
+        dispatcher.stop()
+
+    def test_async_send_completes_on_unexpected_error(self):
+        target = _target()
+        handler = _Handler([target])
+
+        async def run():
+            pending = set()
+            dispatcher = AsyncWebhookDispatcher(handler, pending)
+            dispatcher.start()
+            dispatcher.pools["ai"] = _BrokenPool()
+            dispatcher.dispatch({"from": "0x00000001", "text": "uno"})
+            await asyncio.wait(list(pending), timeout=1)
+            return dispatcher.busy()
+
+        self.assertEqual(asyncio.run(run()), 0)
+        self.assertEqual(target.failed, 1)
+        self.assertIn("UnicodeDecodeError", handler.errors[0])
+
+
+class AlertQueueTest(unittest.TestCase):
+
+    def test_alerts_share_one_bounded_worker(self):
+        handler = _Handler([_target()])
+        dispatcher = WebhookDispatcher(handler)
+        alerts = [{"from": "0x00000001", "rule": "battery_level<20", "n": n}
+                  for n in range(ALERT_QUEUE_SIZE + 1)]
+        # Worker non ancora avviato: l'ultimo allarme trova la coda piena
+        for alert in alerts:
+            dispatcher.dispatch_alert(alert)
+        self.assertEqual(handler.telemetry.failed, alerts[-1:])
+        self.assertEqual(dispatcher.busy(), ALERT_QUEUE_SIZE)
+        dispatcher.start()
+        dispatcher.stop(timeout=2)
+        self.assertEqual(handler.alerts, alerts[:-1])
+        self.assertEqual(dispatcher.busy(), 0)
+        self.assertEqual(len([t for t in dispatcher.threads if t.name == "webhook-alerts"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()